@@ -1,6 +1,7 @@
 # coding=utf-8
-import argparse, collections, difflib, enum, hashlib, operator, os, stat
-import struct, sys, time, urllib.request, zlib
+import argparse, array, base64, bisect, collections, concurrent.futures, configparser, ctypes
+import enum, hashlib, heapq, http.client, itertools, mmap, operator, os, re, shutil, socket
+import socketserver, stat, struct, subprocess, sys, tempfile, threading, time, urllib.parse, zlib
 
 # git索引中的一个条目的数据(. git /索引)
 IndexEntry = collections.namedtuple('IndexEntry', [
@@ -8,13 +9,32 @@ IndexEntry = collections.namedtuple('IndexEntry', [
     'gid', 'size', 'sha1', 'flags', 'path',
 ])
 
+# 解析后的提交对象，parents是sha - 1(十六进制字符串)的元组
+Commit = collections.namedtuple('Commit', [
+    'tree', 'parents', 'author', 'committer', 'commit_time', 'message',
+])
+
+# 提交图中一个提交的数据，不在提交图中的提交generation为None
+CommitNode = collections.namedtuple('CommitNode', [
+    'tree', 'parents', 'commit_time', 'generation',
+])
+
+# diff --stat中一个文件的统计，二进制文件的insertions和deletions为None
+DiffStat = collections.namedtuple('DiffStat', [
+    'path', 'insertions', 'deletions', 'old_size', 'new_size',
+])
+
 class ObjectType(enum.Enum):
     """对象类型的枚举。还有其他类型的，但是我们不需要它们。
     在git的源代码中看到“enum object_type”(git / cache.h)。
+    ofs_delta和ref_delta只出现在包文件中；tag对象只可能来自fetch。
     """
     commit = 1
     tree = 2
     blob = 3
+    tag = 4
+    ofs_delta = 6
+    ref_delta = 7
 
 def read_file(path):
     """在给定路径上读取文件的内容作为字节。"""
@@ -30,14 +50,14 @@ def init(repo):
     """创建仓库目录，初始化.git目录"""
     os.mkdir(repo)
     os.mkdir(os.path.join(repo,'.git'))
-    for name in ['object','refs','refs/heads']:
-        os.mkdir(os.path.join(repo,'.git','HEAD'))
-    write_file(os.path.join(repo,'.git','HEAD'),b'ref:refs/heads/master')
+    for name in ['objects','refs','refs/heads','refs/tags']:
+        os.mkdir(os.path.join(repo,'.git',name))
+    write_file(os.path.join(repo,'.git','HEAD'),b'ref: refs/heads/master')
     print('initialized empty repository:{}'.format(repo))
 
 def hash_object(data,obj_type,write=True):
     """根据对象类型计算对象的散列值，如果write是真的话，则保存到文件中。
-    以十六进制字符串的形式返回SHA-1散列
+    以十六进制字符串的形式返回SHA-1散列。压缩级别见object_compression_level。
     """
     header = '{} {}'.format(obj_type,len(data)).encode()
     full_data = header + b'\x00' + data
@@ -46,9 +66,66 @@ def hash_object(data,obj_type,write=True):
         path = os.path.join('.git','objects',sha1[:2],sha1[2:])
         if not os.path.exists(path):
             os.makedirs(os.path.dirname(path),exist_ok=True)
-            write_file(path,zlib.compress(full_data))
+            write_file_atomic(path,zlib.compress(full_data,object_compression_level(data)))
+            forget_object_dir(os.path.dirname(path))
     return sha1
 
+def write_file_atomic(path,data,prefix='tmp_obj_'):
+    """先写到同一目录下的临时文件，再重命名到给定路径，
+    这样并发写同一个对象时不会读到写了一半的文件。
+    """
+    fd,tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),prefix=prefix)
+    try:
+        with os.fdopen(fd,'wb') as f:
+            f.write(data)
+        os.replace(tmp_path,path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def hash_files(paths,write=True,jobs=1):
+    """计算给定文件(作为blob)的sha - 1散列，返回和paths顺序相同的列表。
+    jobs大于1时用线程池并发读取、散列和压缩文件(hashlib和zlib在处理
+    大块数据时会释放GIL)。
+    """
+    def hash_path(path):
+        return hash_object_file(path,'blob',write=write)
+    if jobs <= 1 or len(paths) <= 1:
+        return [hash_path(p) for p in paths]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(hash_path,paths))
+
+_listing_cache = {}
+
+
+def list_object_dir(obj_dir):
+    """返回对象目录(.git/objects/xx)中的文件名集合。结果按目录的修改时间
+    缓存，不存在的目录也会被缓存(直到.git/objects本身被修改)。
+    和索引一样，修改时间离现在不到一秒的目录不缓存(racy)。
+    """
+    key = os.path.abspath(obj_dir)
+    try:
+        mtime = os.stat(obj_dir).st_mtime_ns
+    except FileNotFoundError:
+        mtime = ('missing', os.stat(os.path.dirname(obj_dir)).st_mtime_ns)
+    cached = _listing_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if isinstance(mtime, tuple):
+        names = frozenset()
+    else:
+        names = frozenset(os.listdir(obj_dir))
+    mtime_ns = mtime[1] if isinstance(mtime, tuple) else mtime
+    if mtime_ns < time.time_ns() - 1000000000:
+        _listing_cache[key] = (mtime, names)
+    return names
+
+
+def forget_object_dir(obj_dir):
+    """写入新对象后丢弃对象目录的缓存列表。"""
+    _listing_cache.pop(os.path.abspath(obj_dir), None)
+
+
 def find_object(sha1_prefix):
     """在对象存储中找到给定的sha - 1前缀和返回路径到对象的对象，
     或者在没有对象或多个对象的前缀时提高ValueError。
@@ -57,7 +134,11 @@ def find_object(sha1_prefix):
         raise ValueError('散列前缀必须是两个或多个字符')
     obj_dir = os.path.join('.git','objects',sha1_prefix[:2])
     rest = sha1_prefix[2:]
-    objects = [name for name in os.listdir(obj_dir) if name.startswith(rest)]
+    names = list_object_dir(obj_dir)
+    if len(sha1_prefix) == 40:
+        objects = [rest] if rest in names else []
+    else:
+        objects = [name for name in names if name.startswith(rest)]
     if not objects:
         raise ValueError('object {!r} not found'.format(sha1_prefix))
     if len(objects)>=2:
@@ -65,407 +146,5016 @@ def find_object(sha1_prefix):
             len(objects),sha1_prefix))
     return os.path.join(obj_dir,objects[0])
 
-def read_object(sha1_prefix):
-    """Read object with given SHA-1 prefix and return tuple of
-    (object_type, data_bytes), or raise ValueError if not found.
+
+class ObjectCache:
+    """按字节数限制大小的LRU缓存，保存解压后的对象(object_type, data_bytes)。
+    大于总预算四分之一的对象不缓存。hits/misses记录命中和未命中次数。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = len(value[1])
+        if size > self.max_bytes // 4:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = value
+            self.total_bytes += size
+            self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, (_, data) = self.entries.popitem(last=False)
+            self.total_bytes -= len(data)
+
+    def resize(self, max_bytes):
+        """修改缓存的字节预算，超出的部分立即淘汰。"""
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self.hits = self.misses = 0
+
+
+OBJECT_CACHE_BYTES = 64 * 1024 * 1024
+object_cache = ObjectCache(OBJECT_CACHE_BYTES)
+
+
+class PackFile:
+    """一个包文件(.pack)和它的v2索引(.idx)，两者都是内存映射的。
+    在索引中通过扇出表和二分查找定位对象，参见git的
+    Documentation/technical/pack-format.txt。
+    """
+
+    def __init__(self, idx_path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-4] + '.pack'
+        with open(idx_path, 'rb') as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.pack_path, 'rb') as f:
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version = struct.unpack_from('!4sL', self.idx, 0)
+        assert signature == b'\xfftOc' and version == 2, \
+            'unsupported pack index {}'.format(idx_path)
+        self.fanout = struct.unpack_from('!256L', self.idx, 8)
+        self.num_objects = self.fanout[255]
+        self.sha1_start = 8 + 256 * 4
+        self.crc_start = self.sha1_start + 20 * self.num_objects
+        self.offset_start = self.crc_start + 4 * self.num_objects
+        self.large_offset_start = self.offset_start + 4 * self.num_objects
+        self.bitmap_path = idx_path[:-4] + '.bitmap'
+        self.bitmap = None
+
+    def close(self):
+        self.idx.close()
+        self.pack.close()
+        if self.bitmap is not None:
+            self.bitmap.close()
+
+    def sha1_at(self, i):
+        """返回索引中第i个对象的sha - 1(20字节)。"""
+        start = self.sha1_start + 20 * i
+        return self.idx[start:start + 20]
+
+    def offset_at(self, i):
+        """返回索引中第i个对象在包文件中的偏移量。"""
+        offset, = struct.unpack_from('!L', self.idx, self.offset_start + 4 * i)
+        if offset & 0x80000000:
+            large_index = offset & 0x7fffffff
+            offset, = struct.unpack_from(
+                '!Q', self.idx, self.large_offset_start + 8 * large_index)
+        return offset
+
+    def pack_order(self):
+        """返回按包文件中的偏移量排序的对象在索引中的位置列表。"""
+        offsets = list(struct.unpack_from('!{}L'.format(self.num_objects), self.idx,
+                                          self.offset_start))
+        for i, offset in enumerate(offsets):
+            if offset & 0x80000000:
+                offsets[i] = self.offset_at(i)
+        return sorted(range(self.num_objects), key=offsets.__getitem__)
+
+    def lower_bound(self, digest):
+        """返回第一个sha - 1不小于digest的对象在索引中的位置。"""
+        first = digest[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sha1_at(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, sha1_prefix):
+        """返回这个包中以给定前缀开头的所有对象的sha - 1(十六进制字符串)列表。"""
+        low = bytes.fromhex(sha1_prefix.ljust(40, '0')[:40])
+        matches = []
+        i = self.lower_bound(low)
+        while i < self.num_objects:
+            sha1 = self.sha1_at(i).hex()
+            if not sha1.startswith(sha1_prefix):
+                break
+            matches.append(sha1)
+            i += 1
+        return matches
+
+    def index_of(self, sha1):
+        """返回给定sha - 1(十六进制字符串)在索引中的位置，如果不存在返回None。"""
+        digest = bytes.fromhex(sha1)
+        i = self.lower_bound(digest)
+        if i < self.num_objects and self.sha1_at(i) == digest:
+            return i
+        return None
+
+    def read(self, sha1):
+        """读取包中给定sha - 1的对象，返回tuple(object_type, data_bytes)。"""
+        i = self.index_of(sha1)
+        if i is None:
+            raise ValueError('object {!r} not found'.format(sha1))
+        type_num, data = self.read_at(self.offset_at(i))
+        return (ObjectType(type_num).name, data)
+
+    def stream(self, sha1, chunk_size=65536):
+        """流式读取包中给定sha - 1的对象，返回tuple(object_type, size, chunks)。
+        非增量对象直接从内存映射中逐块解压，增量对象先整个还原。
+        """
+        i = self.index_of(sha1)
+        if i is None:
+            raise ValueError('object {!r} not found'.format(sha1))
+        offset = self.offset_at(i)
+        type_num, size, data_offset = decode_pack_header(self.pack, offset)
+        if type_num in (ObjectType.ofs_delta.value, ObjectType.ref_delta.value):
+            type_num, data = self.read_at(offset)
+            return (ObjectType(type_num).name, len(data),
+                    (chunk for chunk in [data]))
+        return (ObjectType(type_num).name, size,
+                iter_inflate(self.pack, data_offset, size, chunk_size))
+
+    def info(self, sha1):
+        """返回包中给定sha - 1的对象的tuple(object_type, size)。只解码对象头，
+        增量对象的大小是增量数据开头的目标大小(只解压开头几个字节)，
+        类型是增量链最后的基础对象的类型。
+        """
+        i = self.index_of(sha1)
+        if i is None:
+            raise ValueError('object {!r} not found'.format(sha1))
+        offset = self.offset_at(i)
+        size = None
+        while True:
+            type_num, obj_size, data_offset = decode_pack_header(self.pack, offset)
+            if type_num == ObjectType.ofs_delta.value:
+                distance, data_offset = decode_ofs_offset(self.pack, data_offset)
+                if size is None:
+                    size = delta_target_size(self.pack, data_offset)
+                offset -= distance
+            elif type_num == ObjectType.ref_delta.value:
+                base_sha1 = self.pack[data_offset:data_offset + 20].hex()
+                if size is None:
+                    size = delta_target_size(self.pack, data_offset + 20)
+                i = self.index_of(base_sha1)
+                if i is None:
+                    return (object_info(base_sha1)[1], size)
+                offset = self.offset_at(i)
+            else:
+                return (ObjectType(type_num).name, obj_size if size is None else size)
+
+    def read_at(self, offset, cache=None):
+        """读取包文件中给定偏移量的对象，返回tuple(type_num, data_bytes)。
+        沿着OFS_DELTA/REF_DELTA链找到基础对象，然后依次应用增量。
+        cache(以偏移量为键的ObjectCache)不为None时，链上已经缓存的对象直接使用，
+        读到的对象也放进缓存。
+        """
+        start = offset
+        delta_offsets = []
+        while True:
+            cached = cache.get(offset) if cache is not None else None
+            if cached is not None:
+                type_num, data = cached
+                break
+            type_num, size, data_offset = decode_pack_header(self.pack, offset)
+            if type_num == ObjectType.ofs_delta.value:
+                distance, data_offset = decode_ofs_offset(self.pack, data_offset)
+                delta_offsets.append((data_offset, size))
+                offset -= distance
+            elif type_num == ObjectType.ref_delta.value:
+                base_sha1 = self.pack[data_offset:data_offset + 20].hex()
+                delta_offsets.append((data_offset + 20, size))
+                i = self.index_of(base_sha1)
+                if i is None:
+                    obj_type, data = read_object(base_sha1)
+                    type_num = ObjectType[obj_type].value
+                    break
+                offset = self.offset_at(i)
+            else:
+                data, _ = inflate_at(self.pack, data_offset)
+                assert size == len(data), 'expected size {},got {} bytes'.format(
+                    size, len(data))
+                break
+        for data_offset, size in reversed(delta_offsets):
+            delta, _ = inflate_at(self.pack, data_offset)
+            assert size == len(delta), 'expected delta size {},got {} bytes'.format(
+                size, len(delta))
+            data = apply_delta(data, delta)
+        if cache is not None:
+            cache.put(start, (type_num, data))
+        return (type_num, data)
+
+
+def decode_pack_header(buf, offset):
+    """解码包文件中给定偏移量的对象头，返回tuple(type_num, size, data_offset)。
+    """
+    byte = buf[offset]
+    offset += 1
+    type_num = (byte >> 4) & 7
+    size = byte & 0x0f
+    shift = 4
+    while byte & 0x80:
+        byte = buf[offset]
+        offset += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+    return (type_num, size, offset)
+
+
+def inflate_at(buf, offset, chunk_size=65536):
+    """从buf的给定偏移量开始解压一个zlib流，返回tuple(data_bytes, end_offset)。
+    """
+    decompressor = zlib.decompressobj()
+    chunks = []
+    while not decompressor.eof:
+        chunk = buf[offset:offset + chunk_size]
+        if not chunk:
+            raise ValueError('truncated zlib stream')
+        chunks.append(decompressor.decompress(chunk))
+        offset += len(chunk)
+    offset -= len(decompressor.unused_data)
+    return (b''.join(chunks), offset)
+
+
+def decode_ofs_offset(buf, offset):
+    """解码OFS_DELTA对象的基础对象距离，返回tuple(distance, data_offset)。"""
+    byte = buf[offset]
+    offset += 1
+    distance = byte & 0x7f
+    while byte & 0x80:
+        byte = buf[offset]
+        offset += 1
+        distance = ((distance + 1) << 7) | (byte & 0x7f)
+    return (distance, offset)
+
+
+def encode_ofs_offset(distance):
+    """编码OFS_DELTA对象到基础对象的距离(decode_ofs_offset的逆操作)。"""
+    result = [distance & 0x7f]
+    distance >>= 7
+    while distance:
+        distance -= 1
+        result.append(0x80 | (distance & 0x7f))
+        distance >>= 7
+    return bytes(reversed(result))
+
+
+def encode_delta_size(size):
+    """编码增量数据开头的源/目标大小(小端的7位变长整数)。"""
+    result = []
+    while True:
+        byte = size & 0x7f
+        size >>= 7
+        if size:
+            result.append(byte | 0x80)
+        else:
+            result.append(byte)
+            return bytes(result)
+
+
+def decode_delta_size(delta, i):
+    """解码增量数据中位置i的大小，返回tuple(size, next_i)。"""
+    size = 0
+    shift = 0
+    while True:
+        byte = delta[i]
+        i += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (size, i)
+
+
+def delta_target_size(buf, offset):
+    """返回buf中给定偏移量的(压缩的)增量数据的目标对象大小，只解压开头的两个大小。"""
+    decompressor = zlib.decompressobj()
+    data = b''
+    while len(data) < 20 and not decompressor.eof:
+        chunk = decompressor.unconsumed_tail or buf[offset:offset + 64]
+        if not decompressor.unconsumed_tail:
+            if not chunk:
+                raise ValueError('truncated zlib stream')
+            offset += len(chunk)
+        data += decompressor.decompress(chunk, 20 - len(data))
+    _, i = decode_delta_size(data, 0)
+    return decode_delta_size(data, i)[0]
+
+
+def apply_delta(base, delta):
+    """把git增量数据应用到基础对象数据上，返回目标对象数据。"""
+    base_size, i = decode_delta_size(delta, 0)
+    assert base_size == len(base), 'expected base size {},got {} bytes'.format(
+        base_size, len(base))
+    target_size, i = decode_delta_size(delta, i)
+    result = bytearray()
+    while i < len(delta):
+        cmd = delta[i]
+        i += 1
+        if cmd & 0x80:
+            offset = 0
+            for shift in range(4):
+                if cmd & (1 << shift):
+                    offset |= delta[i] << (8 * shift)
+                    i += 1
+            size = 0
+            for shift in range(3):
+                if cmd & (0x10 << shift):
+                    size |= delta[i] << (8 * shift)
+                    i += 1
+            if size == 0:
+                size = 0x10000
+            result += base[offset:offset + size]
+        elif cmd:
+            result += delta[i:i + cmd]
+            i += cmd
+        else:
+            raise ValueError('invalid delta opcode 0')
+    assert target_size == len(result), 'expected size {},got {} bytes'.format(
+        target_size, len(result))
+    return bytes(result)
+
+
+DELTA_BLOCK_SIZE = 16
+
+
+def build_delta_index(base):
+    """为基础对象数据建立块索引(每DELTA_BLOCK_SIZE字节一个块 -> 偏移量)。"""
+    index = {}
+    for i in range(len(base) - DELTA_BLOCK_SIZE, -1, -DELTA_BLOCK_SIZE):
+        index[base[i:i + DELTA_BLOCK_SIZE]] = i
+    return index
+
+
+def _match_length(base, base_offset, target, target_offset):
+    """返回base和target从给定偏移量开始相同的字节数。"""
+    limit = min(len(base) - base_offset, len(target) - target_offset)
+    length = 0
+    step = 4096
+    while step:
+        while length + step <= limit and \
+                base[base_offset + length:base_offset + length + step] == \
+                target[target_offset + length:target_offset + length + step]:
+            length += step
+        step //= 2
+    return length
+
+
+def _encode_copy(offset, size):
+    """编码一个从基础对象复制的增量指令。"""
+    cmd = 0x80
+    args = []
+    for shift in range(4):
+        byte = (offset >> (8 * shift)) & 0xff
+        if byte:
+            cmd |= 1 << shift
+            args.append(byte)
+    for shift in range(3):
+        byte = (size >> (8 * shift)) & 0xff
+        if byte:
+            cmd |= 0x10 << shift
+            args.append(byte)
+    return bytes([cmd] + args)
+
+
+def create_delta(base, target, index=None, max_size=None):
+    """计算把base变成target的git增量数据。如果增量超过max_size字节，返回None。
+    index是build_delta_index(base)的结果，可以在多个目标之间复用。
+    """
+    if index is None:
+        index = build_delta_index(base)
+    result = [encode_delta_size(len(base)), encode_delta_size(len(target))]
+    result_size = len(result[0]) + len(result[1])
+    insert_start = 0
+    i = 0
+    end = len(target) - DELTA_BLOCK_SIZE
+    while i <= end:
+        base_offset = index.get(target[i:i + DELTA_BLOCK_SIZE])
+        if base_offset is None:
+            i += 1
+            if max_size is not None and \
+                    result_size + (i - insert_start) * 128 // 127 > max_size:
+                return None
+            continue
+        while i > insert_start and base_offset > 0 and \
+                target[i - 1] == base[base_offset - 1]:
+            i -= 1
+            base_offset -= 1
+        length = _match_length(base, base_offset, target, i)
+        for start in range(insert_start, i, 127):
+            chunk = target[start:min(start + 127, i)]
+            result.append(bytes([len(chunk)]) + chunk)
+            result_size += 1 + len(chunk)
+        for start in range(0, length, 0x10000):
+            copy = _encode_copy(base_offset + start, min(0x10000, length - start))
+            result.append(copy)
+            result_size += len(copy)
+        i += length
+        insert_start = i
+        if max_size is not None and result_size > max_size:
+            return None
+    for start in range(insert_start, len(target), 127):
+        chunk = target[start:start + 127]
+        result.append(bytes([len(chunk)]) + chunk)
+        result_size += 1 + len(chunk)
+    if max_size is not None and result_size > max_size:
+        return None
+    return b''.join(result)
+
+
+def iter_inflate(buf, offset, size, chunk_size=65536):
+    """从buf的给定偏移量开始逐块解压一个zlib流，最后检查解压后的大小。"""
+    decompressor = zlib.decompressobj()
+    total = 0
+    while not decompressor.eof:
+        chunk = decompressor.unconsumed_tail or buf[offset:offset + chunk_size]
+        if not decompressor.unconsumed_tail:
+            if not chunk:
+                raise ValueError('truncated zlib stream')
+            offset += len(chunk)
+        data = decompressor.decompress(chunk, chunk_size)
+        total += len(data)
+        if data:
+            yield data
+    assert size == total, 'expected size {},got {} bytes'.format(size, total)
+
+
+_pack_cache = {}
+
+
+def get_packs():
+    """返回当前仓库中所有包文件的PackFile对象列表。
+    包目录没有变化时复用已经打开的内存映射。
+    """
+    pack_dir = os.path.abspath(os.path.join('.git', 'objects', 'pack'))
+    try:
+        mtime = os.stat(pack_dir).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    cached = _pack_cache.get(pack_dir)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    close_packs(pack_dir)
+    packs = [PackFile(os.path.join(pack_dir, name))
+             for name in sorted(os.listdir(pack_dir))
+             if name.endswith('.idx') and
+             os.path.exists(os.path.join(pack_dir, name[:-4] + '.pack'))]
+    _pack_cache[pack_dir] = (mtime, packs)
+    return packs
+
+
+def close_packs(pack_dir=None):
+    """关闭(给定包目录或全部)已打开的包文件映射。"""
+    dirs = [pack_dir] if pack_dir is not None else list(_pack_cache)
+    for d in dirs:
+        _, packs = _pack_cache.pop(d, (None, []))
+        for pack in packs:
+            pack.close()
+
+
+def find_packed_object(sha1_prefix):
+    """在包文件中查找给定sha - 1前缀的对象，返回tuple(pack, sha1)，
+    没有找到时返回None，前缀对应多个对象时抛出ValueError。
+    """
+    if len(sha1_prefix) == 40:
+        for pack in get_packs():
+            if pack.index_of(sha1_prefix) is not None:
+                return (pack, sha1_prefix)
+        return None
+    found = {}
+    for pack in get_packs():
+        for sha1 in pack.find(sha1_prefix):
+            found.setdefault(sha1, pack)
+    if len(found) >= 2:
+        raise ValueError('multiple objects({}) with prefix{!r}'.format(
+            len(found), sha1_prefix))
+    for sha1, pack in found.items():
+        return (pack, sha1)
+    return None
+
+
+def locate_object(sha1_prefix):
+    """查找给定sha - 1前缀的对象，返回tuple(pack, sha1)(对象在包文件中)
+    或tuple(None, path)(松散对象)，没有找到或前缀不唯一时抛出ValueError。
+    先在包文件中查找，然后是松散对象。
+    """
+    if len(sha1_prefix) < 2:
+        raise ValueError('散列前缀必须是两个或多个字符')
+    if len(sha1_prefix) > 40 or \
+            sha1_prefix.strip('0123456789abcdef') != '':
+        raise ValueError('object {!r} not found'.format(sha1_prefix))
+    packed = find_packed_object(sha1_prefix)
+    if packed is not None:
+        pack, sha1 = packed
+        if len(sha1_prefix) < 40:
+            try:
+                path = find_object(sha1_prefix)
+            except ValueError:
+                path = None
+            loose_sha1 = path and sha1_prefix[:2] + os.path.basename(path)
+            if loose_sha1 and loose_sha1 != sha1:
+                raise ValueError('multiple objects(2) with prefix{!r}'.format(
+                    sha1_prefix))
+        return (pack, sha1)
+    return (None, find_object(sha1_prefix))
+
+
+def resolve_sha1(sha1_prefix):
+    """返回给定sha - 1前缀对应的完整sha - 1(十六进制字符串)。"""
+    pack, location = locate_object(sha1_prefix)
+    if pack is not None:
+        return location
+    return sha1_prefix[:2] + os.path.basename(location)
+
+
+def object_info(sha1_prefix):
+    """返回给定sha - 1前缀的对象的tuple(sha1, object_type, size)，不读取整个对象：
+    包中的对象只解码对象头，松散对象只解压到头结束。
+    """
+    objects_dir = os.path.abspath(os.path.join('.git', 'objects'))
+    if len(sha1_prefix) == 40:
+        cached = object_cache.get((objects_dir, sha1_prefix))
+        if cached is not None:
+            return (sha1_prefix, cached[0], len(cached[1]))
+    pack, location = locate_object(sha1_prefix)
+    if pack is not None:
+        return (location,) + pack.info(location)
+    with open(location, 'rb') as f:
+        decompressor = zlib.decompressobj()
+        data = b''
+        while b'\x00' not in data:
+            chunk = decompressor.unconsumed_tail or f.read(64)
+            if not chunk:
+                raise ValueError('truncated object {!r}'.format(sha1_prefix))
+            data += decompressor.decompress(chunk, 64)
+    obj_type, size_str = data[:data.index(b'\x00')].decode().split()
+    return (sha1_prefix[:2] + os.path.basename(location), obj_type, int(size_str))
+
+
+def read_object(sha1_prefix):
+    """Read object with given SHA-1 prefix and return tuple of
+    (object_type, data_bytes), or raise ValueError if not found.
+    读出的对象保存在object_cache中，所有读路径共享。
+    """
+    objects_dir = os.path.abspath(os.path.join('.git', 'objects'))
+    if len(sha1_prefix) == 40:
+        cached = object_cache.get((objects_dir, sha1_prefix))
+        if cached is not None:
+            return cached
+    pack, location = locate_object(sha1_prefix)
+    if pack is not None:
+        sha1 = location
+        if len(sha1_prefix) < 40:
+            cached = object_cache.get((objects_dir, sha1))
+            if cached is not None:
+                return cached
+        obj = pack.read(sha1)
+        object_cache.put((objects_dir, sha1), obj)
+        return obj
+    sha1 = sha1_prefix[:2] + os.path.basename(location)
+    if len(sha1_prefix) < 40:
+        cached = object_cache.get((objects_dir, sha1))
+        if cached is not None:
+            return cached
+    full_data = zlib.decompress(read_file(location))
+    nul_index = full_data.index(b'\x00')
+    header = full_data[:nul_index]
+    obj_type,size_str = header.decode().split()
+    size = int(size_str)
+    data = full_data[nul_index + 1:]
+    assert size == len(data),'expected size {},got {} bytes'.format(
+        size,len(data))
+    object_cache.put((objects_dir, sha1), (obj_type, data))
+    return (obj_type,data)
+
+
+def stream_object(sha1_prefix, chunk_size=65536):
+    """流式读取给定sha - 1前缀的对象，返回tuple(object_type, size, chunks)，
+    chunks是逐块解压出的数据字节的迭代器，不会把整个对象放进内存。
+    (包文件中的增量对象需要先应用增量，所以只有一块。)
+    """
+    pack, location = locate_object(sha1_prefix)
+    if pack is not None:
+        return pack.stream(location, chunk_size)
+    f = open(location, 'rb')
+    try:
+        decompressor = zlib.decompressobj()
+        data = b''
+        while b'\x00' not in data:
+            chunk = decompressor.unconsumed_tail or f.read(chunk_size)
+            if not chunk:
+                raise ValueError('truncated object {!r}'.format(sha1_prefix))
+            data += decompressor.decompress(chunk, chunk_size)
+        header, _, data = data.partition(b'\x00')
+        obj_type, size_str = header.decode().split()
+    except BaseException:
+        f.close()
+        raise
+    size = int(size_str)
+    return (obj_type, size, _iter_loose_data(f, decompressor, data, size, chunk_size))
+
+
+def _iter_loose_data(f, decompressor, data, size, chunk_size):
+    """逐块返回松散对象剩下的解压数据，最后检查大小。"""
+    with f:
+        total = len(data)
+        if data:
+            yield data
+        while not decompressor.eof:
+            chunk = decompressor.unconsumed_tail or f.read(chunk_size)
+            if not chunk:
+                raise ValueError('truncated object {!r}'.format(f.name))
+            data = decompressor.decompress(chunk, chunk_size)
+            total += len(data)
+            if data:
+                yield data
+        assert size == total, 'expected size {},got {} bytes'.format(
+            size, total)
+
+
+def hash_object_file(path, obj_type='blob', write=True, chunk_size=65536):
+    """和hash_object一样，但是逐块读取给定路径的文件：每块数据同时送进sha1和
+    zlib压缩器，压缩结果写到临时文件，算出散列后再原子地重命名到对象存储，
+    所以内存占用和文件大小无关。对象头中的大小来自文件的stat数据。
+    压缩级别由第一块数据和文件的扩展名决定(见object_compression_level)。
+    """
+    size = os.stat(path).st_size
+    sha1 = hashlib.sha1()
+    header = '{} {}'.format(obj_type, size).encode() + b'\x00'
+    sha1.update(header)
+    tmp = None
+    if write:
+        objects_dir = os.path.join('.git', 'objects')
+        fd, tmp_path = tempfile.mkstemp(dir=objects_dir, prefix='tmp_obj_')
+        tmp = os.fdopen(fd, 'wb')
+    try:
+        total = 0
+        compressor = None
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if tmp is not None and compressor is None:
+                    compressor = zlib.compressobj(object_compression_level(chunk, path))
+                    tmp.write(compressor.compress(header))
+                if not chunk:
+                    break
+                total += len(chunk)
+                sha1.update(chunk)
+                if tmp is not None:
+                    tmp.write(compressor.compress(chunk))
+        if total != size:
+            raise ValueError('file {!r} changed size while hashing'.format(path))
+        hex_sha1 = sha1.hexdigest()
+        if tmp is not None:
+            tmp.write(compressor.flush())
+            tmp.close()
+            obj_path = os.path.join(objects_dir, hex_sha1[:2], hex_sha1[2:])
+            if os.path.exists(obj_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+                os.replace(tmp_path, obj_path)
+                forget_object_dir(os.path.dirname(obj_path))
+    except BaseException:
+        if tmp is not None:
+            tmp.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+    return hex_sha1
+
+
+def cat_file(mode,sha1_prefix):
+    """将给定的sha - 1前缀写入到stdout中。
+    如果模式是“commit”，“tree”或“blob”，打印原始数据字节的对象。
+    如果模式是“大小”，打印对象的大小。如果模式是' type '，打印对象的类型。
+    如果模式是“漂亮的”，打印一个漂亮的对象的版本。
+    commit/blob的数据逐块写出，不会整个读进内存。
+    """
+    obj_type,size,chunks = stream_object(sha1_prefix)
+    if mode in ['commit','tree','blob']:
+        if obj_type != mode:
+            chunks.close()
+            raise ValueError('expected object type {},got{}'.format(
+                mode,obj_type))
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+    elif mode == 'size':
+        chunks.close()
+        print(size)
+    elif mode == 'type':
+        chunks.close()
+        print(obj_type)
+    elif mode == 'pretty':
+        if obj_type in ['commit','blob']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+        elif obj_type == 'tree':
+            data = b''.join(chunks)
+            for mode,path,sha1 in read_tree(data=data):
+                type_str = 'tree' if stat.S_ISDIR(mode) else 'blob'
+                print('{:06o} {} {}\t{}'.format(mode,type_str,sha1,path))
+        else:
+            assert False,'unhandled object type {!r}'.format(obj_type)
+    else:
+        chunks.close()
+        raise ValueError('unexpected mode {!r}'.format(mode))
+
+BATCH_CACHE_SIZE = 1024 * 1024
+
+
+def cat_file_batch(lines, out, contents=True, buffer=False):
+    """对输入的每一行(对象名：sha - 1、前缀或引用名)输出"<sha1> <type> <size>"，
+    contents为True时接着输出对象数据和换行符(git cat-file --batch的格式)，
+    找不到的对象输出"<name> missing"。不大于BATCH_CACHE_SIZE的对象通过object_cache
+    读取，更大的对象逐块写出；buffer为False时每个响应后都刷新输出，
+    这样调用者可以交互地一问一答。
+    """
+    for line in lines:
+        name = line.rstrip(b'\r\n').decode()
+        try:
+            if len(name) != 40 or name.strip('0123456789abcdef'):
+                name = resolve_revision(name)
+            sha1, obj_type, size = object_info(name)
+        except ValueError:
+            out.write(line.rstrip(b'\r\n') + b' missing\n')
+        else:
+            out.write('{} {} {}\n'.format(sha1, obj_type, size).encode())
+            if contents:
+                if size <= BATCH_CACHE_SIZE:
+                    out.write(read_object(sha1)[1])
+                else:
+                    for chunk in stream_object(sha1)[2]:
+                        out.write(chunk)
+                out.write(b'\n')
+        if not buffer:
+            out.flush()
+
+
+def hash_object_batch(lines, out, obj_type='blob', write=True, buffer=False):
+    """对输入的每一行(文件路径)输出文件的sha - 1(git hash-object --stdin-paths)。"""
+    for line in lines:
+        path = os.fsdecode(line.rstrip(b'\r\n'))
+        out.write((hash_object_file(path, obj_type, write=write) + '\n').encode())
+        if not buffer:
+            out.flush()
+
+
+_config_cache = {}
+
+
+def read_config():
+    """读取仓库的配置文件(.git/config)，返回ConfigParser。文件内容没有变化时
+    复用上次解析的结果(调用者不能修改它)，所以每个对象查一次配置也不慢。
+    """
+    path = os.path.abspath(os.path.join('.git', 'config'))
+    try:
+        data = read_file(path)
+    except FileNotFoundError:
+        data = None
+    cached = _config_cache.get(path)
+    if cached is not None and cached[0] == data:
+        return cached[1]
+    parser = configparser.ConfigParser(strict=False, interpolation=None)
+    if data is not None:
+        parser.read_string(data.decode())
+    _config_cache[path] = (data, parser)
+    return parser
+
+
+def get_config(section, key, default=None):
+    """返回配置项section.key的值(字符串)，不存在时返回default。
+    和git一样，节名和键名不区分大小写。
+    """
+    parser = read_config()
+    for name in parser.sections():
+        if name.lower() == section.lower() and parser.has_option(name, key):
+            return parser.get(name, key)
+    return default
+
+
+def get_config_bool(section, key, default=False):
+    """返回布尔类型的配置项。"""
+    value = get_config(section, key)
+    if value is None:
+        return default
+    return value.strip().lower() in ('true', 'yes', 'on', '1')
+
+
+# 已经压缩过的格式：再用zlib压缩几乎不能减小，只会浪费时间
+COMPRESSED_EXTENSIONS = frozenset([
+    '.7z', '.apk', '.avif', '.br', '.bz2', '.docx', '.flac', '.gif', '.gz', '.heic', '.jar',
+    '.jpeg', '.jpg', '.lz4', '.mkv', '.mp3', '.mp4', '.ogg', '.png', '.pptx', '.rar',
+    '.tgz', '.webm', '.webp', '.whl', '.woff2', '.xlsx', '.xz', '.zip', '.zst'])
+COMPRESSED_MAGIC = (
+    b'\x1f\x8b', b'PK\x03\x04', b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF8', b'BZh',
+    b'\xfd7zXZ\x00', b'7z\xbc\xaf\x27\x1c', b'\x28\xb5\x2f\xfd', b'Rar!\x1a\x07',
+    b'\x04\x22\x4d\x18', b'OggS', b'fLaC', b'ID3', b'wOF2')
+
+
+def is_compressed_data(data, path=None):
+    """根据路径的扩展名或者数据开头的魔数(包括MP4等格式在第4字节的ftyp)
+    判断数据是不是已经压缩过的格式。
+    """
+    if path is not None and os.path.splitext(path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return True
+    return data.startswith(COMPRESSED_MAGIC) or data[4:8] == b'ftyp'
+
+
+def get_compression_level(kind='loose'):
+    """返回写对象时的zlib压缩级别(-1到9，-1是zlib的默认级别)。和git一样，
+    kind为'loose'时依次看core.looseCompression和core.compression，
+    为'pack'时依次看pack.compression和core.compression。
+    """
+    keys = [('core', 'looseCompression') if kind == 'loose' else ('pack', 'compression'),
+            ('core', 'compression')]
+    for section, key in keys:
+        value = get_config(section, key)
+        if value is not None:
+            level = int(value)
+            if not -1 <= level <= 9:
+                raise ValueError('bad zlib compression level {}'.format(level))
+            return level
+    return zlib.Z_DEFAULT_COMPRESSION
+
+
+def object_compression_level(data, path=None, kind='loose'):
+    """返回压缩给定对象数据时使用的级别：已经压缩过的数据(见is_compressed_data)
+    用0只存储(除非core.storeCompressed是false)，否则是配置的级别。
+    data只需要是数据的开头部分。
+    """
+    if get_config_bool('core', 'storeCompressed', True) and is_compressed_data(data, path):
+        return 0
+    return get_compression_level(kind)
+
+
+INDEX_LOCK_TIMEOUT = 10.0
+
+
+class LockFile:
+    """文件的锁文件(<path>.lock)，语义和git一样：用O_EXCL创建锁文件，
+    新内容写进锁文件后再重命名成目标文件；没有提交就释放时删除锁文件。
+    锁被其他进程持有时最多等待timeout秒。
+    """
+
+    def __init__(self, target, timeout=INDEX_LOCK_TIMEOUT):
+        self.target = target
+        self.path = target + '.lock'
+        self.timeout = timeout
+        self.fd = None
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                self.fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+                return self
+            except FileExistsError:
+                if time.time() >= deadline:
+                    raise FileExistsError(
+                        'unable to lock {}: {} exists (remove it if no other '
+                        'pygit process is running)'.format(self.target, self.path))
+                time.sleep(0.01)
+
+    def commit(self, data):
+        """把data写进锁文件并原子地替换目标文件。"""
+        os.write(self.fd, data)
+        os.close(self.fd)
+        self.fd = None
+        os.replace(self.path, self.target)
+
+    def __exit__(self, *exc_info):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            os.remove(self.path)
+
+
+class IndexLock(LockFile):
+    """索引的锁文件(.git/index.lock)。"""
+
+    def __init__(self, timeout=INDEX_LOCK_TIMEOUT):
+        super().__init__(os.path.join('.git', 'index'), timeout)
+
+
+JOURNAL_SIGNATURE = b'PGJL'
+JOURNAL_ENTRY = 1 << 63
+
+
+def read_index_journal(base_checksum):
+    """读取索引日志(.git/index.journal)，返回tuple(entries, valid_size)：entries
+    是按路径去重(后写的优先)的字典(路径字节 -> 编码后的条目)，valid_size是日志中
+    完整记录的字节数。日志记录的基础索引校验和与base_checksum不一致时返回空；
+    不完整或损坏的最后一批记录被忽略(下次追加时覆盖)。
+    """
+    try:
+        data = read_file(os.path.join('.git', 'index.journal'))
+    except FileNotFoundError:
+        return ({}, 0)
+    if data[:4] != JOURNAL_SIGNATURE or data[4:24] != base_checksum:
+        return ({}, 0)
+    entries = {}
+    i = 24
+    while i + 4 <= len(data):
+        size, = struct.unpack_from('!L', data, i)
+        payload = data[i + 4:i + 4 + size]
+        digest = data[i + 4 + size:i + 24 + size]
+        if len(payload) != size or hashlib.sha1(payload).digest() != digest:
+            break
+        j = 0
+        while j < size:
+            path_end = payload.index(b'\x00', j + 62)
+            entry_len = ((path_end - j + 8) // 8) * 8
+            entries[payload[j + 62:path_end]] = payload[j:j + entry_len]
+            j += entry_len
+        i += 24 + size
+    return (entries, i)
+
+
+def append_index_journal(index, new_entries, lock):
+    """把新条目追加到索引日志中(必须持有索引锁)，代价只和新条目的数量有关。
+    日志的基础索引不是当前索引时重新开始一个日志。
+    """
+    path = os.path.join('.git', 'index.journal')
+    payload = b''.join(pack_index_entry(e) for e in new_entries)
+    record = struct.pack('!L', len(payload)) + payload + hashlib.sha1(payload).digest()
+    if index.journal_size:
+        with open(path, 'r+b') as f:
+            f.seek(index.journal_end)
+            f.write(record)
+            f.truncate()
+    else:
+        write_file(path, JOURNAL_SIGNATURE + index.checksum + record)
+
+
+class IndexFile:
+    """内存映射的git索引文件(.git/index)。打开时只扫描一遍条目头，把每个条目的
+    偏移量记在array中；条目(IndexEntry)和路径在访问时才用struct.unpack_from
+    从映射中解码，所以不会复制整个索引，也不会预先构建所有条目。
+    条目按路径排序，可以用二分查找定位。
+    如果有属于这个索引的日志(.git/index.journal)，日志中的条目被合并进来：
+    偏移量的最高位表示条目在日志数据中。
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join('.git', 'index')
+        self.data = b''
+        self.offsets = array.array('Q')
+        self.end = 0
+        self.mtime_ns = None
+        self.checksum = None
+        self.journal_data = b''
+        self.journal_size = 0
+        self.journal_end = 0
+        self.version = 2
+        self.v4_paths = {}
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            self.mtime_ns = st.st_mtime_ns
+            if st.st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self.data
+        digest = hashlib.sha1(memoryview(data)[:-20]).digest()
+        assert digest == data[-20:], 'invalid index checksum'
+        self.checksum = digest
+        signature, version, num_entries = struct.unpack_from('!4sLL', data, 0)
+        assert signature == b'DIRC', \
+            'invalid index signature {}'.format(signature)
+        assert version in (2, 3, 4), 'unknown index version {}'.format(version)
+        self.version = version
+        offsets = self.offsets
+        unpack_from = struct.unpack_from
+        find = data.find
+        i = 12
+        if version == 4:
+            previous = b''
+            for _ in range(num_entries):
+                offsets.append(i)
+                flags, = unpack_from('!H', data, i + 60)
+                strip, start = decode_ofs_offset(data, i + (64 if flags & 0x4000 else 62))
+                path_end = find(b'\x00', start)
+                previous = previous[:len(previous) - strip] + data[start:path_end]
+                self.v4_paths[i] = previous
+                i = path_end + 1
+        else:
+            for _ in range(num_entries):
+                offsets.append(i)
+                flags, = unpack_from('!H', data, i + 60)
+                header_len = 64 if flags & 0x4000 else 62
+                path_len = flags & 0xfff
+                if path_len == 0xfff:
+                    path_len = find(b'\x00', i + header_len) - i - header_len
+                i += ((header_len + path_len + 8) // 8) * 8
+        self.end = i
+        journal, self.journal_end = read_index_journal(self.checksum)
+        if journal:
+            self.merge_journal(journal)
+
+    def merge_journal(self, journal):
+        """把日志中的条目(路径 -> 编码后的条目)合并进偏移量表。"""
+        self.journal_size = len(journal)
+        self.journal_data = b''.join(journal[p] for p in sorted(journal))
+        base = self.offsets
+        merged = array.array('Q')
+        pos = 0
+        journal_offset = 0
+        for path in sorted(journal):
+            i = self.bisect(path.decode(), hi=len(base))
+            merged.extend(base[pos:i])
+            merged.append(JOURNAL_ENTRY | journal_offset)
+            journal_offset += len(journal[path])
+            if i < len(base) and self.path_bytes(i) == path:
+                i += 1
+            pos = i
+        merged.extend(base[pos:])
+        self.offsets = merged
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def locate(self, i):
+        """返回第i个条目所在的tuple(数据, 偏移量)(索引文件或日志)。"""
+        offset = self.offsets[i]
+        if offset & JOURNAL_ENTRY:
+            return (self.journal_data, offset ^ JOURNAL_ENTRY)
+        return (self.data, offset)
+
+    def __getitem__(self, i):
+        data, offset = self.locate(i)
+        fields = struct.unpack_from('!LLLLLLLLLL20sH', data, offset)
+        return IndexEntry(*(fields + (self.path_at(i),)))
+
+    def __iter__(self):
+        for i in range(len(self.offsets)):
+            yield self[i]
+
+    def path_bytes(self, i):
+        """返回第i个条目的路径(字节)。v4索引的路径在打开时已经解码。"""
+        data, start = self.locate(i)
+        if data is self.data and self.version == 4:
+            return self.v4_paths[start]
+        flags, = struct.unpack_from('!H', data, start + 60)
+        start += 64 if flags & 0x4000 else 62
+        path_len = flags & 0xfff
+        if path_len == 0xfff:
+            return data[start:data.find(b'\x00', start)]
+        return data[start:start + path_len]
+
+    def path_at(self, i):
+        """返回第i个条目的路径。"""
+        return self.path_bytes(i).decode()
+
+    def stat_data(self, i):
+        """返回第i个条目的stat数据(ctime到size的40个字节，未解码)。"""
+        data, offset = self.locate(i)
+        return data[offset:offset + 40]
+
+    def entry_mtime_ns(self, i):
+        """返回第i个条目记录的修改时间(纳秒)。"""
+        data, offset = self.locate(i)
+        mtime_s, mtime_n = struct.unpack_from('!LL', data, offset + 8)
+        return mtime_s * 1000000000 + mtime_n
+
+    def bisect(self, path, hi=None):
+        """返回第一个路径不小于给定路径的条目的位置。"""
+        path = path.encode()
+        lo = 0
+        if hi is None:
+            hi = len(self.offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.path_bytes(mid) < path:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, path):
+        """返回给定路径的条目的位置，不存在时返回None。"""
+        i = self.bisect(path)
+        if i < len(self.offsets) and self.path_at(i) == path:
+            return i
+        return None
+
+    def raw(self, start, end):
+        """返回第start到第end个条目(不包括end)编码后的原始字节。"""
+        assert self.version != 4, 'raw entries of v4 index depend on previous path'
+        if start >= end:
+            return b''
+        if not self.journal_size:
+            stop = self.offsets[end] if end < len(self.offsets) else self.end
+            return self.data[self.offsets[start]:stop]
+        chunks = []
+        run_start = run_end = None
+        for i in range(start, end):
+            data, offset = self.locate(i)
+            path_end = data.index(b'\x00', offset + 62)
+            entry_end = offset + ((path_end - offset + 8) // 8) * 8
+            if data is self.data and run_end == offset:
+                run_end = entry_end
+                continue
+            if run_start is not None:
+                chunks.append(self.data[run_start:run_end])
+                run_start = run_end = None
+            if data is self.data:
+                run_start, run_end = offset, entry_end
+            else:
+                chunks.append(data[offset:entry_end])
+        if run_start is not None:
+            chunks.append(self.data[run_start:run_end])
+        return b''.join(chunks)
+
+    def extensions(self):
+        """返回扩展字典：4字节的扩展签名(如b'TREE') -> 扩展数据。
+        有日志时，cache-tree中包含日志路径的目录被标记为失效。
+        """
+        extensions = {}
+        i = self.end
+        limit = len(self.data) - 20
+        while i + 8 <= limit:
+            signature, size = struct.unpack_from('!4sL', self.data, i)
+            extensions[signature] = self.data[i + 8:i + 8 + size]
+            i += 8 + size
+        if self.journal_size and b'TREE' in extensions:
+            cache_tree = parse_cache_tree(extensions[b'TREE'])
+            for i in range(len(self.offsets)):
+                if self.offsets[i] & JOURNAL_ENTRY:
+                    invalidate_cache_tree(cache_tree, self.path_at(i))
+            extensions[b'TREE'] = build_cache_tree_data(cache_tree)
+        return extensions
+
+
+def read_index_file():
+    """阅读git索引文件，返回tuple(索引条目对象的列表, 扩展字典)，
+    扩展字典把4字节的扩展签名(如b'TREE')映射到扩展数据。
+    """
+    with IndexFile() as index:
+        return (list(index), index.extensions())
+
+
+def read_index():
+    """阅读git索引文件和索引条目对象的返回列表。"""
+    return read_index_file()[0]
+
+
+def parse_cache_tree(data):
+    """解析索引的TREE扩展(cache-tree)，返回字典：目录路径(根目录是'')
+    -> tuple(entry_count, sha1十六进制字符串)，失效的目录是(-1, None)。
+    """
+    cache_tree = {}
+    stack = []
+    i = 0
+    while i < len(data):
+        name_end = data.index(b'\x00', i)
+        name = data[i:name_end].decode()
+        line_end = data.index(b'\n', name_end)
+        entry_count, subtree_count = map(int, data[name_end + 1:line_end].split())
+        i = line_end + 1
+        sha1 = None
+        if entry_count >= 0:
+            sha1 = data[i:i + 20].hex()
+            i += 20
+        while stack and stack[-1][1] == 0:
+            stack.pop()
+        if stack:
+            parent = stack[-1][0]
+            stack[-1][1] -= 1
+            path = parent + '/' + name if parent else name
+        else:
+            path = name
+        cache_tree[path] = (entry_count, sha1)
+        stack.append([path, subtree_count])
+    return cache_tree
+
+
+def build_cache_tree_data(cache_tree):
+    """把cache-tree字典编码成索引的TREE扩展数据(先序遍历，子目录按名字排序)。"""
+    if '' not in cache_tree:
+        return b''
+    children = collections.defaultdict(list)
+    for path in cache_tree:
+        if path:
+            children[path.rpartition('/')[0]].append(path)
+    result = []
+    stack = ['']
+    while stack:
+        path = stack.pop()
+        entry_count, sha1 = cache_tree[path]
+        subtrees = sorted(children[path])
+        result.append(path.rpartition('/')[2].encode() + b'\x00' +
+                      '{} {}\n'.format(entry_count, len(subtrees)).encode())
+        if entry_count >= 0:
+            result.append(bytes.fromhex(sha1))
+        stack.extend(reversed(subtrees))
+    return b''.join(result)
+
+
+def invalidate_cache_tree(cache_tree, path):
+    """让包含给定文件路径的所有目录在cache-tree中失效。"""
+    dir_path = path
+    while dir_path:
+        dir_path = dir_path.rpartition('/')[0]
+        if dir_path in cache_tree:
+            cache_tree[dir_path] = (-1, None)
+
+
+def ls_files(details=False):
+    """索引中的文件列表(包括模式、sha - 1和阶段号，如果“细节”是正确的)。
+    """
+    with IndexFile() as index:
+        for i in range(len(index)):
+            if details:
+                entry = index[i]
+                stage = (entry.flags >> 12) & 3
+                print('{:6o} {} {:}\t{}'.format(
+                    entry.mode, entry.sha1.hex(), stage, entry.path))
+            else:
+                print(index.path_at(i))
+
+
+def normalize_mode(st_mode):
+    """把文件的st_mode规范成git中使用的模式(普通文件100644或100755，符号链接120000)。"""
+    if stat.S_ISLNK(st_mode):
+        return 0o120000
+    return 0o100755 if st_mode & 0o111 else 0o100644
+
+
+def stat_fields(st):
+    """返回索引条目中保存的10个stat字段(ctime_s到size)。和git一样，
+    秒、纳秒、设备号和inode号都截断成32位，模式被规范化。
+    """
+    return (
+        (st.st_ctime_ns // 1000000000) & 0xffffffff,
+        st.st_ctime_ns % 1000000000,
+        (st.st_mtime_ns // 1000000000) & 0xffffffff,
+        st.st_mtime_ns % 1000000000,
+        st.st_dev & 0xffffffff, st.st_ino & 0xffffffff, normalize_mode(st.st_mode),
+        st.st_uid & 0xffffffff, st.st_gid & 0xffffffff,
+        st.st_size & 0xffffffff)
+
+
+def entry_from_stat(path, sha1, st):
+    """根据文件的stat结果和sha - 1(字节)构建索引条目。"""
+    flags = len(path.encode())
+    assert flags < (1 << 12)
+    return IndexEntry(*(stat_fields(st) + (sha1, flags, path)))
+
+
+def stat_matches(entry, st):
+    """如果文件的stat数据和索引条目中保存的一致则返回True。"""
+    return stat_fields(st) == tuple(entry[:10])
+
+
+def is_racy(entry_mtime_ns, index_mtime_ns):
+    """如果条目的修改时间不早于索引文件的修改时间则返回True。这种条目
+    在同一个时间戳内可能又被修改过，所以不能只相信stat数据(racy git)。
+    """
+    return index_mtime_ns is None or entry_mtime_ns >= index_mtime_ns
+
+
+def get_status(jobs=1):
+    """获得工作副本的状态，返回tuple(changed_paths，new_paths，deleted_paths)。
+    stat数据和索引条目一致(并且不是racy)的文件不重新计算散列；
+    重新计算后发现没有修改的文件会把新的stat数据写回索引。
+    jobs大于1时并发计算散列。
+    如果配置了core.fsmonitor并且文件系统监视进程(pygit fsmonitor start)在运行，
+    只检查上次状态检查以来有变化的路径，不扫描整个工作副本。
+    被.gitignore等忽略的未跟踪文件不算新文件，被忽略的目录不会被扫描。
+    """
+    monitor = cache = None
+    if get_config_bool('core', 'fsmonitor'):
+        cache = read_fsmonitor_cache()
+        monitor = query_fsmonitor(cache[0] if cache else '')
+    matcher = IgnoreMatcher()
+    with IndexFile() as index:
+        index_key = fsmonitor_index_key(index)
+        dirty = None
+        if monitor is not None and monitor[1] is not None and cache is not None \
+                and cache[1] == index_key + ';' + matcher.key() and \
+                not any(p.rpartition('/')[2] == GITIGNORE for p in monitor[1]):
+            dirty = set(monitor[1])
+        changed, new, deleted, refreshed = check_status(index, dirty, jobs=jobs,
+                                                        matcher=matcher)
+    if dirty is not None:
+        changed |= {p for p in cache[2] if not is_under(p, dirty)}
+        new |= {p for p in cache[3] if not is_under(p, dirty)}
+        deleted |= {p for p in cache[4] if not is_under(p, dirty)}
+    if refreshed:
+        index_key = refresh_index(refreshed, index_key) or index_key
+    if monitor is not None:
+        write_fsmonitor_cache(monitor[0], index_key + ';' + matcher.key(),
+                              changed, new, deleted)
+    return (sorted(changed), sorted(new), sorted(deleted))
+
+
+def check_status(index, dirty=None, jobs=1, matcher=None):
+    """比较已经打开的IndexFile和工作副本，返回(changed，new，deleted，refreshed)，
+    前三个是路径的集合，refreshed是内容没有变化但stat数据需要更新的条目。
+    dirty为None时检查整个工作副本；否则只检查dirty中的路径以及其中目录下的路径。
+    matcher(IgnoreMatcher)中被忽略的路径不会被扫描，但是已经在索引中的文件
+    仍然会被检查。
+    """
+    paths = set(walk_working_copy(None if dirty is None else sorted(dirty), matcher))
+    if dirty is None:
+        positions = range(len(index))
+    else:
+        positions = set()
+        for path in dirty:
+            i = index.find(path)
+            if i is not None:
+                positions.add(i)
+            prefix = path + '/'
+            i = index.bisect(prefix)
+            while i < len(index) and index.path_at(i).startswith(prefix):
+                positions.add(i)
+                i += 1
+        positions = sorted(positions)
+    changed = set()
+    refreshed = []
+    to_hash = []
+    entry_paths = set()
+    for i in positions:
+        p = index.path_at(i)
+        entry_paths.add(p)
+        if p not in paths:
+            if matcher is None or not os.path.isfile(p):
+                continue
+            paths.add(p)
+        st = os.stat(p)
+        if index.stat_data(i) == struct.pack('!10L', *stat_fields(st)) and \
+                not is_racy(index.entry_mtime_ns(i), index.mtime_ns):
+            continue
+        to_hash.append((index[i], st))
+    sha1s = hash_files([e.path for e, _ in to_hash], write=False, jobs=jobs)
+    for (entry, st), sha1 in zip(to_hash, sha1s):
+        if sha1 != entry.sha1.hex():
+            changed.add(entry.path)
+        elif not stat_matches(entry, st):
+            refreshed.append(entry_from_stat(entry.path, entry.sha1, st))
+    return changed, paths - entry_paths, entry_paths - paths, refreshed
+
+
+def refresh_index(refreshed, index_key=None):
+    """把重新计算过散列、内容没有变化的条目的新stat数据写回索引。和git一样
+    只是尽力而为：索引被其他进程锁住时直接跳过；加锁后重新读取索引，
+    只更新sha - 1仍然相同的条目，所以不会覆盖其他进程的修改。
+    如果加锁后读到的索引的键仍然是index_key，返回新索引的键，否则返回None。
+    """
+    try:
+        with IndexLock(timeout=0) as lock, IndexFile() as index:
+            current = []
+            for entry in refreshed:
+                i = index.find(entry.path)
+                if i is not None and index[i].sha1 == entry.sha1:
+                    current.append(entry)
+            if current:
+                checksum = update_index(index, current, index.extensions(), lock=lock)
+                if fsmonitor_index_key(index) == index_key:
+                    return '{}:0'.format(checksum.hex())
+    except FileExistsError:
+        pass
+    return None
+
+
+FSMONITOR_SOCKET = os.path.join('.git', 'fsmonitor.sock')
+FSMONITOR_CACHE = os.path.join('.git', 'fsmonitor-cache')
+FSMONITOR_COOKIE_PREFIX = 'fsmonitor-cookie-'
+FSMONITOR_TIMEOUT = 5.0
+FSMONITOR_POLL_INTERVAL = 1.0
+
+# inotify事件的掩码(linux/inotify.h)
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+                IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR)
+
+
+INFO_EXCLUDE = os.path.join('.git', 'info', 'exclude')
+GITIGNORE = '.gitignore'
+
+
+def translate_ignore_pattern(pattern):
+    """把忽略规则中的通配符模式翻译成正则表达式(和git的wildmatch一样，
+    *、?和[...]都不匹配/；**/匹配零个或多个目录，结尾的/**匹配目录中的所有东西)。
+    """
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            j = i
+            while j < n and pattern[j] == '*':
+                j += 1
+            if j - i >= 2 and (i == 0 or pattern[i - 1] == '/') and \
+                    (j == n or pattern[j] == '/'):
+                if j == n:
+                    out.append('.*')
+                else:
+                    out.append('(?:.*/)?')
+                    j += 1
+            else:
+                out.append('[^/]*')
+            i = j
+            continue
+        if c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                out.append(re.escape(c))
+            else:
+                chars = pattern[i + 1:j]
+                negate = chars[0] in '!^'
+                if negate:
+                    chars = chars[1:]
+                chars = chars.replace('\\', '\\\\').replace('[', '\\[')
+                out.append('(?!/)[{}{}]'.format('^' if negate else '', chars))
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def parse_ignore_line(line):
+    """解析忽略文件中的一行，返回(正则表达式，negate，dir_only)；
+    空行和注释返回None。
+    """
+    line = line.rstrip('\r')
+    if not line or line.startswith('#'):
+        return None
+    stripped = line.rstrip(' ')
+    if stripped != line and stripped.endswith('\\'):
+        stripped += ' '
+    line = stripped
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    elif line.startswith(('\\!', '\\#')):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    if dir_only:
+        line = line[:-1]
+    if not line:
+        return None
+    anchored = '/' in line
+    if line.startswith('/'):
+        line = line[1:]
+    regex = translate_ignore_pattern(line)
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return regex, negate, dir_only
+
+
+class IgnoreRules:
+    """一个忽略文件(.gitignore、info/exclude等)编译后的规则。
+    连续的、negate和dir_only都相同的规则合并成一个正则表达式，
+    所以没有“!”规则的文件只需要匹配一两次。和git一样，后面的规则优先。
+    """
+
+    def __init__(self, data):
+        self.groups = []
+        for line in os.fsdecode(data).split('\n'):
+            rule = parse_ignore_line(line)
+            if rule is None:
+                continue
+            regex, negate, dir_only = rule
+            if self.groups and self.groups[-1][1:] == [negate, dir_only]:
+                self.groups[-1][0].append(regex)
+            else:
+                self.groups.append([[regex], negate, dir_only])
+        self.groups = [(re.compile('(?:{})'.format('|'.join(regexes)), re.DOTALL),
+                        negate, dir_only)
+                       for regexes, negate, dir_only in self.groups]
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def match(self, rel_path, is_dir):
+        """rel_path(相对于忽略文件所在目录)被忽略时返回True，被“!”规则
+        重新包含时返回False，没有规则匹配时返回None。
+        """
+        for regex, negate, dir_only in reversed(self.groups):
+            if (is_dir or not dir_only) and regex.fullmatch(rel_path):
+                return not negate
+        return None
+
+
+def read_ignore_rules(path):
+    """读取并编译一个忽略文件，文件不存在或者没有规则时返回None。"""
+    try:
+        rules = IgnoreRules(read_file(path))
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+        return None
+    return rules or None
+
+
+class IgnoreMatcher:
+    """工作副本的忽略规则：各个目录中的.gitignore、.git/info/exclude和
+    core.excludesFile，优先级从高到低(更深的.gitignore优先)。
+    每个目录的.gitignore只读取、编译一次，缓存在dir_rules中；chains缓存
+    每个目录生效的(目录，规则)列表，只包括确实有规则的目录。
+    和git一样，被忽略的目录中的所有路径都被忽略，“!”规则不能重新包含它们。
+    """
+
+    def __init__(self):
+        self.global_files = [INFO_EXCLUDE]
+        excludes_file = get_config('core', 'excludesFile')
+        if excludes_file:
+            self.global_files.append(os.path.expanduser(excludes_file))
+        self.global_rules = [rules for rules in map(read_ignore_rules, self.global_files)
+                             if rules]
+        self.dir_rules = {}
+        self.chains = {}
+        self.ignored_dirs = {}
+
+    def key(self):
+        """标识全局忽略文件内容的字符串，文件变化后缓存的状态就失效了。"""
+        parts = []
+        for path in self.global_files:
+            try:
+                st = os.stat(path)
+                parts.append('{}.{}'.format(st.st_mtime_ns, st.st_size))
+            except OSError:
+                parts.append('-')
+        return ','.join(parts)
+
+    def load(self, dir_path, exists=None):
+        """读取目录dir_path(相对于工作副本，根目录是'')的.gitignore。
+        exists为False时(调用者已经列出了目录)不访问文件系统。
+        """
+        if dir_path not in self.dir_rules:
+            if exists is False:
+                self.dir_rules[dir_path] = None
+            else:
+                self.dir_rules[dir_path] = read_ignore_rules(
+                    os.path.join(dir_path, GITIGNORE) if dir_path else GITIGNORE)
+        return self.dir_rules[dir_path]
+
+    def chain(self, dir_path):
+        """返回对dir_path中的路径生效的(目录，规则)列表，从浅到深。"""
+        chain = self.chains.get(dir_path)
+        if chain is None:
+            chain = self.chain(dir_path.rpartition('/')[0]) if dir_path else []
+            rules = self.load(dir_path)
+            if rules:
+                chain = chain + [(dir_path, rules)]
+            self.chains[dir_path] = chain
+        return chain
+
+    def match(self, path, is_dir):
+        """只根据path本身判断是否被忽略，不考虑它的父目录。"""
+        for base, rules in reversed(self.chain(path.rpartition('/')[0])):
+            result = rules.match(path[len(base) + 1:] if base else path, is_dir)
+            if result is not None:
+                return result
+        for rules in self.global_rules:
+            result = rules.match(path, is_dir)
+            if result is not None:
+                return result
+        return False
+
+    def is_ignored(self, path, is_dir=None):
+        """如果path本身或者它的某个父目录被忽略，返回True。
+        is_dir为None时根据文件系统判断path是不是目录。
+        """
+        path = path.strip('/')
+        i = path.find('/')
+        while i >= 0:
+            if self.dir_ignored(path[:i]):
+                return True
+            i = path.find('/', i + 1)
+        if is_dir is None:
+            is_dir = os.path.isdir(path) and not os.path.islink(path)
+        return self.match(path, is_dir)
+
+    def dir_ignored(self, dir_path):
+        """目录本身是否被忽略(不考虑父目录)，结果缓存在ignored_dirs中。"""
+        result = self.ignored_dirs.get(dir_path)
+        if result is None:
+            result = self.ignored_dirs[dir_path] = self.match(dir_path, True)
+        return result
+
+
+def walk_working_copy(roots=None, matcher=None):
+    """生成工作副本中文件的路径(不包括.git目录)。roots不为None时只生成其中
+    存在的路径，以及其中的目录下的所有文件。
+    matcher(IgnoreMatcher)不为None时跳过被忽略的文件，并且不进入被忽略的目录。
+    """
+    for root in ['.'] if roots is None else roots:
+        if root != '.' and (os.path.islink(root) or not os.path.isdir(root)):
+            if os.path.lexists(root) and \
+                    (matcher is None or not matcher.is_ignored(root, False)):
+                yield root
+            continue
+        if root != '.' and matcher is not None and matcher.is_ignored(root, True):
+            continue
+        for dir_path, dirs, files in os.walk(root):
+            rel_dir = dir_path.replace('\\', '/')
+            if rel_dir == '.':
+                rel_dir = ''
+            elif rel_dir.startswith('./'):
+                rel_dir = rel_dir[2:]
+            prefix = rel_dir + '/' if rel_dir else ''
+            if matcher is None:
+                dirs[:] = [d for d in dirs if d != '.git']
+            else:
+                matcher.load(rel_dir, GITIGNORE in files)
+                dirs[:] = [d for d in dirs if d != '.git' and
+                           not matcher.match(prefix + d, True)]
+            for file in files:
+                path = prefix + file
+                if matcher is None or not matcher.match(path, False):
+                    yield path
+
+
+def is_under(path, roots):
+    """如果path在集合roots中，或者在其中某个目录下，返回True。"""
+    if path in roots:
+        return True
+    i = path.find('/')
+    while i >= 0:
+        if path[:i] in roots:
+            return True
+        i = path.find('/', i + 1)
+    return False
+
+
+class FsMonitor:
+    """文件系统监视进程的状态：记录每个有变化的路径最后一次变化时的序号。
+    令牌是“实例id:序号”，查询时返回给定令牌以来有变化的路径和新的令牌。
+    监视进程重新启动或者丢失事件(inotify队列溢出)后，以前的令牌都失效，
+    客户端需要扫描整个工作副本。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.instance = os.urandom(8).hex()
+        self.seq = 0
+        self.reset_seq = 0
+        self.dirty = {}
+        self.watcher = None
+
+    def mark(self, paths):
+        """记录有变化的路径。"""
+        with self.lock:
+            for path in paths:
+                self.dirty[path] = self.seq
+
+    def reset(self):
+        """丢失了事件：使所有已经发出的令牌失效。"""
+        with self.lock:
+            self.reset_seq = self.seq + 1
+            self.dirty.clear()
+
+    def query(self, token):
+        """返回(新令牌，token以来有变化的路径列表)；需要扫描整个工作副本时
+        路径列表为None。先等待监视器处理完查询之前发生的所有事件。
+        """
+        synced = self.watcher.sync()
+        with self.lock:
+            self.seq += 1
+            new_token = '{}:{}'.format(self.instance, self.seq)
+            instance, _, seq = token.partition(':')
+            if not synced or instance != self.instance or not seq.isdigit() or \
+                    int(seq) < self.reset_seq:
+                return new_token, None
+            since = int(seq)
+            return new_token, sorted(p for p, s in self.dirty.items() if s >= since)
+
+
+class InotifyWatcher:
+    """用inotify(通过ctypes调用libc)监视工作副本中的所有目录。新建的目录
+    自动加入监视，移走的目录停止监视。.git目录只用来接收同步用的cookie文件。
+    """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.wds = {}
+        self.cookies = {}
+        self.cookie_count = itertools.count()
+        self.git_wd = self.add_watch('.git', IN_CREATE)
+        self.add_watches('')
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path or '.'), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, 'inotify_add_watch failed: {}'.format(os.strerror(errno)),
+                          path)
+        return wd
+
+    def add_watches(self, root):
+        """监视root目录和其下的所有目录(不包括.git)。"""
+        for dir_path, dirs, _ in os.walk(root or '.'):
+            dirs[:] = [d for d in dirs if d != '.git']
+            path = dir_path.replace('\\', '/')
+            path = '' if path == '.' else path[2:] if path.startswith('./') else path
+            try:
+                self.wds[self.add_watch(path, INOTIFY_MASK)] = path
+            except FileNotFoundError:
+                pass
+
+    def remove_watches(self, root):
+        """停止监视root目录和其下的所有目录。"""
+        for wd, path in list(self.wds.items()):
+            if path == root or path.startswith(root + '/'):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.wds[wd]
+
+    def run(self):
+        """读取并处理inotify事件(在单独的线程中运行)。"""
+        while True:
+            data = os.read(self.fd, 65536)
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = struct.unpack_from('iIII', data, pos)
+                name = os.fsdecode(data[pos + 16:pos + 16 + length].rstrip(b'\x00'))
+                pos += 16 + length
+                self.handle(wd, mask, name)
+
+    def handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            self.monitor.reset()
+            return
+        if wd == self.git_wd:
+            event = self.cookies.get(name)
+            if event is not None:
+                event.set()
+            return
+        directory = self.wds.get(wd)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            del self.wds[wd]
+            return
+        path = directory + '/' + name if directory else name
+        if not path or path == '.git':
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_watches(path)
+            elif mask & IN_MOVED_FROM:
+                self.remove_watches(path)
+        self.monitor.mark([path])
+
+    def sync(self, timeout=FSMONITOR_TIMEOUT):
+        """在.git中创建一个cookie文件并等待它的事件。同一个inotify描述符的事件
+        是有序的，所以收到cookie事件时之前的所有事件都已经处理完了。
+        """
+        name = FSMONITOR_COOKIE_PREFIX + str(next(self.cookie_count))
+        event = threading.Event()
+        self.cookies[name] = event
+        path = os.path.join('.git', name)
+        try:
+            write_file(path, b'')
+            os.remove(path)
+            return event.wait(timeout)
+        finally:
+            del self.cookies[name]
+
+
+class PollWatcher:
+    """没有inotify时的后备方案：定期扫描整个工作副本，比较stat数据。
+    查询时先扫描一次，所以不会漏掉查询之前的修改。
+    """
+
+    def __init__(self, monitor, interval=FSMONITOR_POLL_INTERVAL):
+        self.monitor = monitor
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for path in walk_working_copy():
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_mode, st.st_size, st.st_ino,
+                              st.st_mtime_ns, st.st_ctime_ns)
+        return snapshot
+
+    def poll(self):
+        with self.lock:
+            snapshot = self.scan()
+            old = self.snapshot
+            self.monitor.mark([p for p in snapshot.keys() | old.keys()
+                               if snapshot.get(p) != old.get(p)])
+            self.snapshot = snapshot
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.poll()
+
+    def sync(self):
+        self.poll()
+        return True
+
+
+class FsMonitorHandler(socketserver.StreamRequestHandler):
+    """处理一个查询：请求是一行令牌(或者“quit”)；响应的第一行是新令牌，
+    后面是以NUL分隔的路径，或者是“*”(需要扫描整个工作副本)。
+    """
+
+    def handle(self):
+        line = self.rfile.readline().decode().strip()
+        if line == 'quit':
+            self.wfile.write(b'ok\n')
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        token, paths = self.server.monitor.query(line)
+        self.wfile.write(token.encode() + b'\n')
+        if paths is None:
+            self.wfile.write(b'*')
+        else:
+            self.wfile.write(b'\x00'.join(os.fsencode(p) for p in paths))
+
+
+def fsmonitor_request(line):
+    """向监视进程发送一行请求，返回响应的字节；监视进程没有运行时返回None。"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(FSMONITOR_TIMEOUT * 2)
+    with sock:
+        try:
+            sock.connect(FSMONITOR_SOCKET)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        sock.sendall(line.encode() + b'\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def query_fsmonitor(token):
+    """返回(新令牌，token以来有变化的路径列表或None)；监视进程没有运行时
+    返回None。
+    """
+    response = fsmonitor_request(token)
+    if not response:
+        return None
+    token, _, data = response.partition(b'\n')
+    if data == b'*':
+        return token.decode(), None
+    return token.decode(), [os.fsdecode(p) for p in data.split(b'\x00') if p]
+
+
+def run_fsmonitor(poll=False):
+    """在前台运行文件系统监视进程，直到收到quit请求。poll为True或者不能
+    使用inotify时定期扫描工作副本。
+    """
+    if fsmonitor_request('') is not None:
+        raise ValueError('fsmonitor daemon is already running')
+    if os.path.exists(FSMONITOR_SOCKET):
+        os.remove(FSMONITOR_SOCKET)
+    monitor = FsMonitor()
+    watcher = None
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            watcher = InotifyWatcher(monitor)
+        except OSError as error:
+            print('cannot use inotify ({}), polling instead'.format(error),
+                  file=sys.stderr)
+    monitor.watcher = watcher or PollWatcher(monitor)
+    threading.Thread(target=monitor.watcher.run, daemon=True).start()
+    server = socketserver.ThreadingUnixStreamServer(FSMONITOR_SOCKET, FsMonitorHandler)
+    server.daemon_threads = True
+    server.monitor = monitor
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(FSMONITOR_SOCKET)
+
+
+def start_fsmonitor(poll=False):
+    """在后台启动文件系统监视进程，等到它可以接受查询时返回。"""
+    if fsmonitor_request('') is not None:
+        raise ValueError('fsmonitor daemon is already running')
+    args = [sys.executable, os.path.abspath(__file__), 'fsmonitor', 'run']
+    if poll:
+        args.append('--poll')
+    process = subprocess.Popen(args, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + FSMONITOR_TIMEOUT
+    while fsmonitor_request('') is None:
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise ValueError('fsmonitor daemon failed to start')
+        time.sleep(0.05)
+    return process.pid
+
+
+def stop_fsmonitor():
+    """停止文件系统监视进程，没有运行时返回False。"""
+    return fsmonitor_request('quit') is not None
+
+
+def read_fsmonitor_cache():
+    """读取上次状态检查的结果，返回(令牌，索引的键，changed，new，deleted)；
+    没有缓存时返回None。
+    """
+    try:
+        data = read_file(FSMONITOR_CACHE)
+    except FileNotFoundError:
+        return None
+    token, index_key, *records = data.split(b'\x00')
+    sets = {b'C': set(), b'N': set(), b'D': set()}
+    for record in records:
+        if record:
+            sets[record[:1]].add(os.fsdecode(record[1:]))
+    return token.decode(), index_key.decode(), sets[b'C'], sets[b'N'], sets[b'D']
+
+
+def write_fsmonitor_cache(token, index_key, changed, new, deleted):
+    """保存状态检查的结果和得到的令牌，下次只需要检查令牌以来有变化的路径。"""
+    records = [token.encode(), index_key.encode()]
+    for kind, paths in ((b'C', changed), (b'N', new), (b'D', deleted)):
+        records.extend(kind + os.fsencode(p) for p in sorted(paths))
+    write_file_atomic(FSMONITOR_CACHE, b'\x00'.join(records), prefix='tmp_fsmonitor_')
+
+
+def fsmonitor_index_key(index):
+    """标识索引内容(包括索引日志)的字符串，索引变化后缓存的状态就失效了。"""
+    return '{}:{}'.format(index.checksum.hex() if index.checksum else '',
+                          index.journal_end)
+
+
+def status(jobs=1):
+    """显示工作副本的状态。"""
+    changed, new, deleted = get_status(jobs=jobs)
+    if changed:
+        print('changed files:')
+        for path in changed:
+            print('   ', path)
+    if new:
+        print('new files:')
+        for path in new:
+            print('   ', path)
+    if deleted:
+        print('deleted files:')
+        for path in deleted:
+            print('   ', path)
+
+
+BINARY_CHECK_SIZE = 8000
+MYERS_MAX_COST = 2000
+
+
+def is_binary(data):
+    """和git一样，前8000字节中有NUL字节的数据被当作二进制数据。"""
+    return b'\x00' in data[:BINARY_CHECK_SIZE]
+
+
+def split_lines(data):
+    """把字节数据按b'\\n'分成行(保留换行符)。最后一行可能没有换行符。"""
+    lines = [line + b'\n' for line in data.split(b'\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def unique_anchors(a, a0, a1, b, b0, b1):
+    """找出在a[a0:a1]和b[b0:b1]中都只出现一次的行，返回其中位置在两边都递增的
+    最长序列[(i, j)]，作为分割比较区域的锚点(patience diff)。
+    """
+    a_pos = {}
+    for i in range(a0, a1):
+        a_pos[a[i]] = -1 if a[i] in a_pos else i
+    b_pos = {}
+    for j in range(b0, b1):
+        b_pos[b[j]] = -1 if b[j] in b_pos else j
+    # b_pos按第一次出现的顺序插入，所以唯一行的j是递增的
+    pairs = [(a_pos[x], j) for x, j in b_pos.items()
+             if j >= 0 and a_pos.get(x, -1) >= 0]
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(pairs)
+    for k, (i, _) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, i)
+        if pos:
+            previous[k] = tail_indexes[pos - 1]
+        if pos == len(tails):
+            tails.append(i)
+            tail_indexes.append(k)
+        else:
+            tails[pos] = i
+            tail_indexes[pos] = k
+    anchors = []
+    k = tail_indexes[-1] if tail_indexes else None
+    while k is not None:
+        anchors.append(pairs[k])
+        k = previous[k]
+    anchors.reverse()
+    return anchors
+
+
+def myers_blocks(a, a0, a1, b, b0, b1, max_cost=MYERS_MAX_COST):
+    """用Myers的O(ND)算法比较a[a0:a1]和b[b0:b1]，返回匹配块[(i, j, n)]。
+    编辑距离超过max_cost时放弃，把整个区域当作替换(返回空列表)。
+    """
+    n = a1 - a0
+    m = b1 - b0
+    limit = min(n + m, max_cost)
+    offset = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    for d in range(limit + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                break
+        else:
+            continue
+        break
+    else:
+        return []
+    blocks = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v[offset + previous_k]
+        previous_y = previous_x - previous_k
+        length = min(x - previous_x, y - previous_y) if d else x
+        if length > 0:
+            blocks.append((a0 + x - length, b0 + y - length, length))
+        x, y = previous_x, previous_y
+    return blocks
+
+
+def diff_sequences(a, b, max_cost=MYERS_MAX_COST):
+    """比较两个可散列元素的序列，返回匹配块[(i, j, n)](表示a[i:i+n] == b[j:j+n])，
+    按位置排序，最后一个是(len(a), len(b), 0)，格式和difflib相同。
+    先去掉共同的前缀和后缀，再用两边都唯一的行做锚点分割区域，
+    没有锚点的区域用Myers算法比较。
+    """
+    blocks = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a0, a1, b0, b1 = regions.pop()
+        n = 0
+        while a0 + n < a1 and b0 + n < b1 and a[a0 + n] == b[b0 + n]:
+            n += 1
+        if n:
+            blocks.append((a0, b0, n))
+            a0 += n
+            b0 += n
+        n = 0
+        while a1 - n > a0 and b1 - n > b0 and a[a1 - n - 1] == b[b1 - n - 1]:
+            n += 1
+        if n:
+            blocks.append((a1 - n, b1 - n, n))
+            a1 -= n
+            b1 -= n
+        if a0 == a1 or b0 == b1:
+            continue
+        anchors = unique_anchors(a, a0, a1, b, b0, b1)
+        if not anchors:
+            blocks.extend(myers_blocks(a, a0, a1, b, b0, b1, max_cost))
+            continue
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            regions.append((a0, i, b0, j))
+            a0, b0 = i + 1, j + 1
+        regions.append((a0, a1, b0, b1))
+    blocks.sort()
+    merged = []
+    for i, j, n in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and \
+                merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+        else:
+            merged.append((i, j, n))
+    merged.append((len(a), len(b), 0))
+    return merged
+
+
+def diff_lines(a_lines, b_lines):
+    """比较两个行列表，返回修改列表[(i1, i2, j1, j2)]：a_lines[i1:i2]被替换成
+    b_lines[j1:j2]。每行先映射成整数，比较的是整数而不是行本身。
+    """
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b = [ids.setdefault(line, len(ids)) for line in b_lines]
+    changes = []
+    i = j = 0
+    for block_i, block_j, n in diff_sequences(a, b):
+        if i < block_i or j < block_j:
+            changes.append((i, block_i, j, block_j))
+        i, j = block_i + n, block_j + n
+    return changes
+
+
+def format_range(start, stop):
+    """hunk头中的行范围，格式和git(以及difflib)相同。"""
+    length = stop - start
+    if length == 1:
+        return '{}'.format(start + 1)
+    return '{},{}'.format(start + 1 if length else start, length)
+
+
+def iter_hunks(a_lines, b_lines, changes, context=3):
+    """生成统一diff格式的hunk(字节行，包含换行符)。相隔不超过2*context行的
+    修改合并到同一个hunk中。
+    """
+    groups = []
+    for change in changes:
+        if groups and change[0] - groups[-1][-1][1] <= 2 * context:
+            groups[-1].append(change)
+        else:
+            groups.append([change])
+    for group in groups:
+        a_start = max(group[0][0] - context, 0)
+        b_start = max(group[0][2] - context, 0)
+        a_end = min(group[-1][1] + context, len(a_lines))
+        b_end = min(group[-1][3] + context, len(b_lines))
+        yield '@@ -{} +{} @@\n'.format(format_range(a_start, a_end),
+                                       format_range(b_start, b_end)).encode()
+        i = a_start
+        for i1, i2, j1, j2 in group:
+            for line in a_lines[i:i1]:
+                yield b' ' + line
+            for line in a_lines[i1:i2]:
+                yield b'-' + line
+            for line in b_lines[j1:j2]:
+                yield b'+' + line
+            i = i2
+        for line in a_lines[i:a_end]:
+            yield b' ' + line
+
+
+def diff_stat(stats):
+    """打印git diff --stat格式的统计。stats是DiffStat的列表。"""
+    path_width = max(len(s.path) for s in stats)
+    most = max((s.insertions + s.deletions for s in stats
+                if s.insertions is not None), default=0)
+    count_width = len(str(most))
+    scale = min(1, 50 / most) if most else 1
+    for s in stats:
+        if s.insertions is None:
+            print(' {:<{}} | Bin {} -> {} bytes'.format(
+                s.path, path_width, s.old_size, s.new_size))
+            continue
+        print(' {:<{}} | {:>{}} {}{}'.format(
+            s.path, path_width, s.insertions + s.deletions, count_width,
+            '+' * (int(s.insertions * scale) or (s.insertions > 0)),
+            '-' * (int(s.deletions * scale) or (s.deletions > 0))))
+    print(' {} file{} changed, {} insertions(+), {} deletions(-)'.format(
+        len(stats), '' if len(stats) == 1 else 's',
+        sum(s.insertions or 0 for s in stats), sum(s.deletions or 0 for s in stats)))
+
+
+def diff(jobs=1, context=3, show_stat=False, name_only=False):
+    """显示更改的文件(在索引和工作副本之间)。show_stat为True时只显示每个文件增删的
+    行数；name_only为True时只列出文件名，不比较内容。
+    """
+    changed, _, _ = get_status(jobs=jobs)
+    if name_only:
+        for path in changed:
+            print(path)
+        return
+    stats = []
+    out = None if show_stat else sys.stdout.buffer
+    with IndexFile() as index:
+        for path in changed:
+            entry = index[index.find(path)]
+            _, index_data = read_object(entry.sha1.hex())
+            working_data = read_file(path)
+            if is_binary(index_data) or is_binary(working_data):
+                stats.append(DiffStat(path, None, None, len(index_data),
+                                      len(working_data)))
+                if not show_stat:
+                    sys.stdout.flush()
+                    out.write('diff --git a/{0} b/{0}\nBinary files a/{0} and b/{0} '
+                              'differ\n'.format(path).encode())
+                continue
+            index_lines = split_lines(index_data)
+            working_lines = split_lines(working_data)
+            changes = diff_lines(index_lines, working_lines)
+            stats.append(DiffStat(path, sum(j2 - j1 for _, _, j1, j2 in changes),
+                                  sum(i2 - i1 for i1, i2, _, _ in changes),
+                                  len(index_data), len(working_data)))
+            if show_stat:
+                continue
+            sys.stdout.flush()
+            out.write('diff --git a/{0} b/{0}\n--- a/{0}\n+++ b/{0}\n'.format(
+                path).encode())
+            for line in iter_hunks(index_lines, working_lines, changes, context):
+                out.write(line)
+                if not line.endswith(b'\n'):
+                    out.write(b'\n\\ No newline at end of file\n')
+    if show_stat and stats:
+        diff_stat(stats)
+
+
+def common_prefix_length(a, b):
+    """返回两个字节串相同前缀的长度(二分查找，每次比较的是整个切片)。"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def pack_index_entry(entry, previous_path=None):
+    """把索引条目编码成索引文件中的字节。previous_path为None时使用v2格式
+    (路径补齐到8字节)；否则使用v4格式：路径只保存和前一个路径(字节)不同的
+    后缀，前面是要从前一个路径末尾去掉的字节数(变长整数)，没有补齐。
+    """
+    entry_head = struct.pack('!LLLLLLLLLL20sH',
+                             entry.ctime_s, entry.ctime_n, entry.mtime_s, entry.mtime_n,
+                             entry.dev, entry.ino, entry.mode, entry.uid, entry.gid,
+                             entry.size, entry.sha1, entry.flags & ~0x4000)
+    path = entry.path.encode()
+    if previous_path is not None:
+        common = common_prefix_length(path, previous_path)
+        return (entry_head + encode_ofs_offset(len(previous_path) - common) +
+                path[common:] + b'\x00')
+    length = ((62 + len(path) + 8) // 8) * 8
+    return entry_head + path + b'\x00' * (length - 62 - len(path))
+
+
+def get_index_version():
+    """返回写索引时使用的版本(配置项index.version，默认2)。"""
+    version = int(get_config('index', 'version', '2'))
+    if version not in (2, 4):
+        raise ValueError('unsupported index.version {}'.format(version))
+    return version
+
+
+def write_index_data(num_entries, entry_chunks, extensions=None, lock=None,
+                     version=2):
+    """把已经编码的条目字节(和扩展字典)写到git索引文件中。数据先写进锁文件再
+    重命名，所以不会破坏其他地方仍在映射的旧索引；旧的索引日志随之失效。
+    lock是调用者已经持有的IndexLock，为None时自己加锁。返回新索引的校验和。
+    """
+    chunks = [struct.pack('!4sLL', b'DIRC', version, num_entries)]
+    chunks.extend(entry_chunks)
+    for signature, data in sorted((extensions or {}).items()):
+        if data:
+            chunks.append(struct.pack('!4sL', signature, len(data)) + data)
+    sha1 = hashlib.sha1()
+    for chunk in chunks:
+        sha1.update(chunk)
+    chunks.append(sha1.digest())
+    if lock is None:
+        with IndexLock() as lock:
+            lock.commit(b''.join(chunks))
+    else:
+        lock.commit(b''.join(chunks))
+    return chunks[-1]
+
+
+def write_index(entries, extensions=None, lock=None, version=None):
+    """将索引条目对象的列表(和扩展字典)写到git索引文件中。
+    version为None时使用配置的索引版本。
+    """
+    if version is None:
+        version = get_index_version()
+    if version == 4:
+        chunks = []
+        previous_path = b''
+        for entry in entries:
+            chunks.append(pack_index_entry(entry, previous_path))
+            previous_path = entry.path.encode()
+    else:
+        chunks = [pack_index_entry(e) for e in entries]
+    return write_index_data(len(entries), chunks, extensions, lock=lock,
+                            version=version)
+
+
+def update_index(index, new_entries, extensions=None, lock=None):
+    """把按路径排序的new_entries合并进已经打开的IndexFile并写回(相同路径的条目
+    被替换)。v2索引中没有变化的条目直接复制原始字节，不解码也不重新编码；
+    v4索引的路径依赖前一个条目，所以重新编码所有条目。
+    """
+    version = get_index_version()
+    if index.version != 2 or version != 2:
+        new_paths = {e.path for e in new_entries}
+        entries = [e for e in index if e.path not in new_paths]
+        entries.extend(new_entries)
+        entries.sort(key=operator.attrgetter('path'))
+        return write_index(entries, extensions, lock=lock, version=version)
+    chunks = []
+    num_entries = 0
+    pos = 0
+    for entry in new_entries:
+        i = index.bisect(entry.path)
+        chunks.append(index.raw(pos, i))
+        num_entries += i - pos
+        chunks.append(pack_index_entry(entry))
+        num_entries += 1
+        if i < len(index) and index.path_at(i) == entry.path:
+            i += 1
+        pos = i
+    chunks.append(index.raw(pos, len(index)))
+    num_entries += len(index) - pos
+    return write_index_data(num_entries, chunks, extensions, lock=lock)
+
+
+def expand_add_paths(paths, force=False):
+    """把add的参数展开成文件路径的列表：目录展开成其中没有被忽略的文件和
+    已经在索引中的文件。直接给出的被忽略的路径(已经在索引中的文件除外)
+    引发ValueError；force为True时不使用忽略规则。
+    """
+    matcher = None if force else IgnoreMatcher()
+    result = set()
+    ignored = []
+    with IndexFile() as index:
+        for path in paths:
+            path = os.path.normpath(path).replace('\\', '/')
+            if not os.path.isdir(path) or os.path.islink(path):
+                if matcher is not None and index.find(path) is None and \
+                        matcher.is_ignored(path, False):
+                    ignored.append(path)
+                else:
+                    result.add(path)
+                continue
+            tracked = []
+            if matcher is not None:
+                prefix = '' if path == '.' else path + '/'
+                i = index.bisect(prefix)
+                while i < len(index) and index.path_at(i).startswith(prefix):
+                    if os.path.isfile(index.path_at(i)):
+                        tracked.append(index.path_at(i))
+                    i += 1
+                if path != '.' and not tracked and matcher.is_ignored(path, True):
+                    ignored.append(path)
+                    continue
+            result.update(walk_working_copy([path], matcher))
+            result.update(tracked)
+    if ignored:
+        raise ValueError('the following paths are ignored by one of your .gitignore files:'
+                         '\n\t{}\nuse -f if you really want to add them'.format(
+                             '\n\t'.join(ignored)))
+    return sorted(result)
+
+
+def add(paths, jobs=1, force=False):
+    """将所有文件路径添加到git索引，目录中的文件也被添加，但是被.gitignore、
+    info/exclude忽略的文件除外(force为True时不使用忽略规则)。
+    jobs大于1时并发计算散列，结果按路径排序后写入索引，所以和串行添加的结果完全一样。
+    cache-tree中包含这些路径的目录被标记为失效。
+    如果配置了core.splitIndex，新条目只追加到索引日志中，直到日志中的条目
+    超过基础索引的splitIndex.maxPercentChange%(默认20)时才合并成完整的索引。
+    """
+    paths = expand_add_paths(paths, force=force)
+    sha1s = hash_files(paths, write=True, jobs=jobs)
+    new_entries = [entry_from_stat(path, bytes.fromhex(sha1), os.stat(path))
+                   for path, sha1 in zip(paths, sha1s)]
+    use_journal = get_config_bool('core', 'splitIndex')
+    max_percent = int(get_config('splitIndex', 'maxPercentChange', '20'))
+    with IndexLock() as lock, IndexFile() as index:
+        base_size = len(index) - index.journal_size
+        if use_journal and base_size and \
+                (index.journal_size + len(new_entries)) * 100 <= base_size * max_percent:
+            append_index_journal(index, new_entries, lock)
+            return
+        extensions = index.extensions()
+        cache_tree = parse_cache_tree(extensions.get(b'TREE', b''))
+        for path in paths:
+            invalidate_cache_tree(cache_tree, path)
+        extensions[b'TREE'] = build_cache_tree_data(cache_tree)
+        update_index(index, new_entries, extensions, lock=lock)
+
+
+def write_tree():
+    """从当前索引条目中写入树对象(包括所有子目录的树)，返回根树的sha - 1。
+    cache-tree中仍然有效的目录直接复用以前的sha - 1，不重新构建；
+    新的cache-tree写回索引。
+    """
+    with IndexLock() as lock:
+        return _write_tree(lock)
+
+
+def _write_tree(lock):
+    """在持有索引锁时执行write_tree。"""
+    entries, extensions = read_index_file()
+    cache_tree = parse_cache_tree(extensions.get(b'TREE', b''))
+    new_cache_tree = {}
+    reused = set()
+
+    def build(prefix, start, end):
+        dir_path = prefix[:-1]
+        entry_count, sha1 = cache_tree.get(dir_path, (-1, None))
+        if sha1 is not None and entry_count == end - start:
+            new_cache_tree[dir_path] = (entry_count, sha1)
+            reused.add(dir_path)
+            return sha1
+        tree_entries = []
+        i = start
+        while i < end:
+            name, sep, _ = entries[i].path[len(prefix):].partition('/')
+            if sep:
+                sub_prefix = prefix + name + '/'
+                j = i + 1
+                while j < end and entries[j].path.startswith(sub_prefix):
+                    j += 1
+                sub_sha1 = build(sub_prefix, i, j)
+                tree_entries.append(b'40000 ' + name.encode() + b'\x00' +
+                                    bytes.fromhex(sub_sha1))
+                i = j
+            else:
+                mode_path = '{:o} {}'.format(entries[i].mode, name).encode()
+                tree_entries.append(mode_path + b'\x00' + entries[i].sha1)
+                i += 1
+        sha1 = hash_object(b''.join(tree_entries), 'tree')
+        new_cache_tree[dir_path] = (end - start, sha1)
+        return sha1
+
+    sha1 = build('', 0, len(entries))
+    for path, value in cache_tree.items():
+        parent = path
+        while parent:
+            parent = parent.rpartition('/')[0]
+            if parent in reused and path not in new_cache_tree:
+                new_cache_tree[path] = value
+                break
+    if new_cache_tree != cache_tree:
+        extensions[b'TREE'] = build_cache_tree_data(new_cache_tree)
+        write_index(entries, extensions, lock=lock)
+    return sha1
+
+
+PACKED_REFS_HEADER = b'# pack-refs with: peeled fully-peeled sorted \n'
+ZERO_SHA1 = '0' * 40
+MAX_SYMREF_DEPTH = 5
+
+# push中一个远程引用的更新，sha - 1为None表示引用不存在(创建或删除)
+RefUpdate = collections.namedtuple('RefUpdate', ['name', 'old_sha1', 'new_sha1'])
+
+
+class RefTable:
+    """packed-refs文件在内存中的表：按名字排序的引用名列表和对应的sha - 1列表，
+    用二分查找解析引用和按前缀列出引用，不需要逐个打开文件。
+    peeled是附注标签的引用名 -> 标签最终指向的对象的sha - 1。
+    """
+
+    def __init__(self, names=(), sha1s=(), peeled=None):
+        self.names = list(names)
+        self.sha1s = list(sha1s)
+        self.peeled = peeled or {}
+
+    @classmethod
+    def parse(cls, data):
+        names, sha1s, peeled = [], [], {}
+        for line in data.decode().splitlines():
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('^'):
+                if not names:
+                    raise ValueError('peeled line without ref in packed-refs')
+                peeled[names[-1]] = line[1:]
+                continue
+            sha1, _, name = line.partition(' ')
+            if len(sha1) != 40 or not name:
+                raise ValueError('invalid packed-refs line {!r}'.format(line))
+            names.append(name)
+            sha1s.append(sha1)
+        if any(a >= b for a, b in zip(names, names[1:])):
+            # 其他工具写的packed-refs不一定排序
+            pairs = sorted(dict(zip(names, sha1s)).items())
+            names = [name for name, _ in pairs]
+            sha1s = [sha1 for _, sha1 in pairs]
+        return cls(names, sha1s, peeled)
+
+    def serialize(self):
+        lines = [PACKED_REFS_HEADER]
+        for name, sha1 in zip(self.names, self.sha1s):
+            lines.append('{} {}\n'.format(sha1, name).encode())
+            if name in self.peeled:
+                lines.append('^{}\n'.format(self.peeled[name]).encode())
+        return b''.join(lines)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name):
+        """返回引用的sha - 1，不存在时返回None。"""
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return self.sha1s[i]
+        return None
+
+    def items(self, prefix=''):
+        """按名字顺序生成以prefix开头的(引用名, sha - 1)。"""
+        i = bisect.bisect_left(self.names, prefix)
+        while i < len(self.names) and self.names[i].startswith(prefix):
+            yield (self.names[i], self.sha1s[i])
+            i += 1
+
+
+_packed_refs_cache = {}
+
+
+def read_packed_refs():
+    """返回packed-refs的RefTable(没有文件时为空表)。文件没有变化时复用已经解析的表。"""
+    path = os.path.abspath(os.path.join('.git', 'packed-refs'))
+    try:
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        key = None
+    cached = _packed_refs_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    table = RefTable.parse(read_file(path)) if key is not None else RefTable()
+    _packed_refs_cache[path] = (key, table)
+    return table
+
+
+def check_ref_name(name):
+    """检查引用名是否合法(git check-ref-format的主要规则)，不合法时抛出ValueError。"""
+    parts = name.split('/')
+    if (name != 'HEAD' and (len(parts) < 2 or parts[0] != 'refs')) or \
+            any(not part or part.startswith('.') or part.endswith('.lock') for part in parts) or \
+            '..' in name or '@{' in name or name.endswith('.') or \
+            any(c in name for c in ' ~^:?*[\\\x7f') or any(ord(c) < 32 for c in name):
+        raise ValueError('invalid ref name {!r}'.format(name))
+
+
+def ref_path(name):
+    return os.path.join('.git', *name.split('/'))
+
+
+def read_loose_ref(name):
+    """返回松散引用文件的内容(去掉换行符)，文件不存在时返回None。"""
+    try:
+        return read_file(ref_path(name)).decode().strip()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+
+
+def resolve_ref_name(name):
+    """跟随符号引用(例如HEAD -> refs/heads/master)，返回最终的引用名。"""
+    for _ in range(MAX_SYMREF_DEPTH):
+        value = read_loose_ref(name)
+        if value is None or not value.startswith('ref: '):
+            return name
+        name = value[5:]
+    raise ValueError('too many levels of symbolic refs at {!r}'.format(name))
+
+
+def read_ref(name):
+    """返回引用(可以是符号引用)指向的sha - 1，引用不存在时返回None。
+    先找松散引用文件，再在packed-refs的表中查找。
+    """
+    name = resolve_ref_name(name)
+    value = read_loose_ref(name)
+    if value is not None:
+        return value
+    return read_packed_refs().get(name)
+
+
+def read_symbolic_ref(name='HEAD'):
+    """返回符号引用指向的引用名，不是符号引用(例如分离的HEAD)时返回None。"""
+    value = read_loose_ref(name)
+    if value is not None and value.startswith('ref: '):
+        return value[5:]
+    return None
+
+
+def write_symbolic_ref(name, target):
+    """把符号引用(例如HEAD)指向给定的引用名。"""
+    check_ref_name(target)
+    with LockFile(ref_path(name)) as lock:
+        lock.commit('ref: {}\n'.format(target).encode())
+
+
+def update_ref(name, sha1, old_sha1=None):
+    """把引用(符号引用则更新它指向的引用)设为sha1，用锁文件保证原子性。
+    给定old_sha1时，引用的当前值必须等于它(ZERO_SHA1表示引用必须不存在)，
+    否则抛出ValueError。
+    """
+    name = resolve_ref_name(name)
+    check_ref_name(name)
+    path = ref_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with LockFile(path) as lock:
+        if old_sha1 is not None:
+            current = read_ref(name) or ZERO_SHA1
+            if current != old_sha1:
+                raise ValueError('ref {} is at {}, expected {}'.format(name, current, old_sha1))
+        lock.commit((sha1 + '\n').encode())
+
+
+def delete_ref(name):
+    """删除引用(松散引用文件和packed-refs中的记录)，引用不存在时抛出ValueError。"""
+    check_ref_name(name)
+    table = read_packed_refs()
+    packed = table.get(name) is not None
+    if not packed and read_loose_ref(name) is None:
+        raise ValueError('ref {} not found'.format(name))
+    if packed:
+        packed_path = os.path.join('.git', 'packed-refs')
+        with LockFile(packed_path) as lock:
+            table = read_packed_refs()
+            pairs = [(n, s) for n, s in table.items() if n != name]
+            peeled = {n: s for n, s in table.peeled.items() if n != name}
+            lock.commit(RefTable([n for n, _ in pairs], [s for _, s in pairs],
+                                 peeled).serialize())
+    try:
+        os.remove(ref_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def list_loose_refs(prefix='refs/'):
+    """返回以prefix开头的松散引用的字典(引用名 -> sha - 1)，只遍历prefix所在的目录。"""
+    refs = {}
+    base = prefix[:prefix.rfind('/') + 1] if '/' in prefix else ''
+    for root, dirs, files in os.walk(ref_path(base.rstrip('/') or 'refs')):
+        dirs.sort()
+        for name in files:
+            if name.endswith('.lock'):
+                continue
+            ref = os.path.relpath(os.path.join(root, name), '.git').replace(os.sep, '/')
+            if ref.startswith(prefix):
+                value = read_loose_ref(ref)
+                if value is not None and not value.startswith('ref: '):
+                    refs[ref] = value
+    return refs
+
+
+def list_refs(prefix='refs/'):
+    """返回以prefix开头的所有引用，按名字排序的(引用名, sha - 1)列表。
+    松散引用优先于packed-refs中的同名引用。
+    """
+    refs = dict(read_packed_refs().items(prefix))
+    refs.update(list_loose_refs(prefix))
+    return sorted(refs.items())
+
+
+def peel(sha1):
+    """跟随标签对象，返回tuple(对象类型, sha - 1)：第一个不是标签的对象。"""
+    while True:
+        obj_type, data = read_object(sha1)
+        if obj_type != 'tag':
+            return (obj_type, sha1)
+        sha1 = data.split(b'\n', 1)[0].split()[1].decode()
+
+
+def pack_refs():
+    """把所有引用写进packed-refs(附注标签带上剥离后的sha - 1)，然后删除松散引用文件。
+    返回打包的引用数量。
+    """
+    packed_path = os.path.join('.git', 'packed-refs')
+    with LockFile(packed_path) as lock:
+        old_peeled = read_packed_refs().peeled
+        loose = list_loose_refs()
+        refs = list_refs()
+        peeled = {}
+        for name, sha1 in refs:
+            if name not in loose:
+                if name in old_peeled:
+                    peeled[name] = old_peeled[name]
+                continue
+            target = peel(sha1)[1]
+            if target != sha1:
+                peeled[name] = target
+        lock.commit(RefTable([n for n, _ in refs], [s for _, s in refs], peeled).serialize())
+    for name, sha1 in loose.items():
+        # 只删除打包之后没有被修改过的引用
+        with LockFile(ref_path(name)):
+            if read_loose_ref(name) == sha1:
+                os.remove(ref_path(name))
+    for root, dirs, files in os.walk(os.path.join('.git', 'refs'), topdown=False):
+        for name in dirs:
+            path = os.path.join(root, name)
+            if path not in (os.path.join('.git', 'refs', 'heads'),
+                            os.path.join('.git', 'refs', 'tags')) and not os.listdir(path):
+                os.rmdir(path)
+    return len(refs)
+
+
+def expand_ref_name(name):
+    """把简写的引用名展开成存在的完整引用名(按git的顺序查找)，找不到时返回None。"""
+    if name == 'HEAD':
+        return resolve_ref_name('HEAD')
+    for candidate in [name, 'refs/' + name, 'refs/tags/' + name,
+                      'refs/heads/' + name, 'refs/remotes/' + name]:
+        if candidate.startswith('refs/') and read_ref(candidate) is not None:
+            return candidate
+    return None
+
+
+def resolve_revision(revision):
+    """把引用名(HEAD、分支、标签，可以简写)或sha - 1前缀解析成完整的sha - 1。"""
+    name = expand_ref_name(revision)
+    if name is not None:
+        sha1 = read_ref(name)
+        if sha1 is not None:
+            return sha1
+    return resolve_sha1(revision)
+
+
+def get_head_hash():
+    """获取HEAD(当前分支或分离的HEAD)指向的提交哈希，还没有提交时返回None。"""
+    return read_ref('HEAD')
+
+
+def get_local_master_hash():
+    """获取本地主分支的当前提交哈希(sha - 1字符串)。"""
+    return read_ref('refs/heads/master')
+
+
+def get_author_time():
+    """返回当前时间的git格式(时间戳和时区，例如'1500000000 +0800')。"""
+    timestamp = int(time.mktime(time.localtime()))
+    utc_offset = -time.timezone
+    return '{} {}{:02}{:02}'.format(
+        timestamp,
+        '+' if utc_offset > 0 else '-',
+        abs(utc_offset) // 3600,
+        (abs(utc_offset) // 60) % 60)
+
+
+def get_default_author():
+    return '{} <{}>'.format(os.environ['GIT_AUTHOR_NAME'], os.environ['GIT_AUTHOR_EMAIL'])
+
+
+def commit(message, author=None):
+    """使用给定的消息提交索引的当前状态，更新当前分支。提交对象的返回散列。
+    """
+    tree = write_tree()
+    parent = get_head_hash()
+    if author is None:
+        author = get_default_author()
+    author_time = get_author_time()
+    lines = ['tree ' + tree]
+    if parent:
+        lines.append('parent ' + parent)
+    lines.append('author {} {}'.format(author, author_time))
+    lines.append('committer {} {}'.format(author, author_time))
+    lines.append('')
+    lines.append(message)
+    lines.append('')
+    data = '\n'.join(lines).encode()
+    sha1 = hash_object(data, 'commit')
+    update_ref('HEAD', sha1, old_sha1=parent or ZERO_SHA1)
+    branch = read_symbolic_ref('HEAD')
+    print('committed to {}: {:7}'.format(
+        branch[len('refs/heads/'):] if branch else 'detached HEAD', sha1))
+    return sha1
+
+
+def branch(name=None, start_point=None, delete=False):
+    """创建(从start_point，默认HEAD)或删除分支；没有给出名字时列出所有分支。"""
+    if name is None:
+        current = read_symbolic_ref('HEAD')
+        for ref, sha1 in list_refs('refs/heads/'):
+            print('{} {}'.format('*' if ref == current else ' ', ref[len('refs/heads/'):]))
+        return None
+    ref = 'refs/heads/' + name
+    check_ref_name(ref)
+    if delete:
+        if ref == read_symbolic_ref('HEAD'):
+            raise ValueError('cannot delete the current branch {!r}'.format(name))
+        delete_ref(ref)
+        return None
+    sha1 = resolve_revision(start_point or 'HEAD')
+    if read_object(sha1)[0] != 'commit':
+        raise ValueError('{!r} is not a commit'.format(start_point))
+    update_ref(ref, sha1, old_sha1=ZERO_SHA1)
+    return sha1
+
+
+def tag(name=None, target=None, message=None, author=None, delete=False):
+    """创建标签(给出message时创建附注标签对象)或删除标签；没有给出名字时列出所有标签。
+    返回标签引用指向的sha - 1。
+    """
+    if name is None:
+        for ref, _ in list_refs('refs/tags/'):
+            print(ref[len('refs/tags/'):])
+        return None
+    ref = 'refs/tags/' + name
+    check_ref_name(ref)
+    if delete:
+        delete_ref(ref)
+        return None
+    sha1 = resolve_revision(target or 'HEAD')
+    if message is not None:
+        if author is None:
+            author = get_default_author()
+        data = 'object {}\ntype {}\ntag {}\ntagger {} {}\n\n{}\n'.format(
+            sha1, read_object(sha1)[0], name, author, get_author_time(), message)
+        sha1 = hash_object(data.encode(), 'tag')
+    update_ref(ref, sha1, old_sha1=ZERO_SHA1)
+    return sha1
+
+
+class Pkt(enum.Enum):
+    """pkt-line协议中的特殊包(长度字段为0000、0001和0002，没有数据)。"""
+    flush = 0
+    delim = 1
+    response_end = 2
+
+
+FLUSH_PKT = b'0000'
+DELIM_PKT = b'0001'
+MAX_PKT_DATA = 65516
+
+
+def pkt_line(data):
+    """把数据编码成一个pkt-line(不添加换行符)。"""
+    if len(data) > MAX_PKT_DATA:
+        raise ValueError('pkt-line data too long ({} bytes)'.format(len(data)))
+    return b'%04x' % (len(data) + 4) + data
+
+
+def build_lines_data(lines, flush=True):
+    """把给定的行(字节，需要换行符的话由调用者加上)编码成pkt-line数据，
+    flush为True时最后加上flush-pkt。
+    """
+    result = [pkt_line(line) for line in lines]
+    if flush:
+        result.append(FLUSH_PKT)
+    return b''.join(result)
+
+
+class PktLineParser:
+    """增量的pkt-line解析器：feed()任意大小的数据块，next()返回下一个完整的包
+    (数据包是memoryview，特殊包是Pkt)，数据还不完整时返回None。
+    数据包完整地落在一个数据块中时直接返回该块的切片，不复制数据；
+    只有跨越数据块边界的包才需要把几个数据块拼接起来。
+    """
+
+    def __init__(self):
+        self.buffer = b''
+        self.view = memoryview(self.buffer)
+        self.pos = 0
+        self.pending = collections.deque()
+        self.size = 0
+
+    def feed(self, data):
+        if data:
+            self.pending.append(data)
+            self.size += len(data)
+
+    def fill(self, size):
+        """保证当前数据块中至少有size个未解析的字节(调用者保证数据足够)。"""
+        tail = self.view[self.pos:]
+        if not tail and len(self.pending[0]) >= size:
+            self.buffer = self.pending.popleft()
+        else:
+            parts = [tail]
+            have = len(tail)
+            while have < size:
+                chunk = self.pending.popleft()
+                parts.append(chunk)
+                have += len(chunk)
+            self.buffer = b''.join(parts)
+        self.view = memoryview(self.buffer)
+        self.pos = 0
+
+    def next(self):
+        if len(self.buffer) - self.pos < 4:
+            if self.size < 4:
+                return None
+            self.fill(4)
+        pos = self.pos
+        header = self.buffer[pos:pos + 4]
+        try:
+            length = int(header, 16)
+        except ValueError:
+            raise ValueError('invalid pkt-line header {!r}'.format(bytes(header))) from None
+        if length < 4:
+            if length == 3:
+                raise ValueError('invalid pkt-line length 3')
+            self.pos += 4
+            self.size -= 4
+            return Pkt(length)
+        if len(self.buffer) - pos < length:
+            if self.size < length:
+                return None
+            self.fill(length)
+            pos = 0
+        self.pos = pos + length
+        self.size -= length
+        return self.view[pos + 4:pos + length]
+
+    def unparsed(self):
+        """消费并返回剩下的(没有按pkt-line解析的)数据块列表。"""
+        chunks = [self.view[self.pos:]] + list(self.pending)
+        self.__init__()
+        return [chunk for chunk in chunks if chunk]
+
+
+class PktLineReader:
+    """从文件对象(例如HTTP响应)中增量地读取pkt-line，不需要整个响应在内存中。
+    有read1()时使用它，所以不会为了凑满一块而等待(进度信息可以及时显示)。
+    """
+
+    def __init__(self, f, chunk_size=65536):
+        self.f = f
+        self.read_chunk = getattr(f, 'read1', f.read)
+        self.chunk_size = chunk_size
+        self.parser = PktLineParser()
+
+    def read(self):
+        """返回下一个包(数据包是memoryview，特殊包是Pkt)，流结束时返回None。"""
+        while True:
+            packet = self.parser.next()
+            if packet is not None:
+                return packet
+            chunk = self.read_chunk(self.chunk_size)
+            if not chunk:
+                if self.parser.size:
+                    raise ValueError('truncated pkt-line stream')
+                return None
+            self.parser.feed(chunk)
+
+    def __iter__(self):
+        while True:
+            packet = self.read()
+            if packet is None:
+                return
+            yield packet
+
+    def read_lines(self):
+        """读取数据包直到flush-pkt或delim-pkt，返回字节串的列表。"""
+        lines = []
+        for packet in self:
+            if isinstance(packet, Pkt):
+                return lines
+            lines.append(bytes(packet))
+        raise ValueError('unexpected end of pkt-line stream')
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def iter_remaining(self):
+        """逐块生成剩下的原始数据(pkt-line部分之后的数据，例如没有side-band的包文件)。"""
+        yield from self.parser.unparsed()
+        while True:
+            chunk = self.read_chunk(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+HTTP_TIMEOUT = 60
+_connections = {}
+
+
+class HttpResponse:
+    """HTTP响应的包装。响应读完后连接留给同一个服务器的下一个请求复用
+    (keep-alive)；没有读完就关闭时同时关闭连接，下一个请求会重新连接。
+    """
+
+    def __init__(self, connection, response):
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+
+    def read(self, size=-1):
+        return self.response.read(None if size < 0 else size)
+
+    def read1(self, size=-1):
+        return self.response.read1(size)
+
+    def close(self):
+        # read1()读完Content-Length后不会自动关闭响应，length为0说明已经读完
+        if not self.response.isclosed() and self.response.length != 0:
+            self.connection.close()
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_connection(url):
+    """返回给定URL的服务器的持久连接(按scheme和主机缓存)。"""
+    scheme, netloc = urllib.parse.urlsplit(url)[:2]
+    connection = _connections.get((scheme, netloc))
+    if connection is None:
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(netloc, timeout=HTTP_TIMEOUT)
+        elif scheme == 'http':
+            connection = http.client.HTTPConnection(netloc, timeout=HTTP_TIMEOUT)
+        else:
+            raise ValueError('unsupported URL scheme {!r}'.format(scheme))
+        _connections[(scheme, netloc)] = connection
+    return connection
+
+
+def http_open(url, username=None, password=None, data=None, content_type=None):
+    """对给定的URL发送HTTP请求(data不是None时为POST)，返回HttpResponse，
+    由调用者逐块读取。同一个服务器的请求复用同一个keep-alive连接。
+    data可以是字节，也可以是数据块的迭代器(用分块传输编码边生成边发送)。
+    给出username时直接发送Basic认证头，因为流式的请求体不能在401后重发。
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    headers = {'User-Agent': 'git/pygit'}
+    if username is not None:
+        credentials = '{}:{}'.format(username, password).encode()
+        headers['Authorization'] = 'Basic ' + base64.b64encode(credentials).decode()
+    if content_type is not None:
+        headers['Content-Type'] = content_type
+    connection = get_connection(url)
+    replayable = data is None or isinstance(data, bytes)
+    for attempt in range(2):
+        try:
+            connection.request('GET' if data is None else 'POST', path,
+                               body=data, headers=headers)
+            response = connection.getresponse()
+            break
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            # 服务器关闭了空闲的keep-alive连接，可以重发的请求重新连接后再试一次
+            connection.close()
+            if attempt or not replayable:
+                raise
+    if response.status != 200:
+        response.read()
+        raise ValueError('HTTP error {} {} for {}'.format(
+            response.status, response.reason, url))
+    return HttpResponse(connection, response)
+
+
+def http_request(url, username, password, data=None):
+    """对给定的URL进行一个经过验证的HTTP请求(默认情况下，如果“数据”不是没有的话)。
+    """
+    with http_open(url, username, password, data=data) as f:
+        return f.read()
+
+
+def coalesce_chunks(chunks, chunk_size=65536):
+    """把小的数据块合并成至少chunk_size字节的块(最后一块可能更小)。"""
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def read_ref_advertisement(f, service):
+    """读取智能HTTP协议的引用通告(info/refs的响应)，返回tuple(refs, capabilities)，
+    refs是引用名 -> sha - 1(十六进制字符串)的字典，引用的数量没有限制。
+    """
+    reader = PktLineReader(f)
+    lines = reader.read_lines()
+    if lines != ['# service={}\n'.format(service).encode()]:
+        raise ValueError('unexpected service announcement {!r}'.format(lines))
+    refs = {}
+    capabilities = set()
+    for i, line in enumerate(reader.read_lines()):
+        if i == 0:
+            line, _, caps = line.partition(b'\x00')
+            capabilities = set(caps.decode().split())
+        sha1, _, name = line.decode().rstrip('\n').partition(' ')
+        if name != 'capabilities^{}':
+            refs[name] = sha1
+    return refs, capabilities
+
+
+def get_remote_refs(git_url, username=None, password=None, service='git-upload-pack'):
+    """获取远程仓库的引用和服务器支持的功能，返回tuple(refs, capabilities)。"""
+    url = git_url + '/info/refs?service=' + service
+    with http_open(url, username, password) as f:
+        return read_ref_advertisement(f, service)
+
+
+def get_remote_info(git_url, username, password):
+    """获取远程主分支的提交哈希和服务器支持的功能，
+    返回tuple(sha - 1十六进制字符串或None, capabilities集合)。
+    """
+    refs, capabilities = get_remote_refs(git_url, username, password,
+                                         service='git-receive-pack')
+    return (refs.get('refs/heads/master'), capabilities)
+
+
+def get_remote_master_hash(git_url, username, password):
+    """获取远程主分支的提交哈希，返回sha - 1十六进制字符串或没有远程提交。
+    """
+    return get_remote_info(git_url, username, password)[0]
+
+
+def read_tree(sha1=None, data=None):
+    """使用给定的sha - 1(十六进制字符串)或数据读取树对象，并返回(模式、路径、sha1)元组的列表。
+    条目的数量没有限制，路径中可以有空格。
+    """
+    if sha1 is not None:
+        obj_type, data = read_object(sha1)
+        assert obj_type == 'tree'
+    elif data is None:
+        raise TypeError('must specify "sha1" or "data"')
+    i = 0
+    entries = []
+    while True:
+        end = data.find(b'\x00', i)
+        if end == -1:
+            break
+        mode_str, _, path = data[i:end].partition(b' ')
+        entries.append((int(mode_str, 8), path.decode(), data[end + 1:end + 21].hex()))
+        i = end + 21
+    return entries
+
+
+def parse_commit(data):
+    """把提交对象的数据字节解析成Commit。"""
+    header, _, message = data.decode().partition('\n\n')
+    tree = None
+    parents = []
+    author = committer = ''
+    for line in header.splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'tree':
+            tree = value
+        elif key == 'parent':
+            parents.append(value)
+        elif key == 'author':
+            author = value
+        elif key == 'committer':
+            committer = value
+    commit_time = int(committer.rsplit(' ', 2)[1]) if committer else 0
+    return Commit(tree, tuple(parents), author, committer, commit_time, message)
+
+
+def read_commit(sha1):
+    """读取并解析给定sha - 1的提交对象。"""
+    obj_type, data = read_object(sha1)
+    assert obj_type == 'commit', 'expected commit object, got {}'.format(obj_type)
+    return parse_commit(data)
+
+
+GRAPH_PARENT_NONE = 0x70000000
+GRAPH_EXTRA_EDGES = 0x80000000
+GRAPH_LAST_EDGE = 0x80000000
+GRAPH_MAX_GENERATION = 0x3fffffff
+
+
+class CommitGraph:
+    """内存映射的提交图文件(.git/objects/info/commit-graph)，格式和git的
+    Documentation/technical/commit-graph-format.txt一致：OIDF扇出表、
+    OIDL排好序的sha - 1、CDAT定长记录(树、父提交位置、代数和提交时间)
+    以及EDGE(多于两个父提交时)。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version, hash_version, num_chunks, _ = struct.unpack_from(
+            '!4sBBBB', self.data, 0)
+        assert signature == b'CGPH' and version == 1 and hash_version == 1, \
+            'unsupported commit-graph {}'.format(path)
+        self.chunks = {}
+        for i in range(num_chunks):
+            chunk_id, offset = struct.unpack_from('!4sQ', self.data, 8 + 12 * i)
+            self.chunks[chunk_id] = offset
+        self.fanout = struct.unpack_from('!256L', self.data, self.chunks[b'OIDF'])
+        self.num_commits = self.fanout[255]
+
+    def close(self):
+        self.data.close()
+
+    def sha1_at(self, i):
+        """返回第i个提交的sha - 1(20字节)。"""
+        start = self.chunks[b'OIDL'] + 20 * i
+        return self.data[start:start + 20]
+
+    def index_of(self, sha1):
+        """返回给定sha - 1(十六进制字符串)在提交图中的位置，不存在时返回None。"""
+        digest = bytes.fromhex(sha1)
+        first = digest[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_sha1 = self.sha1_at(mid)
+            if mid_sha1 < digest:
+                lo = mid + 1
+            elif mid_sha1 > digest:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def node_at(self, i):
+        """返回第i个提交的CommitNode。"""
+        start = self.chunks[b'CDAT'] + 36 * i
+        tree = self.data[start:start + 20].hex()
+        parent1, parent2, gen_time, time_low = struct.unpack_from(
+            '!LLLL', self.data, start + 20)
+        parents = []
+        if parent1 != GRAPH_PARENT_NONE:
+            parents.append(self.sha1_at(parent1).hex())
+        if parent2 & GRAPH_EXTRA_EDGES:
+            edge = self.chunks[b'EDGE'] + 4 * (parent2 & ~GRAPH_EXTRA_EDGES)
+            while True:
+                parent, = struct.unpack_from('!L', self.data, edge)
+                parents.append(self.sha1_at(parent & ~GRAPH_LAST_EDGE).hex())
+                if parent & GRAPH_LAST_EDGE:
+                    break
+                edge += 4
+        elif parent2 != GRAPH_PARENT_NONE:
+            parents.append(self.sha1_at(parent2).hex())
+        commit_time = ((gen_time & 3) << 32) | time_low
+        return CommitNode(tree, tuple(parents), commit_time, gen_time >> 2)
+
+    def get(self, sha1):
+        """返回给定提交的CommitNode，不在提交图中时返回None。"""
+        i = self.index_of(sha1)
+        return None if i is None else self.node_at(i)
+
+
+_graph_cache = {}
+
+
+def get_commit_graph():
+    """返回当前仓库的CommitGraph，没有提交图文件时返回None。
+    文件没有变化时复用已经打开的内存映射。
+    """
+    path = os.path.abspath(os.path.join('.git', 'objects', 'info', 'commit-graph'))
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    cached = _graph_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if cached is not None and cached[1] is not None:
+        cached[1].close()
+    graph = CommitGraph(path) if mtime is not None else None
+    _graph_cache[path] = (mtime, graph)
+    return graph
+
+
+def get_commit_node(sha1):
+    """返回给定提交的CommitNode：优先从提交图中读取，
+    不在提交图中时解析提交对象(generation为None)。
+    """
+    graph = get_commit_graph()
+    if graph is not None:
+        node = graph.get(sha1)
+        if node is not None:
+            return node
+    commit = read_commit(sha1)
+    return CommitNode(commit.tree, commit.parents, commit.commit_time, None)
+
+
+def find_ref_commits():
+    """返回所有引用(松散的和packed-refs中的)指向的提交的sha - 1集合，标签被剥离到提交。"""
+    commits = set()
+    for name, sha1 in list_refs():
+        obj_type, sha1 = peel(sha1)
+        if obj_type == 'commit':
+            commits.add(sha1)
+    return commits
+
+
+def write_commit_graph():
+    """把所有引用可以到达的提交写进提交图文件，返回提交的数量。"""
+    nodes = {}
+    stack = list(find_ref_commits())
+    while stack:
+        sha1 = stack.pop()
+        if sha1 in nodes:
+            continue
+        nodes[sha1] = get_commit_node(sha1)
+        stack.extend(p for p in nodes[sha1].parents if p not in nodes)
+    generations = {}
+    for start in nodes:
+        stack = [start]
+        while stack:
+            sha1 = stack[-1]
+            if sha1 in generations:
+                stack.pop()
+                continue
+            pending = [p for p in nodes[sha1].parents if p not in generations]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            generations[sha1] = min(GRAPH_MAX_GENERATION, 1 + max(
+                (generations[p] for p in nodes[sha1].parents), default=0))
+    shas = sorted(nodes)
+    positions = {sha1: i for i, sha1 in enumerate(shas)}
+    fanout = [0] * 256
+    for sha1 in shas:
+        fanout[int(sha1[:2], 16)] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    records = []
+    edges = []
+    for sha1 in shas:
+        node = nodes[sha1]
+        parents = [positions[p] for p in node.parents]
+        parent1 = parents[0] if parents else GRAPH_PARENT_NONE
+        if len(parents) <= 1:
+            parent2 = GRAPH_PARENT_NONE
+        elif len(parents) == 2:
+            parent2 = parents[1]
+        else:
+            parent2 = GRAPH_EXTRA_EDGES | len(edges)
+            edges.extend(parents[1:-1])
+            edges.append(GRAPH_LAST_EDGE | parents[-1])
+        gen_time = (generations[sha1] << 2) | ((node.commit_time >> 32) & 3)
+        records.append(bytes.fromhex(node.tree) + struct.pack(
+            '!LLLL', parent1, parent2, gen_time, node.commit_time & 0xffffffff))
+    chunks = [
+        (b'OIDF', struct.pack('!256L', *fanout)),
+        (b'OIDL', b''.join(bytes.fromhex(sha1) for sha1 in shas)),
+        (b'CDAT', b''.join(records)),
+    ]
+    if edges:
+        chunks.append((b'EDGE', struct.pack('!{}L'.format(len(edges)), *edges)))
+    header = struct.pack('!4sBBBB', b'CGPH', 1, 1, len(chunks), 0)
+    offset = len(header) + 12 * (len(chunks) + 1)
+    table = []
+    for chunk_id, chunk in chunks:
+        table.append(struct.pack('!4sQ', chunk_id, offset))
+        offset += len(chunk)
+    table.append(struct.pack('!4sQ', b'\x00' * 4, offset))
+    contents = header + b''.join(table) + b''.join(c for _, c in chunks)
+    info_dir = os.path.join('.git', 'objects', 'info')
+    os.makedirs(info_dir, exist_ok=True)
+    write_file_atomic(os.path.join(info_dir, 'commit-graph'),
+                      contents + hashlib.sha1(contents).digest())
+    return len(shas)
+
+
+def is_ancestor(ancestor, descendant):
+    """如果ancestor是descendant的祖先(或者就是它本身)则返回True。
+    有提交图时，代数不大于ancestor的提交不再向下遍历。
+    """
+    generation = get_commit_node(ancestor).generation
+    seen = set()
+    stack = [descendant]
+    while stack:
+        sha1 = stack.pop()
+        if sha1 == ancestor:
+            return True
+        if sha1 in seen:
+            continue
+        seen.add(sha1)
+        node = get_commit_node(sha1)
+        if generation is not None and node.generation is not None and \
+                node.generation <= generation:
+            continue
+        stack.extend(node.parents)
+    return False
+
+
+def iter_history(start_sha1):
+    """按提交时间从新到旧返回start_sha1可以到达的所有提交的sha - 1。"""
+    seen = {start_sha1}
+    queue = [(-get_commit_node(start_sha1).commit_time, start_sha1)]
+    while queue:
+        _, sha1 = heapq.heappop(queue)
+        yield sha1
+        for parent in get_commit_node(sha1).parents:
+            if parent not in seen:
+                seen.add(parent)
+                heapq.heappush(queue, (-get_commit_node(parent).commit_time, parent))
+
+
+def format_git_time(value):
+    """把提交中的'时间戳 时区'格式化成git log的日期格式。"""
+    timestamp, tz = value.split()
+    offset = int(tz[1:3]) * 3600 + int(tz[3:5]) * 60
+    if tz[0] == '-':
+        offset = -offset
+    t = time.gmtime(int(timestamp) + offset)
+    return time.strftime('%a %b %d %H:%M:%S %Y', t) + ' ' + tz
+
+
+def log(start_sha1=None, max_count=None, oneline=False):
+    """显示从给定提交(默认是HEAD)开始的提交历史。"""
+    if start_sha1 is None:
+        start_sha1 = get_head_hash()
+        if start_sha1 is None:
+            return
+    for i, sha1 in enumerate(iter_history(start_sha1)):
+        if max_count is not None and i >= max_count:
+            break
+        commit = read_commit(sha1)
+        if oneline:
+            print('{:7} {}'.format(sha1, commit.message.split('\n', 1)[0]))
+            continue
+        if i:
+            print()
+        author, _, author_time = commit.author.rpartition('> ')
+        print('commit {}'.format(sha1))
+        if len(commit.parents) > 1:
+            print('Merge: {}'.format(' '.join(p[:7] for p in commit.parents)))
+        print('Author: {}>'.format(author))
+        print('Date:   {}'.format(format_git_time(author_time)))
+        print()
+        for line in commit.message.rstrip('\n').split('\n'):
+            print('    ' + line if line else '')
+
+
+def find_tree_objects(tree_sha1, exclude=None):
+    """返回树中的所有对象的sha - 1散列(递归地)，包括树本身的散列。
+    exclude中的对象(以及exclude中的子树下面的所有对象)被跳过。
+    """
+    if exclude is None:
+        exclude = set()
+    objects = set()
+    stack = [tree_sha1]
+    while stack:
+        sha1 = stack.pop()
+        if sha1 in objects or sha1 in exclude:
+            continue
+        objects.add(sha1)
+        for mode, path, child in read_tree(sha1=sha1):
+            if stat.S_ISDIR(mode):
+                stack.append(child)
+            elif mode != 0o160000 and child not in exclude:
+                objects.add(child)
+    return objects
+
+
+def find_commit_objects(commit_sha1):
+    """返回集合中的所有对象的sha - 1散列(递归地)、它的树、它的父类以及提交本身的散列。
+    """
+    objects = set()
+    stack = [commit_sha1]
+    while stack:
+        sha1 = stack.pop()
+        if sha1 in objects:
+            continue
+        objects.add(sha1)
+        node = get_commit_node(sha1)
+        objects.update(find_tree_objects(node.tree, exclude=objects))
+        stack.extend(node.parents)
+    return objects
+
+
+def walk_new_commits(wants, haves):
+    """找出从wants可以到达、但从haves不能到达的提交，返回tuple(new_commits,
+    boundary_commits)，boundary_commits是新提交的已有父提交加上haves。按提交时间从新到旧遍历，一旦队列中只剩下haves可以到达的
+    提交就停止，所以代价和新提交的数量成正比，而不是和整个历史成正比。
+    本地不存在的haves被忽略。
+    """
+    uninteresting = {}
+    processed = set()
+    queue = []
+    oldest_new = None
+
+    def push(sha1, is_uninteresting):
+        if sha1 in uninteresting:
+            if not is_uninteresting or uninteresting[sha1]:
+                return
+            processed.discard(sha1)
+        uninteresting[sha1] = is_uninteresting
+        heapq.heappush(queue, (-get_commit_node(sha1).commit_time, sha1))
+
+    for sha1 in haves:
+        try:
+            push(sha1, True)
+        except ValueError:
+            pass
+    for sha1 in wants:
+        push(sha1, False)
+    while queue:
+        # 只剩下已有的提交时，继续遍历到比最老的新提交更老为止，
+        # 以免漏掉从它们可以到达的"新"提交
+        if all(uninteresting[sha1] for _, sha1 in queue) and \
+                (oldest_new is None or -queue[0][0] < oldest_new):
+            break
+        neg_time, sha1 = heapq.heappop(queue)
+        if sha1 in processed:
+            continue
+        processed.add(sha1)
+        if not uninteresting[sha1]:
+            oldest_new = -neg_time if oldest_new is None else min(oldest_new, -neg_time)
+        for parent in get_commit_node(sha1).parents:
+            push(parent, uninteresting[sha1])
+    new_commits = [sha1 for sha1 in processed if not uninteresting[sha1]]
+    boundary = {sha1 for sha1 in haves if uninteresting.get(sha1)}
+    for sha1 in new_commits:
+        boundary.update(p for p in get_commit_node(sha1).parents if uninteresting[p])
+    return (new_commits, sorted(boundary))
+
+
+def find_missing_objects(local_sha1, remote_sha1):
+    """返回在远程(基于给定的远程提交散列)的本地提交中丢失的对象的sha - 1散列。
+    local_sha1和remote_sha1可以是单个散列(remote_sha1可以是None)或散列的列表，
+    标签对象会被剥离(本地的标签对象本身也算作丢失的对象)。
+    只遍历远程没有的提交；边界提交(远程已有的)的树被当作已有对象，
+    新提交的树中和它们相同的子树不再展开。
+    有可达性位图时，本地和远程可以到达的对象都从位图得到(只遍历到有位图的提交
+    为止)，结果是两者的AND-NOT。
+    """
+    if isinstance(local_sha1, str):
+        local_sha1 = [local_sha1]
+    if remote_sha1 is None:
+        remote_sha1 = []
+    elif isinstance(remote_sha1, str):
+        remote_sha1 = [remote_sha1]
+    objects = set()
+    wants = []
+    for sha1 in local_sha1:
+        while True:
+            obj_type, data = read_object(sha1)
+            if obj_type != 'tag':
+                break
+            objects.add(sha1)
+            sha1 = data.split(b'\n', 1)[0].split()[1].decode()
+        if obj_type == 'commit':
+            wants.append(sha1)
+        else:
+            objects.update(find_tree_objects(sha1) if obj_type == 'tree' else [sha1])
+    haves = []
+    for sha1 in remote_sha1:
+        try:
+            obj_type, sha1 = peel(sha1)
+        except ValueError:
+            continue
+        if obj_type == 'commit':
+            haves.append(sha1)
+    objects.difference_update(remote_sha1)
+    bitmap = get_bitmap_index()
+    if bitmap is not None:
+        have = bitmap.reachable(haves)
+        bits, extra = bitmap.reachable(wants, have)
+        objects.update(bitmap.objects(bits & ~have[0]))
+        objects.update(extra)
+        return objects
+    new_commits, boundary = walk_new_commits(wants, haves)
+    seen = set(boundary)
+    for sha1 in boundary:
+        seen.update(find_tree_objects(get_commit_node(sha1).tree, exclude=seen))
+    objects.difference_update(seen)
+    for sha1 in new_commits:
+        found = find_tree_objects(get_commit_node(sha1).tree, exclude=seen)
+        found.add(sha1)
+        objects.update(found)
+        seen.update(found)
+    return objects
+
+
+def encode_pack_object(obj):
+    """为包文件和返回字节(后面是压缩的数据字节)编码单个对象。
+    """
+    obj_type, data = read_object(obj)
+    type_num = ObjectType[obj_type].value
+    return encode_pack_header(type_num, len(data)) + zlib.compress(
+        data, object_compression_level(data, kind='pack'))
+
+
+def encode_pack_header(type_num, size):
+    """编码包文件中对象的类型和大小头(变长整数)。"""
+    byte = (type_num << 4) | (size & 0x0f)
+    size >>= 4
+    header = []
+    while size:
+        header.append(byte | 0x80)
+        byte = size & 0x7f
+        size >>= 7
+    header.append(byte)
+    return bytes(header)
+
+
+PACK_WINDOW = 10
+PACK_DEPTH = 50
+
+
+def pack_name_hash(name):
+    """计算路径名的散列值，用于把同名文件排在一起(git的pack_name_hash)。"""
+    h = 0
+    for c in name.encode():
+        if c in b' \t\n\r\v\f':
+            continue
+        h = ((h >> 2) + (c << 24)) & 0xffffffff
+    return h
+
+
+def iter_pack(objects, deltas=True, ofs_delta=True, window=PACK_WINDOW,
+              depth=PACK_DEPTH, index_entries=None):
+    """逐块生成包含给定对象的包文件数据，最后一块是整个包的sha - 1。
+    先只读取对象的类型和大小(以及树的数据，用来得到路径名)并排序，然后逐个
+    读取、压缩和生成对象，内存中只保留最近window个对象用于计算增量，
+    所以内存占用和包的大小无关。index_entries不为None时向其中追加每个对象的
+    (sha1_bytes, crc32, offset)元组。
+    对象按类型、路径名散列和大小(从大到小)排序，每个对象尝试与前面window个
+    同类型对象计算增量，选择最小的一个写成OFS_DELTA(或REF_DELTA)。
+    数据用pack.compression(或core.compression)的级别压缩；已经压缩过的数据
+    (见is_compressed_data)不尝试增量，并且只存储不压缩(除非core.storeCompressed
+    是false)。
+    """
+    info = {}
+    names = {}
+    for obj in objects:
+        obj_type, size, chunks = stream_object(obj)
+        if obj_type == 'tree':
+            for _, path, sha1 in read_tree(data=b''.join(chunks)):
+                names.setdefault(sha1, path)
+        else:
+            chunks.close()
+        info[obj] = (ObjectType[obj_type].value, size)
+    order = sorted(info, key=lambda o: (
+        info[o][0], pack_name_hash(names.get(o, '')), -info[o][1], o))
+
+    level = get_compression_level('pack')
+    store_compressed = get_config_bool('core', 'storeCompressed', True)
+    header = struct.pack('!4sLL', b'PACK', 2, len(order))
+    pack_sha1 = hashlib.sha1(header)
+    yield header
+    offset = len(header)
+    recent = collections.deque(maxlen=window)
+    offsets = {}
+    depths = {}
+    delta_indexes = {}
+    for obj in order:
+        type_num = info[obj][0]
+        _, data = read_object(obj)
+        best_base = best_delta = None
+        max_size = len(data) // 2 - 20
+        stored = store_compressed and type_num == ObjectType.blob.value and \
+            is_compressed_data(data, names.get(obj))
+        if deltas and not stored:
+            for base, base_type, base_data in reversed(recent):
+                if base_type != type_num or depths[base] >= depth or \
+                        len(data) < len(base_data) // 32 or \
+                        len(base_data) - len(data) >= max_size or max_size <= 0:
+                    continue
+                if base not in delta_indexes:
+                    delta_indexes[base] = build_delta_index(base_data)
+                delta = create_delta(base_data, data, delta_indexes[base],
+                                     max_size)
+                if delta is not None:
+                    best_base, best_delta = base, delta
+                    max_size = len(delta) - 1
+        if best_delta is None:
+            encoded = encode_pack_header(type_num, len(data)) + zlib.compress(
+                data, 0 if stored else level)
+            depths[obj] = 0
+        elif ofs_delta:
+            encoded = (encode_pack_header(ObjectType.ofs_delta.value, len(best_delta)) +
+                       encode_ofs_offset(offset - offsets[best_base]) +
+                       zlib.compress(best_delta, level))
+            depths[obj] = depths[best_base] + 1
+        else:
+            encoded = (encode_pack_header(ObjectType.ref_delta.value, len(best_delta)) +
+                       bytes.fromhex(best_base) + zlib.compress(best_delta, level))
+            depths[obj] = depths[best_base] + 1
+        if index_entries is not None:
+            index_entries.append((bytes.fromhex(obj), zlib.crc32(encoded), offset))
+        offsets[obj] = offset
+        pack_sha1.update(encoded)
+        yield encoded
+        offset += len(encoded)
+        if len(recent) == recent.maxlen:
+            delta_indexes.pop(recent[0][0], None)
+        recent.append((obj, type_num, data))
+    yield pack_sha1.digest()
+
+
+def build_pack(objects, deltas=True, ofs_delta=True, window=PACK_WINDOW,
+               depth=PACK_DEPTH):
+    """创建包含给定对象的包文件，返回tuple(pack_data, index_entries)，
+    index_entries是每个对象的(sha1_bytes, crc32, offset)元组列表。
+    """
+    index_entries = []
+    data = b''.join(iter_pack(objects, deltas, ofs_delta, window, depth, index_entries))
+    return (data, index_entries)
+
+
+def create_pack(objects, ofs_delta=True):
+    """创建包文件，包含给定给定的sha - 1哈希集合中的所有对象，返回完整包文件的数据字节。
+    """
+    data, _ = build_pack(objects, ofs_delta=ofs_delta)
+    return data
+
+
+def build_pack_index(index_entries, pack_sha1):
+    """根据包中对象的(sha1_bytes, crc32, offset)列表构建v2包索引(.idx)的数据字节。
+    """
+    index_entries = sorted(index_entries)
+    fanout = [0] * 256
+    for sha1, _, _ in index_entries:
+        fanout[sha1[0]] += 1
+    for i in range(1, 256):
+        fanout[i] += fanout[i - 1]
+    offsets = []
+    large_offsets = []
+    for _, _, offset in index_entries:
+        if offset < 0x80000000:
+            offsets.append(offset)
+        else:
+            offsets.append(0x80000000 | len(large_offsets))
+            large_offsets.append(offset)
+    n = len(index_entries)
+    contents = b''.join([
+        struct.pack('!4sL', b'\xfftOc', 2),
+        struct.pack('!256L', *fanout),
+        b''.join(e[0] for e in index_entries),
+        struct.pack('!{}L'.format(n), *(e[1] for e in index_entries)),
+        struct.pack('!{}L'.format(n), *offsets),
+        struct.pack('!{}Q'.format(len(large_offsets)), *large_offsets),
+        pack_sha1,
+    ])
+    return contents + hashlib.sha1(contents).digest()
+
+
+def find_loose_objects():
+    """返回对象存储中所有松散对象的sha - 1散列集合。"""
+    objects_dir = os.path.join('.git', 'objects')
+    objects = set()
+    for name in os.listdir(objects_dir):
+        if len(name) != 2 or not os.path.isdir(os.path.join(objects_dir, name)):
+            continue
+        for rest in os.listdir(os.path.join(objects_dir, name)):
+            if len(rest) == 38:
+                objects.add(name + rest)
+    return objects
+
+
+def repack(write_bitmaps=None):
+    """把所有松散对象和已有的包合并成一个新的包文件(带v2索引)，
+    然后删除被合并的松散对象和旧包。返回新包的sha - 1，没有对象时返回None。
+    write_bitmaps为真时(为None时看配置repack.writeBitmaps)同时写可达性位图。
+    """
+    if write_bitmaps is None:
+        write_bitmaps = get_config_bool('repack', 'writeBitmaps')
+    loose = find_loose_objects()
+    packs = get_packs()
+    objects = set(loose)
+    for pack in packs:
+        objects.update(pack.sha1_at(i).hex() for i in range(pack.num_objects))
+    if not objects or (not loose and len(packs) == 1):
+        if write_bitmaps and packs and not os.path.exists(packs[0].bitmap_path):
+            write_bitmap_index(packs[0])
+        return None
+    data, index_entries = build_pack(objects)
+    pack_sha1 = data[-20:]
+    pack_dir = os.path.join('.git', 'objects', 'pack')
+    os.makedirs(pack_dir, exist_ok=True)
+    base = os.path.join(pack_dir, 'pack-' + pack_sha1.hex())
+    old_paths = [(p.idx_path, p.pack_path, p.bitmap_path) for p in packs]
+    close_packs()
+    write_file(base + '.pack.tmp', data)
+    write_file(base + '.idx.tmp', build_pack_index(index_entries, pack_sha1))
+    os.replace(base + '.pack.tmp', base + '.pack')
+    os.replace(base + '.idx.tmp', base + '.idx')
+    for idx_path, pack_path, bitmap_path in old_paths:
+        if idx_path != base + '.idx':
+            os.remove(idx_path)
+            os.remove(pack_path)
+            if os.path.exists(bitmap_path):
+                os.remove(bitmap_path)
+    for sha1 in loose:
+        obj_dir = os.path.join('.git', 'objects', sha1[:2])
+        os.remove(os.path.join(obj_dir, sha1[2:]))
+        forget_object_dir(obj_dir)
+        if not os.listdir(obj_dir):
+            os.rmdir(obj_dir)
+    if write_bitmaps:
+        pack = PackFile(base + '.idx')
+        try:
+            write_bitmap_index(pack)
+        finally:
+            pack.close()
+    return pack_sha1.hex()
+
+
+EWAH_FULL_WORD = (1 << 64) - 1
+EWAH_MAX_RUN = (1 << 32) - 1
+EWAH_MAX_LITERALS = (1 << 31) - 1
+
+
+def ewah_encode(bits):
+    """把位图(int，第i位对应第i个对象)编码成git的EWAH格式(ewah/ewah_io.c)：
+    位数、64位字的数量、字(大端序)和最后一个RLW字的位置。每个RLW字记录
+    一段全0或全1的字(第0位是填充的位，第1 - 32位是长度)以及后面紧跟的
+    字面字的数量(第33 - 63位)。
+    """
+    bit_size = bits.bit_length()
+    num_words = (bit_size + 63) // 64
+    words = array.array('Q', bits.to_bytes(num_words * 8, 'little'))
+    if sys.byteorder != 'little':
+        words.byteswap()
+    out = array.array('Q')
+    i = 0
+    while True:
+        run_bit = run = 0
+        if i < num_words and words[i] in (0, EWAH_FULL_WORD):
+            fill = words[i]
+            run_bit = fill & 1
+            while i < num_words and words[i] == fill and run < EWAH_MAX_RUN:
+                run += 1
+                i += 1
+        start = i
+        while i < num_words and words[i] not in (0, EWAH_FULL_WORD) and \
+                i - start < EWAH_MAX_LITERALS:
+            i += 1
+        last_rlw = len(out)
+        out.append(run_bit | run << 1 | (i - start) << 33)
+        out.extend(words[start:i])
+        if i >= num_words:
+            break
+    if sys.byteorder == 'little':
+        out.byteswap()
+    return struct.pack('!LL', bit_size, len(out)) + out.tobytes() + struct.pack('!L', last_rlw)
+
+
+def ewah_decode(buf, offset):
+    """解码从buf[offset]开始的EWAH位图，返回tuple(bits, next_offset)。"""
+    _, num_words = struct.unpack_from('!LL', buf, offset)
+    offset += 8
+    words = array.array('Q', buf[offset:offset + 8 * num_words])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    out = array.array('Q')
+    i = 0
+    while i < num_words:
+        rlw = words[i]
+        run = (rlw >> 1) & EWAH_MAX_RUN
+        literals = rlw >> 33
+        if run:
+            out.extend(array.array('Q', [EWAH_FULL_WORD if rlw & 1 else 0]) * run)
+        out.extend(words[i + 1:i + 1 + literals])
+        i += 1 + literals
+    if sys.byteorder != 'little':
+        out.byteswap()
+    return (int.from_bytes(out.tobytes(), 'little'), offset + 8 * num_words + 4)
+
+
+def ewah_skip(buf, offset):
+    """返回buf[offset]开始的EWAH位图后面的偏移量。"""
+    _, num_words = struct.unpack_from('!LL', buf, offset)
+    return offset + 8 + 8 * num_words + 4
+
+
+BITMAP_SIGNATURE = b'BITM'
+BITMAP_OPT_FULL_DAG = 1
+BITMAP_RECENT_COMMITS = 100
+BITMAP_RECENT_INTERVAL = 10
+BITMAP_COMMIT_INTERVAL = 100
+BITMAP_TYPES = ['commit', 'tree', 'blob', 'tag']
+
+
+class BitmapIndex:
+    """包文件的可达性位图(.bitmap)，格式和git的
+    Documentation/technical/bitmap-format.txt(版本1)一致：第i位对应包中
+    偏移量第i小的对象，每个选中的提交有一个EWAH压缩的位图，包括从它可以
+    到达的所有对象。内存中的位图是int，并集和AND-NOT由Python的大整数完成。
+    path为None时创建空的位图索引(用于写位图)。
+    """
+
+    def __init__(self, pack, path=None):
+        self.pack = pack
+        self.order = pack.pack_order()
+        self.positions = array.array('L', [0]) * len(self.order)
+        for pos, i in enumerate(self.order):
+            self.positions[i] = pos
+        self.bitmaps = {}
+        self.entries = {}
+        self.entry_offsets = []
+        self.data = None
+        if path is None:
+            return
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, version, flags, count = struct.unpack_from('!4sHHL', self.data, 0)
+        assert signature == BITMAP_SIGNATURE and version == 1 and \
+            flags & BITMAP_OPT_FULL_DAG, 'unsupported bitmap index {}'.format(path)
+        assert self.data[12:32] == pack.pack[-20:], \
+            'bitmap index {} does not match its pack'.format(path)
+        offset = 32
+        for _ in BITMAP_TYPES:
+            offset = ewah_skip(self.data, offset)
+        for k in range(count):
+            index_pos, xor_offset, _ = struct.unpack_from('!LBB', self.data, offset)
+            self.entries[pack.sha1_at(index_pos).hex()] = k
+            self.entry_offsets.append((offset + 6, xor_offset))
+            offset = ewah_skip(self.data, offset + 6)
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+
+    def position(self, sha1):
+        """返回对象在位图中的位置，不在包中时返回None。"""
+        i = self.pack.index_of(sha1)
+        return None if i is None else self.positions[i]
+
+    def get(self, sha1):
+        """返回给定提交的位图，没有位图时返回None。
+        和前面某个条目XOR压缩的条目沿着链依次解码，结果被缓存。
+        """
+        bits = self.bitmaps.get(sha1)
+        if bits is not None or sha1 not in self.entries:
+            return bits
+        chain = [self.entries[sha1]]
+        while self.entry_offsets[chain[-1]][1]:
+            chain.append(chain[-1] - self.entry_offsets[chain[-1]][1])
+        bits = 0
+        for k in reversed(chain):
+            entry_bits, _ = ewah_decode(self.data, self.entry_offsets[k][0])
+            bits ^= entry_bits
+        self.bitmaps[sha1] = bits
+        return bits
+
+    def reachable(self, commits, have=None):
+        """返回从commits可以到达的对象：tuple(位图，不在包中的对象的sha - 1集合)。
+        have是另一次reachable的结果，其中的对象(和从它们可以到达的对象)不再遍历，
+        但是结果中可能包括它们，调用者用AND-NOT去掉。先遍历提交(遇到有位图的
+        提交直接合并它的位图)，再遍历树，所以和已有位图相同的子树不会被展开。
+        """
+        have_bits, have_extra = have if have is not None else (0, set())
+        seen = bytearray(have_bits.to_bytes((len(self.order) + 7) // 8, 'little'))
+        extra = set()
+
+        def mark(sha1):
+            """把对象标记为已经访问，已经访问过时返回False。"""
+            pos = self.position(sha1)
+            if pos is None:
+                if sha1 in extra or sha1 in have_extra:
+                    return False
+                extra.add(sha1)
+                return True
+            if seen[pos >> 3] & (1 << (pos & 7)):
+                return False
+            seen[pos >> 3] |= 1 << (pos & 7)
+            return True
+
+        trees = []
+        stack = list(commits)
+        while stack:
+            sha1 = stack.pop()
+            bits = self.get(sha1)
+            if bits is not None:
+                seen[:] = (int.from_bytes(seen, 'little') | bits).to_bytes(
+                    len(seen), 'little')
+                continue
+            if not mark(sha1):
+                continue
+            node = get_commit_node(sha1)
+            trees.append(node.tree)
+            stack.extend(node.parents)
+        while trees:
+            sha1 = trees.pop()
+            if not mark(sha1):
+                continue
+            for mode, _, child in read_tree(sha1=sha1):
+                if stat.S_ISDIR(mode):
+                    trees.append(child)
+                elif mode != 0o160000:
+                    mark(child)
+        return (int.from_bytes(seen, 'little'), extra)
+
+    def objects(self, bits):
+        """生成位图中的对象的sha - 1。"""
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        for byte_index, byte in enumerate(data):
+            while byte:
+                low = byte & -byte
+                yield self.pack.sha1_at(self.order[byte_index * 8 + low.bit_length() - 1]).hex()
+                byte ^= low
+
+    def write(self, path):
+        """把bitmaps中的位图，以及每种对象类型的位图，写到path。"""
+        type_bits = {obj_type: bytearray((len(self.order) + 7) // 8)
+                     for obj_type in BITMAP_TYPES}
+        for pos, i in enumerate(self.order):
+            obj_type, _ = self.pack.info(self.pack.sha1_at(i).hex())
+            type_bits[obj_type][pos >> 3] |= 1 << (pos & 7)
+        chunks = [struct.pack('!4sHHL', BITMAP_SIGNATURE, 1, BITMAP_OPT_FULL_DAG,
+                              len(self.bitmaps)),
+                  self.pack.pack[-20:]]
+        chunks.extend(ewah_encode(int.from_bytes(type_bits[t], 'little'))
+                      for t in BITMAP_TYPES)
+        for sha1, bits in self.bitmaps.items():
+            chunks.append(struct.pack('!LBB', self.pack.index_of(sha1), 0, 0))
+            chunks.append(ewah_encode(bits))
+        contents = b''.join(chunks)
+        write_file(path + '.tmp', contents + hashlib.sha1(contents).digest())
+        os.replace(path + '.tmp', path)
+
+
+def get_bitmap_index():
+    """返回有可达性位图的包的BitmapIndex，没有位图时返回None。"""
+    for pack in get_packs():
+        if pack.bitmap is None and os.path.exists(pack.bitmap_path):
+            pack.bitmap = BitmapIndex(pack, pack.bitmap_path)
+        if pack.bitmap is not None:
+            return pack.bitmap
+    return None
+
+
+def write_bitmap_index(pack):
+    """为包中引用可以到达的一部分提交计算可达性位图，写到包旁边的.bitmap文件，
+    返回位图的数量。选中的是所有引用指向的提交，以及按提交时间从新到旧，
+    最近BITMAP_RECENT_COMMITS个提交中每BITMAP_RECENT_INTERVAL个中的一个、
+    更老的提交中每BITMAP_COMMIT_INTERVAL个中的一个。从旧到新计算，每个位图
+    只需要遍历到前面已经有位图的提交为止。可以到达包外对象的提交没有位图。
+    """
+    index = BitmapIndex(pack)
+    tips = [sha1 for sha1 in find_ref_commits() if index.position(sha1) is not None]
+    times = {}
+    stack = list(tips)
+    while stack:
+        sha1 = stack.pop()
+        if sha1 in times or index.position(sha1) is None:
+            continue
+        node = get_commit_node(sha1)
+        times[sha1] = node.commit_time
+        stack.extend(node.parents)
+    by_time = sorted(times, key=lambda sha1: (times[sha1], sha1))
+    newest = by_time[::-1]
+    selected = set(tips)
+    selected.update(newest[:BITMAP_RECENT_COMMITS:BITMAP_RECENT_INTERVAL])
+    selected.update(newest[BITMAP_RECENT_COMMITS::BITMAP_COMMIT_INTERVAL])
+    for sha1 in by_time:
+        if sha1 in selected:
+            bits, extra = index.reachable([sha1])
+            if not extra:
+                index.bitmaps[sha1] = bits
+    index.write(pack.bitmap_path)
+    return len(index.bitmaps)
+
+
+FSCK_CHUNK_OBJECTS = 256
+FSCK_CACHE_BYTES = 32 * 1024 * 1024
+
+ObjectCheck = collections.namedtuple('ObjectCheck', ['name', 'type', 'size', 'links', 'error'])
+FsckResult = collections.namedtuple('FsckResult', [
+    'objects', 'bytes', 'seconds', 'errors', 'dangling'])
+
+
+def object_links(obj_type, data):
+    """返回对象引用的其他对象的列表[(期望的类型，sha - 1)]，子模块除外。"""
+    if obj_type == 'commit':
+        commit = parse_commit(data)
+        if commit.tree is None:
+            raise ValueError('missing tree line')
+        return [('tree', commit.tree)] + [('commit', p) for p in commit.parents]
+    if obj_type == 'tree':
+        return [('tree' if stat.S_ISDIR(mode) else 'blob', sha1)
+                for mode, _, sha1 in read_tree(data=data) if mode != 0o160000]
+    if obj_type == 'tag':
+        header = data.decode().partition('\n\n')[0]
+        fields = dict(line.split(' ', 1) for line in header.splitlines())
+        return [(fields['type'], fields['object'])]
+    return []
+
+
+def check_object(sha1, obj_type, data):
+    """重新计算解压后的对象的散列，并解析它引用的对象，返回ObjectCheck。"""
+    digest = hashlib.sha1('{} {}'.format(obj_type, len(data)).encode() + b'\x00')
+    digest.update(data)
+    if digest.hexdigest() != sha1:
+        return ObjectCheck(sha1, obj_type, len(data), [],
+                           'sha1 mismatch: content hashes to {}'.format(digest.hexdigest()))
+    try:
+        links = object_links(obj_type, data)
+    except Exception as error:
+        return ObjectCheck(sha1, obj_type, len(data), [],
+                           'malformed {}: {}'.format(obj_type, error))
+    return ObjectCheck(sha1, obj_type, len(data), links, None)
+
+
+_fsck_packs = {}
+
+
+def fsck_pack_chunk(idx_path, entries):
+    """(在工作进程中)检查包中的一组对象，entries是按偏移量排序的
+    (索引中的位置，偏移量，结束偏移量)列表。比较每个对象原始数据的CRC32，
+    解压(还原增量)后重新计算散列。返回ObjectCheck列表。
+    """
+    pack = _fsck_packs.get(idx_path)
+    if pack is None:
+        pack = _fsck_packs[idx_path] = PackFile(idx_path)
+    cache = ObjectCache(FSCK_CACHE_BYTES)
+    results = []
+    for i, offset, end in entries:
+        sha1 = pack.sha1_at(i).hex()
+        try:
+            crc, = struct.unpack_from('!L', pack.idx, pack.crc_start + 4 * i)
+            if zlib.crc32(pack.pack[offset:end]) != crc:
+                raise ValueError('crc32 mismatch at offset {}'.format(offset))
+            type_num, data = pack.read_at(offset, cache)
+            results.append(check_object(sha1, ObjectType(type_num).name, data))
+        except Exception as error:
+            results.append(ObjectCheck(sha1, None, 0, [], 'corrupt packed object: {}'.format(
+                error or type(error).__name__)))
+    return results
+
+
+def fsck_loose_chunk(sha1s):
+    """(在工作进程中)检查一组松散对象：解压、检查对象头中的大小并重新计算散列。"""
+    results = []
+    for sha1 in sha1s:
+        try:
+            full_data = zlib.decompress(read_file(os.path.join('.git', 'objects',
+                                                               sha1[:2], sha1[2:])))
+            header, _, data = full_data.partition(b'\x00')
+            obj_type, size = header.decode().split()
+            if int(size) != len(data):
+                raise ValueError('expected size {}, got {} bytes'.format(size, len(data)))
+            results.append(check_object(sha1, obj_type, data))
+        except Exception as error:
+            results.append(ObjectCheck(sha1, None, 0, [], 'corrupt loose object: {}'.format(
+                error or type(error).__name__)))
+    return results
+
+
+def fsck_pack_checksums(idx_path):
+    """(在工作进程中)检查包文件和索引末尾的sha - 1，返回ObjectCheck列表
+    (只有出错时才有条目)。
     """
-    path = find_object(sha1_prefix)
-    full_data = zlib.decompress(read_object(path))
-    nul_index = full_data.index(b'\x00')
-    header = full_data[:nul_index]
-    obj_type,size_str = header.decode().split()
-    size = int(size_str)
-    data = full_data[nul_index + 1:]
-    assert size == len(data),'expected size {},got {} bytes'.format(
-        size,len(data))
-    return (obj_type,data)
+    pack = PackFile(idx_path)
+    try:
+        errors = []
+        pack_sha1 = hashlib.sha1(memoryview(pack.pack)[:-20]).digest()
+        if pack_sha1 != pack.pack[-20:]:
+            errors.append('pack checksum mismatch')
+        if hashlib.sha1(memoryview(pack.idx)[:-20]).digest() != pack.idx[-20:]:
+            errors.append('index checksum mismatch')
+        if pack.idx[-40:-20] != pack.pack[-20:]:
+            errors.append('index does not match its pack')
+        return [ObjectCheck(pack.pack_path, None, 0, [], error) for error in errors]
+    finally:
+        pack.close()
 
-def cat_file(mode,sha1_prefix):
-    """将给定的sha - 1前缀写入到stdout中。
-    如果模式是“commit”，“tree”或“blob”，打印原始数据字节的对象。
-    如果模式是“大小”，打印对象的大小。如果模式是' type '，打印对象的类型。
-    如果模式是“漂亮的”，打印一个漂亮的对象的版本。
+
+def iter_object_checks(idx_paths, loose, jobs=None):
+    """用进程池(jobs个进程，默认每个CPU一个)检查给定的包和松散对象，
+    按提交任务的顺序生成ObjectCheck。包中的对象按偏移量分成每块
+    FSCK_CHUNK_OBJECTS个，每个工作进程在自己的块中缓存增量的基础对象。
     """
-    obj_type,data = read_object(sha1_prefix)
-    if mode in ['commit','tree','blob']:
-        if obj_type != mode:
-            raise ValueError('expected object type {},got{}'.format(
-                mode,obj_type))
-        sys.stdout.buffer.write(data)
-    elif mode == 'size':
-        print(len(data))
-    elif mode == 'type':
-        print(obj_type)
-    elif mode == 'pretty':
-        if obj_type in ['commit','blob']:
-            sys.stdout.buffer.write(data)
-        elif obj_type == 'tree':
-            for mode,path,sha1 in read_object(data=data):
-                type_str = 'tree' if stat.S_ISDIR(mode) else 'blob'
-                print('{:06o} {} {}\t{}'.format(mode,type_str,sha1,path))
-        else:
-            assert False,'unhandled object type {!r}'.format(obj_type)
-    else:
-        raise ValueError('unexpected mode {!r}'.format(mode))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) \
+            as executor:
+        tasks = []
+        for idx_path in idx_paths:
+            tasks.append(executor.submit(fsck_pack_checksums, idx_path))
+            pack = PackFile(idx_path)
+            try:
+                order = pack.pack_order()
+                offsets = [pack.offset_at(i) for i in order] + [len(pack.pack) - 20]
+            finally:
+                pack.close()
+            entries = [(i, offsets[k], offsets[k + 1]) for k, i in enumerate(order)]
+            for k in range(0, len(entries), FSCK_CHUNK_OBJECTS):
+                tasks.append(executor.submit(fsck_pack_chunk, idx_path,
+                                             entries[k:k + FSCK_CHUNK_OBJECTS]))
+        loose = sorted(loose)
+        for k in range(0, len(loose), FSCK_CHUNK_OBJECTS):
+            tasks.append(executor.submit(fsck_loose_chunk, loose[k:k + FSCK_CHUNK_OBJECTS]))
+        for task in tasks:
+            yield from task.result()
 
-def read_index():
-    """阅读git索引文件和索引条目对象的返回列表。"""
-    try:
-        data = read_file(os.path.join('.git', 'index'))
-    except FileNotFoundError:
-        return []
-    digest = hashlib.sha1(data[:-20]).digest()
-    assert digest == data[-20:], 'invalid index checksum'
-    signature, version, num_entries = struct.unpack('!4sLL', data[:12])
-    assert signature == b'DIRC', \
-        'invalid index signature {}'.format(signature)
-    assert version == 2, 'unknown index version {}'.format(version)
-    entry_data = data[12:-20]
-    entries = []
-    i = 0
-    while i + 62 < len(entry_data):
-        fields_end = i + 62
-        fields = struct.unpack('!LLLLLLLLLL20sH', entry_data[i:fields_end])
-        path_end = entry_data.index(b'\x00', fields_end)
-        path = entry_data[fields_end:path_end]
-        entry = IndexEntry(*(fields + (path.decode(),)))
-        entries.append(entry)
-        entry_len = ((62 + len(path) + 8) // 8) * 8
-        i += entry_len
-    assert len(entries) == num_entries
-    return entries
 
+def verify_pack(idx_path, jobs=None, verbose=False):
+    """检查一个包文件中的所有对象(不检查连通性)，返回FsckResult。
+    verbose为True时打印每个对象的sha - 1、类型和大小。
+    """
+    start = time.perf_counter()
+    count = total_bytes = 0
+    errors = []
+    for check in iter_object_checks([os.path.abspath(idx_path)], [], jobs=jobs):
+        if check.error is not None:
+            errors.append('{}: {}'.format(check.name, check.error))
+            continue
+        count += 1
+        total_bytes += check.size
+        if verbose:
+            print('{} {:<6} {}'.format(check.name, check.type, check.size))
+    return FsckResult(count, total_bytes, time.perf_counter() - start, errors, [])
 
-def ls_files(details=False):
-    """索引中的文件列表(包括模式、sha - 1和阶段号，如果“细节”是正确的)。
+
+def fsck(jobs=None):
+    """检查对象存储：用进程池解压所有松散对象和包中的对象并重新计算散列，
+    然后检查连通性(提交、树和标签引用的对象都存在并且类型正确)和引用。
+    返回FsckResult，dangling是没有被任何对象或引用指向的提交。
     """
-    for entry in read_index():
-        if details:
-            stage = (entry.flags >> 12) & 3
-            print('{:6o} {} {:}\t{}'.format(
-                entry.mode, entry.sha1.hex(), stage, entry.path))
-        else:
-            print(entry.path)
+    start = time.perf_counter()
+    idx_paths = [pack.idx_path for pack in get_packs()]
+    types = {}
+    links = []
+    errors = []
+    count = total_bytes = 0
+    for check in iter_object_checks(idx_paths, find_loose_objects(), jobs=jobs):
+        if check.error is not None:
+            errors.append('{}: {}'.format(check.name, check.error))
+            continue
+        count += 1
+        total_bytes += check.size
+        types[check.name] = check.type
+        if check.links:
+            links.append((check.name, check.type, check.links))
+    referenced = set()
+    for sha1, obj_type, targets in links:
+        for expected, target in targets:
+            referenced.add(target)
+            actual = types.get(target)
+            if actual is None:
+                errors.append('broken link from {} {} to {} {}'.format(
+                    obj_type, sha1, expected, target))
+            elif actual != expected:
+                errors.append('{} {} links to {} {}, which is a {}'.format(
+                    obj_type, sha1, expected, target, actual))
+    refs = list_refs()
+    head = get_head_hash()
+    if head is not None:
+        refs.append(('HEAD', head))
+    for name, sha1 in refs:
+        referenced.add(sha1)
+        if sha1 not in types:
+            errors.append('invalid ref {}: object {} is missing'.format(name, sha1))
+    dangling = sorted(sha1 for sha1, obj_type in types.items()
+                      if obj_type == 'commit' and sha1 not in referenced)
+    return FsckResult(count, total_bytes, time.perf_counter() - start, errors, dangling)
 
 
-def get_status():
-    """获得工作副本的状态，返回tuple(changed_paths，new_paths，deleted_paths)。
+def format_throughput(result):
+    """返回FsckResult的吞吐量摘要。"""
+    seconds = max(result.seconds, 1e-9)
+    return 'checked {} objects ({:.1f} MB) in {:.2f} s: {:.0f} objects/s, {:.1f} MB/s'.format(
+        result.objects, result.bytes / 1e6, result.seconds, result.objects / seconds,
+        result.bytes / 1e6 / seconds)
+
+
+class PackStreamReader:
+    """从数据块的迭代器中读取包文件，同时把收到的原始数据写到文件f中。
+    sha1和crc只根据已经消费的字节计算，offset是已经消费的字节数。
     """
-    paths = set()
-    for root, dirs, files in os.walk('.'):
-        dirs[:] = [d for d in dirs if d != '.git']
-        for file in files:
-            path = os.path.join(root, file)
-            path = path.replace('\\', '/')
-            if path.startswith('./'):
-                path = path[2:]
-            paths.add(path)
-    entries_by_path = {e.path: e for e in read_index()}
-    entry_paths = set(entries_by_path)
-    changed = {p for p in (paths & entry_paths)
-               if hash_object(read_file(p), 'blob', write=False) !=
-               entries_by_path[p].sha1.hex()}
-    new = paths - entry_paths
-    deleted = entry_paths - paths
-    return (sorted(changed), sorted(new), sorted(deleted))
 
+    def __init__(self, chunks, f):
+        self.chunks = iter(chunks)
+        self.file = f
+        self.buffer = memoryview(b'')
+        self.pos = 0
+        self.offset = 0
+        self.sha1 = hashlib.sha1()
+        self.crc = 0
 
-def status():
-    """显示工作副本的状态。"""
-    changed, new, deleted = get_status()
-    if changed:
-        print('changed files:')
-        for path in changed:
-            print('   ', path)
-    if new:
-        print('new files:')
-        for path in new:
-            print('   ', path)
-    if deleted:
-        print('deleted files:')
-        for path in deleted:
-            print('   ', path)
+    def peek(self):
+        """返回还没有消费的数据(缓冲区空时读取下一块)，数据结束时返回空。"""
+        if self.pos == len(self.buffer):
+            chunk = next(self.chunks, b'')
+            self.file.write(chunk)
+            self.buffer = memoryview(chunk)
+            self.pos = 0
+        return self.buffer[self.pos:]
 
+    def skip(self, size, checksum=True):
+        """消费size个字节(不能超过peek返回的数据)。"""
+        if checksum:
+            data = self.buffer[self.pos:self.pos + size]
+            self.sha1.update(data)
+            self.crc = zlib.crc32(data, self.crc)
+        self.pos += size
+        self.offset += size
 
-def diff():
-    """显示更改的文件(在索引和工作副本之间)。"""
-    changed, _, _ = get_status()
-    entries_by_path = {e.path: e for e in read_index()}
-    for i, path in enumerate(changed):
-        sha1 = entries_by_path[path].sha1.hex()
-        obj_type, data = read_object(sha1)
-        assert obj_type == 'blob'
-        index_lines = data.decode().splitlines()
-        working_lines = read_file(path).decode().splitlines()
-        diff_lines = difflib.unified_diff(
-            index_lines, working_lines,
-            '{} (index)'.format(path),
-            '{} (working copy)'.format(path),
-            lineterm='')
-        for line in diff_lines:
-            print(line)
-        if i < len(changed) - 1:
-            print('-' * 70)
-
-
-def write_index(entries):
-    """将索引条目对象的列表写到git索引文件中。"""
-    packed_entries = []
-    for entry in entries:
-        entry_head = struct.pack('!LLLLLLLLLL20sH',
-                                 entry.ctime_s, entry.ctime_n, entry.mtime_s, entry.mtime_n,
-                                 entry.dev, entry.ino, entry.mode, entry.uid, entry.gid,
-                                 entry.size, entry.sha1, entry.flags)
-        path = entry.path.encode()
-        length = ((62 + len(path) + 8) // 8) * 8
-        packed_entry = entry_head + path + b'\x00' * (length - 62 - len(path))
-        packed_entries.append(packed_entry)
-    header = struct.pack('!4sLL', b'DIRC', 2, len(entries))
-    all_data = header + b''.join(packed_entries)
-    digest = hashlib.sha1(all_data).digest()
-    write_file(os.path.join('.git', 'index'), all_data + digest)
-
-
-def add(paths):
-    """将所有文件路径添加到git索引。"""
-    paths = [p.replace('\\', '/') for p in paths]
-    all_entries = read_index()
-    entries = [e for e in all_entries if e.path not in paths]
-    for path in paths:
-        sha1 = hash_object(read_file(path), 'blob')
-        st = os.stat(path)
-        flags = len(path.encode())
-        assert flags < (1 << 12)
-        entry = IndexEntry(
-            int(st.st_ctime), 0, int(st.st_mtime), 0, st.st_dev,
-            st.st_ino, st.st_mode, st.st_uid, st.st_gid, st.st_size,
-            bytes.fromhex(sha1), flags, path)
-        entries.append(entry)
-    entries.sort(key=operator.attrgetter('path'))
-    write_index(entries)
+    def read(self, size, checksum=True):
+        """消费并返回正好size个字节。"""
+        result = bytearray()
+        while len(result) < size:
+            data = self.peek()
+            if not data:
+                raise ValueError('truncated pack file')
+            take = min(size - len(result), len(data))
+            result += data[:take]
+            self.skip(take, checksum)
+        return bytes(result)
 
 
-def write_tree():
-    """从当前索引条目中写入树对象。"""
-    tree_entries = []
-    for entry in read_index():
-        assert '/' not in entry.path, \
-            'currently only supports a single, top-level directory'
-        mode_path = '{:o} {}'.format(entry.mode, entry.path).encode()
-        tree_entry = mode_path + b'\x00' + entry.sha1
-        tree_entries.append(tree_entry)
-    return hash_object(b''.join(tree_entries), 'tree')
+def read_pack_entry(buf, offset, sha1_offsets, cache):
+    """读取包文件数据中给定偏移量的对象(解析增量链)，返回tuple(type_num, data)。
+    REF_DELTA的基础对象在sha1_offsets中查找，找不到时抛出KeyError。
+    """
+    chain = []
+    while True:
+        cached = cache.get(offset)
+        if cached is not None:
+            type_num, data = cached
+            break
+        type_num, _, data_offset = decode_pack_header(buf, offset)
+        if type_num == ObjectType.ofs_delta.value:
+            distance, data_offset = decode_ofs_offset(buf, data_offset)
+            chain.append((offset, data_offset))
+            offset -= distance
+        elif type_num == ObjectType.ref_delta.value:
+            base_sha1 = bytes(buf[data_offset:data_offset + 20])
+            chain.append((offset, data_offset + 20))
+            offset = sha1_offsets[base_sha1]
+        else:
+            data, _ = inflate_at(buf, data_offset)
+            cache.put(offset, (type_num, data))
+            break
+    for offset, data_offset in reversed(chain):
+        delta, _ = inflate_at(buf, data_offset)
+        data = apply_delta(data, delta)
+        cache.put(offset, (type_num, data))
+    return (type_num, data)
 
 
-def get_local_master_hash():
-    """获取本地主分支的当前提交哈希(sha - 1字符串)。"""
-    master_path = os.path.join('.git', 'refs', 'heads', 'master')
+def resolve_pack_deltas(pack_path, objects):
+    """计算包文件中增量对象的sha - 1。objects是[offset, crc32, sha1_bytes]列表，
+    增量对象的sha1_bytes为None，计算后就地填入。REF_DELTA的基础对象可能在
+    后面，所以重复处理直到没有进展。
+    """
+    pending = [obj for obj in objects if obj[2] is None]
+    if not pending:
+        return
+    sha1_offsets = {obj[2]: obj[0] for obj in objects if obj[2] is not None}
+    cache = ObjectCache(OBJECT_CACHE_BYTES)
+    with open(pack_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        while pending:
+            deferred = []
+            for obj in pending:
+                try:
+                    type_num, data = read_pack_entry(buf, obj[0], sha1_offsets, cache)
+                except KeyError:
+                    deferred.append(obj)
+                    continue
+                header = '{} {}'.format(ObjectType(type_num).name, len(data)).encode()
+                obj[2] = hashlib.sha1(header + b'\x00' + data).digest()
+                sha1_offsets[obj[2]] = obj[0]
+            if len(deferred) == len(pending):
+                raise ValueError('{} delta object(s) with missing base'.format(len(deferred)))
+            pending = deferred
+
+
+def index_pack_stream(chunks):
+    """把数据块组成的包文件一边接收一边写到.git/objects/pack中，同时解析对象头、
+    解压并散列非增量对象(不保存数据)；接收完后解析增量对象，写出v2索引。
+    返回包的sha - 1(十六进制字符串)。
+    """
+    pack_dir = os.path.join('.git', 'objects', 'pack')
+    os.makedirs(pack_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=pack_dir, prefix='tmp_pack_')
     try:
-        return read_file(master_path).decode().strip()
-    except FileNotFoundError:
-        return None
+        with os.fdopen(fd, 'wb') as f:
+            reader = PackStreamReader(chunks, f)
+            signature, version, num_objects = struct.unpack('!4sLL', reader.read(12))
+            if signature != b'PACK' or version not in (2, 3):
+                raise ValueError('invalid pack header {!r} version {}'.format(signature, version))
+            objects = []
+            for _ in range(num_objects):
+                offset = reader.offset
+                reader.crc = 0
+                byte = reader.read(1)[0]
+                type_num = (byte >> 4) & 7
+                size = byte & 0x0f
+                shift = 4
+                while byte & 0x80:
+                    byte = reader.read(1)[0]
+                    size |= (byte & 0x7f) << shift
+                    shift += 7
+                hasher = None
+                if type_num == ObjectType.ofs_delta.value:
+                    byte = reader.read(1)[0]
+                    while byte & 0x80:
+                        byte = reader.read(1)[0]
+                elif type_num == ObjectType.ref_delta.value:
+                    reader.read(20)
+                else:
+                    header = '{} {}'.format(ObjectType(type_num).name, size).encode()
+                    hasher = hashlib.sha1(header + b'\x00')
+                decompressor = zlib.decompressobj()
+                total = 0
+                while not decompressor.eof:
+                    data = reader.peek()
+                    if not data:
+                        raise ValueError('truncated pack file')
+                    out = decompressor.decompress(data)
+                    total += len(out)
+                    if hasher is not None:
+                        hasher.update(out)
+                    reader.skip(len(data) - len(decompressor.unused_data))
+                if total != size:
+                    raise ValueError('expected object size {}, got {} bytes'.format(size, total))
+                objects.append([offset, reader.crc, hasher and hasher.digest()])
+            pack_sha1 = reader.sha1.digest()
+            if reader.read(20, checksum=False) != pack_sha1:
+                raise ValueError('pack checksum mismatch')
+            if reader.peek():
+                raise ValueError('unexpected data after end of pack')
+        resolve_pack_deltas(tmp_path, objects)
+        base = os.path.join(pack_dir, 'pack-' + pack_sha1.hex())
+        write_file(base + '.idx.tmp', build_pack_index(
+            [(sha1, crc, offset) for offset, crc, sha1 in objects], pack_sha1))
+        os.replace(tmp_path, base + '.pack')
+        os.replace(base + '.idx.tmp', base + '.idx')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    close_packs(os.path.abspath(pack_dir))
+    return pack_sha1.hex()
 
 
-def commit(message, author=None):
-    """使用给定的消息提交索引的当前状态。提交对象的返回散列。
+def parse_refspec(refspec):
+    """解析push的refspec('src'、'src:dst'或删除远程引用的':dst')，
+    返回tuple(本地sha - 1或None(删除), 远程引用名)。
     """
-    tree = write_tree()
-    parent = get_local_master_hash()
-    if author is None:
-        author = '{} <{}>'.format(
-            os.environ['GIT_AUTHOR_NAME'], os.environ['GIT_AUTHOR_EMAIL'])
-    timestamp = int(time.mktime(time.localtime()))
-    utc_offset = -time.timezone
-    author_time = '{} {}{:02}{:02}'.format(
-        timestamp,
-        '+' if utc_offset > 0 else '-',
-        abs(utc_offset) // 3600,
-        (abs(utc_offset) // 60) % 60)
-    lines = ['tree ' + tree]
-    if parent:
-        lines.append('parent ' + parent)
-    lines.append('author {} {}'.format(author, author_time))
-    lines.append('committer {} {}'.format(author, author_time))
-    lines.append('')
-    lines.append(message)
-    lines.append('')
-    data = '\n'.join(lines).encode()
-    sha1 = hash_object(data, 'commit')
-    master_path = os.path.join('.git', 'refs', 'heads', 'master')
-    write_file(master_path, (sha1 + '\n').encode())
-    print('committed to master: {:7}'.format(sha1))
-    return sha1
+    src, _, dst = refspec.partition(':')
+    if not src:
+        if not dst.startswith('refs/'):
+            raise ValueError('deleting requires a full ref name, got {!r}'.format(dst))
+        return (None, dst)
+    sha1 = resolve_revision(src)
+    if not dst:
+        dst = expand_ref_name(src)
+        if dst is None:
+            raise ValueError('cannot push {!r} without a destination ref'.format(src))
+    elif not dst.startswith('refs/'):
+        source = expand_ref_name(src) or ''
+        dst = ('refs/tags/' if source.startswith('refs/tags/') else 'refs/heads/') + dst
+    check_ref_name(dst)
+    return (sha1, dst)
 
 
-def extract_lines(data):
-    """从给定的服务器数据提取行列表。"""
-    lines = []
-    i = 0
-    for _ in range(1000):
-        line_length = int(data[i:i + 4], 16)
-        line = data[i + 4:i + line_length]
-        lines.append(line)
-        if line_length == 0:
-            i += 4
+def push(git_url, refspecs=None, username=None, password=None):
+    """把给定的引用(refspec列表，默认是当前分支)推到给定的git repo URL，
+    所有引用在同一个receive-pack请求中更新。包文件边生成边用分块传输编码发送，
+    不会整个放进内存；获取远程信息和推送使用同一个keep-alive连接。
+    返回tuple(RefUpdate列表, 发送的对象的sha - 1集合)。
+    """
+    if username is None:
+        username = os.environ['GIT_USERNAME']
+    if password is None:
+        password = os.environ['GIT_PASSWORD']
+    if not refspecs:
+        head = read_symbolic_ref('HEAD')
+        if head is None:
+            raise ValueError('HEAD is detached, give the refs to push')
+        refspecs = [head]
+    remote_refs, capabilities = get_remote_refs(git_url, username, password,
+                                                service='git-receive-pack')
+    updates = []
+    for refspec in refspecs:
+        local_sha1, name = parse_refspec(refspec)
+        remote_sha1 = remote_refs.get(name)
+        if local_sha1 == remote_sha1:
+            print('{} is up to date'.format(name))
+        elif local_sha1 is None and 'delete-refs' not in capabilities:
+            raise ValueError('remote does not support deleting refs')
         else:
-            i += line_length
-        if i >= len(data):
-            break
-    return lines
+            updates.append(RefUpdate(name, remote_sha1, local_sha1))
+    if not updates:
+        return (updates, set())
+    local_sha1s = [u.new_sha1 for u in updates if u.new_sha1 is not None]
+    missing = find_missing_objects(local_sha1s, list(remote_refs.values())) \
+        if local_sha1s else set()
+    for update in updates:
+        print('updating remote {} from {} to {}'.format(
+            update.name, update.old_sha1 or 'nothing', update.new_sha1 or 'nothing'))
+    print('sending {} object{}'.format(len(missing), '' if len(missing) == 1 else 's'))
+    lines = ['{} {} {}'.format(u.old_sha1 or ZERO_SHA1, u.new_sha1 or ZERO_SHA1, u.name)
+             for u in updates]
+    lines[0] += '\x00 report-status'
+    lines = [(line + '\n').encode() for line in lines]
+    chunks = [build_lines_data(lines)]
+    if local_sha1s:
+        chunks = itertools.chain(chunks, iter_pack(missing, ofs_delta='ofs-delta' in capabilities))
+    url = git_url + '/git-receive-pack'
+    with PktLineReader(http_open(
+            url, username, password, data=coalesce_chunks(chunks),
+            content_type='application/x-git-receive-pack-request')) as reader:
+        lines = [line.decode().rstrip('\n') for line in reader.read_lines()]
+    if not lines or lines[0] != 'unpack ok':
+        raise ValueError('remote unpack failed: {!r}'.format(lines[:1]))
+    statuses = {}
+    for line in lines[1:]:
+        status, _, rest = line.partition(' ')
+        name, _, reason = rest.partition(' ')
+        statuses[name] = (status, reason)
+    rejected = ['{} ({})'.format(u.name, statuses.get(u.name, ('', 'no status'))[1])
+                for u in updates if statuses.get(u.name, ('',))[0] != 'ok']
+    if rejected:
+        raise ValueError('remote rejected ' + ', '.join(rejected))
+    return (updates, missing)
 
 
-def build_lines_data(lines):
-    """从给定的线路构建字节字符串到服务器。"""
-    result = []
-    for line in lines:
-        result.append('{:04x}'.format(len(line) + 5).encode())
-        result.append(line)
-        result.append(b'\n')
-    result.append(b'0000')
-    return b''.join(result)
+FETCH_CAPABILITIES = ['multi_ack_detailed', 'side-band-64k', 'ofs-delta', 'agent=pygit']
+HAVES_PER_ROUND = 32
+MAX_IN_VAIN = 256
 
 
-def http_request(url, username, password, data=None):
-    """对给定的URL进行一个经过验证的HTTP请求(默认情况下，如果“数据”不是没有的话)。
+class HaveWalker:
+    """fetch协商时按提交时间从新到旧生成要发送的本地提交(have)。
+    服务器确认为共同的提交后，它的祖先不再发送；队列中只剩共同的提交时结束。
     """
-    password_manager = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-    password_manager.add_password(None, url, username, password)
-    auth_handler = urllib.request.HTTPBasicAuthHandler(password_manager)
-    opener = urllib.request.build_opener(auth_handler)
-    f = opener.open(url, data=data)
-    return f.read()
 
+    def __init__(self, tips):
+        self.queue = []
+        self.queued = set()
+        self.seen = set()
+        self.common = set()
+        self.expanded = {}
+        self.uncommon = 0
+        for sha1 in tips:
+            self.push(sha1)
 
-def get_remote_master_hash(git_url, username, password):
-    """获取远程主分支的提交哈希，返回sha - 1十六进制字符串或没有远程提交。
+    def push(self, sha1):
+        if sha1 in self.seen:
+            return
+        self.seen.add(sha1)
+        heapq.heappush(self.queue, (-get_commit_node(sha1).commit_time, sha1))
+        self.queued.add(sha1)
+        if sha1 not in self.common:
+            self.uncommon += 1
+
+    def mark_common(self, sha1):
+        """把提交和(已经展开的)祖先标记为共同的。"""
+        stack = [sha1]
+        while stack:
+            sha1 = stack.pop()
+            if sha1 in self.common:
+                continue
+            if sha1 in self.queued:
+                self.uncommon -= 1
+            self.common.add(sha1)
+            stack.extend(self.expanded.get(sha1, ()))
+
+    def next_batch(self, count):
+        """返回最多count个下一批要发送的提交。"""
+        batch = []
+        while self.uncommon and len(batch) < count:
+            _, sha1 = heapq.heappop(self.queue)
+            self.queued.remove(sha1)
+            node = get_commit_node(sha1)
+            self.expanded[sha1] = node.parents
+            if sha1 in self.common:
+                for parent in node.parents:
+                    self.mark_common(parent)
+            else:
+                self.uncommon -= 1
+                batch.append(sha1)
+            for parent in node.parents:
+                self.push(parent)
+        return batch
+
+
+def choose_capabilities(server_capabilities):
+    """从FETCH_CAPABILITIES中选出服务器支持的功能(必要时退回旧的变体)。"""
+    fallbacks = {'multi_ack_detailed': 'multi_ack', 'side-band-64k': 'side-band'}
+    chosen = []
+    for capability in FETCH_CAPABILITIES:
+        if capability in server_capabilities or capability.startswith('agent='):
+            chosen.append(capability)
+        elif fallbacks.get(capability) in server_capabilities:
+            chosen.append(fallbacks[capability])
+    return chosen
+
+
+def negotiate_fetch(git_url, wants, haves, capabilities, username=None, password=None):
+    """和upload-pack协商(无状态的智能HTTP，每轮重新发送wants和已确认的共同提交)，
+    最后发送done。返回响应的PktLineReader，已经读过ACK/NAK行，接下来是包文件数据。
     """
-    url = git_url + '/info/refs?service=git-receive-pack'
-    response = http_request(url, username, password)
-    lines = extract_lines(response)
-    assert lines[0] == b'# service=git-receive-pack\n'
-    assert lines[1] == b''
-    if lines[2][:40] == b'0' * 40:
-        return None
-    master_sha1, master_ref = lines[2].split(b'\x00')[0].split()
-    assert master_ref == b'refs/heads/master'
-    assert len(master_sha1) == 40
-    return master_sha1.decode()
+    url = git_url + '/git-upload-pack'
+    request_lines = [pkt_line('want {} {}\n'.format(wants[0], ' '.join(capabilities)).encode())]
+    request_lines.extend(pkt_line('want {}\n'.format(w).encode()) for w in wants[1:])
+    request_lines.append(FLUSH_PKT)
+    walker = HaveWalker(haves)
+    common = []
+    in_vain = 0
+    ready = False
+    while True:
+        batch = [] if ready else walker.next_batch(HAVES_PER_ROUND)
+        done = not batch or in_vain >= MAX_IN_VAIN
+        body = request_lines + [pkt_line('have {}\n'.format(s).encode())
+                                for s in common + batch]
+        body.append(pkt_line(b'done\n') if done else FLUSH_PKT)
+        reader = PktLineReader(http_open(
+            url, username, password, data=b''.join(body),
+            content_type='application/x-git-upload-pack-request'))
+        while True:
+            line = reader.read()
+            if line is None:
+                reader.close()
+                raise ValueError('unexpected end of negotiation response')
+            if isinstance(line, Pkt):
+                continue
+            words = bytes(line).decode().split()
+            if words[0] == 'NAK' or (words[0] == 'ACK' and len(words) == 2):
+                break
+            if words[0] != 'ACK':
+                reader.close()
+                raise ValueError('unexpected negotiation line {!r}'.format(bytes(line)))
+            if words[1] not in walker.common:
+                common.append(words[1])
+                walker.mark_common(words[1])
+                in_vain = 0
+            if words[2] == 'ready':
+                ready = True
+        if done:
+            return reader
+        reader.close()
+        in_vain += len(batch)
 
 
-def read_tree(sha1=None, data=None):
-    """使用给定的sha - 1(十六进制字符串)或数据读取树对象，并返回(模式、路径、sha1)元组的列表。
+def iter_side_band(reader, progress=None):
+    """从side-band流(PktLineReader)中生成包文件数据块(通道1)；通道2的进度信息
+    写到progress，通道3的错误信息抛出ValueError。
     """
-    if sha1 is not None:
-        obj_type, data = read_object(sha1)
-        assert obj_type == 'tree'
-    elif data is None:
-        raise TypeError('must specify "sha1" or "data"')
-    i = 0
-    entries = []
-    for _ in range(1000):
-        end = data.find(b'\x00', i)
-        if end == -1:
-            break
-        mode_str, path = data[i:end].decode().split()
-        mode = int(mode_str, 8)
-        digest = data[end + 1:end + 21]
-        entries.append((mode, path, digest.hex()))
-        i = end + 1 + 20
-    return entries
+    for line in reader:
+        if isinstance(line, Pkt):
+            return
+        band = line[0]
+        if band == 1:
+            yield line[1:]
+        elif band == 2:
+            if progress is not None:
+                progress.write(bytes(line[1:]).decode(errors='replace'))
+                progress.flush()
+        elif band == 3:
+            raise ValueError('remote error: {}'.format(
+                bytes(line[1:]).decode(errors='replace').strip()))
+        else:
+            raise ValueError('invalid side-band channel {}'.format(band))
 
 
-def find_tree_objects(tree_sha1):
-    """返回树中的所有对象的sha - 1散列(递归地)，包括树本身的散列。
+def has_object(sha1):
+    """如果对象存储中有给定的对象则返回True。"""
+    try:
+        locate_object(sha1)
+    except ValueError:
+        return False
+    return True
+
+
+def fetch(git_url, username=None, password=None, progress=None):
+    """从给定的git repo URL(智能HTTP，upload-pack)获取所有远程分支和标签的提交和对象，
+    包文件一边接收一边写入磁盘并建立索引。远程分支保存在refs/remotes/origin/下，
+    标签保存在refs/tags/下(不覆盖已有的不同标签)。
+    返回远程主分支的sha - 1，远程没有主分支时返回None。
     """
-    objects = {tree_sha1}
-    for mode, path, sha1 in read_tree(sha1=tree_sha1):
-        if stat.S_ISDIR(mode):
-            objects.update(find_tree_objects(sha1))
+    refs, server_capabilities = get_remote_refs(git_url, username, password)
+    fetched = {name: sha1 for name, sha1 in refs.items()
+               if name.startswith(('refs/heads/', 'refs/tags/')) and
+               not name.endswith('^{}')}
+    wants = sorted({sha1 for sha1 in fetched.values() if not has_object(sha1)})
+    if wants:
+        capabilities = choose_capabilities(server_capabilities)
+        haves = [sha1 for sha1 in find_ref_commits() if has_object(sha1)]
+        with negotiate_fetch(git_url, wants, haves, capabilities,
+                             username, password) as reader:
+            if any(c.startswith('side-band') for c in capabilities):
+                chunks = iter_side_band(reader, progress)
+            else:
+                chunks = reader.iter_remaining()
+            pack_sha1 = index_pack_stream(chunks)
+        print('received pack {}'.format(pack_sha1))
+    for name, sha1 in sorted(fetched.items()):
+        if name.startswith('refs/heads/'):
+            update_ref('refs/remotes/origin/' + name[len('refs/heads/'):], sha1)
         else:
-            objects.add(sha1)
-    return objects
+            current = read_ref(name)
+            if current is None:
+                update_ref(name, sha1, old_sha1=ZERO_SHA1)
+            elif current != sha1:
+                print('warning: not updating existing tag {}'.format(name[len('refs/tags/'):]))
+    return refs.get('refs/heads/master')
 
 
-def find_commit_objects(commit_sha1):
-    """返回集合中的所有对象的sha - 1散列(递归地)、它的树、它的父类以及提交本身的散列。
+def diff_trees(old_tree, new_tree, prefix=''):
+    """比较两棵树(sha - 1，可以是None表示空树)，返回字典：路径 -> tuple(old, new)，
+    old和new是文件的(模式, sha - 1)，文件不存在时为None。sha - 1相同的子树
+    直接跳过，不读取，所以代价和变化的目录数成正比。
     """
-    objects = {commit_sha1}
-    obj_type, commit = read_object(commit_sha1)
-    assert obj_type == 'commit'
-    lines = commit.decode().splitlines()
-    tree = next(l[5:45] for l in lines if l.startswith('tree '))
-    objects.update(find_tree_objects(tree))
-    parents = (l[7:47] for l in lines if l.startswith('parent '))
-    for parent in parents:
-        objects.update(find_commit_objects(parent))
-    return objects
+    old = {path: (mode, sha1) for mode, path, sha1 in read_tree(old_tree)} \
+        if old_tree is not None else {}
+    new = {path: (mode, sha1) for mode, path, sha1 in read_tree(new_tree)} \
+        if new_tree is not None else {}
+    changes = {}
+    for name in sorted(old.keys() | new.keys()):
+        old_item, new_item = old.get(name), new.get(name)
+        if old_item == new_item:
+            continue
+        path = prefix + name
+        old_is_dir = old_item is not None and stat.S_ISDIR(old_item[0])
+        new_is_dir = new_item is not None and stat.S_ISDIR(new_item[0])
+        if old_is_dir or new_is_dir:
+            changes.update(diff_trees(old_item[1] if old_is_dir else None,
+                                      new_item[1] if new_is_dir else None, path + '/'))
+        old_file = None if old_is_dir else old_item
+        new_file = None if new_is_dir else new_item
+        if old_file != new_file:
+            changes[path] = (old_file, new_file)
+    return changes
 
 
-def find_missing_objects(local_sha1, remote_sha1):
-    """返回在远程(基于给定的远程提交散列)的本地提交中丢失的对象的sha - 1散列。
+def working_copy_state(path, index, i):
+    """返回工作副本中文件的(模式, sha - 1)，不存在时返回None。stat数据和索引条目i
+    一致(并且不是racy)时直接使用索引中的sha - 1，否则重新计算散列。
     """
-    local_objects = find_commit_objects(local_sha1)
-    if remote_sha1 is None:
-        return local_objects
-    remote_objects = find_commit_objects(remote_sha1)
-    return local_objects - remote_objects
+    try:
+        st = os.lstat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        return 'directory'
+    if i is not None and index.stat_data(i) == struct.pack('!10L', *stat_fields(st)) and \
+            not is_racy(index.entry_mtime_ns(i), index.mtime_ns):
+        return (index[i].mode, index[i].sha1.hex())
+    if stat.S_ISLNK(st.st_mode):
+        sha1 = hash_object(os.fsencode(os.readlink(path)), 'blob', write=False)
+    else:
+        sha1 = hash_object_file(path, write=False)
+    return (normalize_mode(st.st_mode), sha1)
 
 
-def encode_pack_object(obj):
-    """为包文件和返回字节(后面是压缩的数据字节)编码单个对象。
+def checkout_file(path, mode, sha1):
+    """把对象写到工作副本的给定路径(已有的文件先删除)，返回新的索引条目。
+    普通文件的数据逐块写出，不会整个放进内存。
     """
-    obj_type, data = read_object(obj)
-    type_num = ObjectType[obj_type].value
-    size = len(data)
-    byte = (type_num << 4) | (size & 0x0f)
-    size >>= 4
-    header = []
-    while size:
-        header.append(byte | 0x80)
-        byte = size & 0x7f
-        size >>= 7
-    header.append(byte)
-    return bytes(header) + zlib.compress(data)
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+    if mode == 0o160000:
+        os.makedirs(path, exist_ok=True)
+        return IndexEntry(0, 0, 0, 0, 0, 0, mode, 0, 0, 0, bytes.fromhex(sha1),
+                          len(path.encode()), path)
+    obj_type, _, chunks = stream_object(sha1)
+    if stat.S_ISLNK(mode):
+        os.symlink(b''.join(chunks), os.fsencode(path))
+    else:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                     0o777 if mode & 0o111 else 0o666)
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    return entry_from_stat(path, bytes.fromhex(sha1), os.lstat(path))
 
 
-def create_pack(objects):
-    """创建包文件，包含给定给定的sha - 1哈希集合中的所有对象，返回完整包文件的数据字节。
+def remove_empty_dirs(paths):
+    """删除给定路径的父目录中变空的目录(从深到浅)。"""
+    dirs = set()
+    for path in paths:
+        i = path.rfind('/')
+        while i > 0:
+            dirs.add(path[:i])
+            i = path.rfind('/', 0, i)
+    for dir_path in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(dir_path)
+        except OSError:
+            pass
+
+
+def switch_tree(old_tree, new_tree, update=True, jobs=1, force=False):
+    """把索引(update为True时还有工作副本)从old_tree切换到new_tree(git read-tree
+    -m -u old new的两路合并)。只处理两棵树中不同的路径：没有变化的目录不读取，
+    没有变化的文件不重写；要写的文件用jobs个线程并发写出，写完后用新的stat数据
+    一次更新索引。变化的路径在索引或工作副本中有本地修改时抛出ValueError，
+    不修改任何文件(force为True时覆盖本地修改)。返回写出或删除的文件数。
     """
-    header = struct.pack('!4sLL', b'PACK', 2, len(objects))
-    body = b''.join(encode_pack_object(o) for o in sorted(objects))
-    contents = header + body
-    sha1 = hashlib.sha1(contents).digest()
-    data = contents + sha1
-    return data
+    changes = diff_trees(old_tree, new_tree)
+    with IndexLock() as lock, IndexFile() as index:
+        conflicts = []
+        to_remove = []
+        to_write = []
+        new_entries = []
+        removed = {path for path, (_, new) in changes.items() if new is None}
+        for path in sorted(changes):
+            old, new = changes[path]
+            i = index.find(path)
+            staged = (index[i].mode, index[i].sha1.hex()) if i is not None else None
+            if not force and staged != old and staged != new:
+                conflicts.append(path)
+                continue
+            if not update:
+                if new is not None:
+                    new_entries.append(IndexEntry(0, 0, 0, 0, 0, 0, new[0], 0, 0, 0,
+                                                  bytes.fromhex(new[1]),
+                                                  len(path.encode()), path))
+                continue
+            current = working_copy_state(path, index, i)
+            if current == 'directory':
+                under = list(walk_working_copy([path]))
+                current = None if all(p in removed for p in under) else current
+            elif new is not None and current is None and not force and \
+                    any(os.path.lexists(d) and not os.path.isdir(d) and d not in removed
+                        for d in parent_dirs(path)):
+                current = 'blocked'
+            if not force and current != old and current != new:
+                conflicts.append(path)
+            elif new is None:
+                if current is not None:
+                    to_remove.append(path)
+            elif current != new:
+                to_write.append((path, new[0], new[1]))
+            else:
+                new_entries.append(entry_from_stat(path, bytes.fromhex(new[1]),
+                                                   os.lstat(path)))
+        if conflicts:
+            raise ValueError('local changes to the following files would be overwritten:\n' +
+                             '\n'.join('\t' + p for p in conflicts))
+        for path in to_remove:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+        remove_empty_dirs(to_remove)
+        for path, _, _ in to_write:
+            parent = os.path.dirname(path)
+            if parent:
+                for dir_path in parent_dirs(path):
+                    if os.path.lexists(dir_path) and not os.path.isdir(dir_path):
+                        os.remove(dir_path)
+                os.makedirs(parent, exist_ok=True)
+        if jobs > 1 and len(to_write) > 1:
+            with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+                new_entries.extend(executor.map(lambda w: checkout_file(*w), to_write))
+        else:
+            new_entries.extend(checkout_file(*w) for w in to_write)
+        extensions = index.extensions()
+        cache_tree = parse_cache_tree(extensions.get(b'TREE', b''))
+        for path in changes:
+            invalidate_cache_tree(cache_tree, path)
+        extensions[b'TREE'] = build_cache_tree_data(cache_tree)
+        entries = [e for e in index if e.path not in changes]
+        entries.extend(new_entries)
+        entries.sort(key=operator.attrgetter('path'))
+        write_index(entries, extensions, lock=lock)
+    return len(to_write) + len(to_remove)
 
 
-def push(git_url, username=None, password=None):
-    """将主分支推到给定的git repo URL。"""
-    if username is None:
-        username = os.environ['GIT_USERNAME']
-    if password is None:
-        password = os.environ['GIT_PASSWORD']
-    remote_sha1 = get_remote_master_hash(git_url, username, password)
-    local_sha1 = get_local_master_hash()
-    missing = find_missing_objects(local_sha1, remote_sha1)
-    print('updating remote master from {} to {} ({} object{})'.format(
-        remote_sha1 or 'no commits', local_sha1, len(missing),
-        '' if len(missing) == 1 else 's'))
-    lines = ['{} {} refs/heads/master\x00 report-status'.format(
-        remote_sha1 or ('0' * 40), local_sha1).encode()]
-    data = build_lines_data(lines) + create_pack(missing)
-    url = git_url + '/git-receive-pack'
-    response = http_request(url, username, password, data=data)
-    lines = extract_lines(response)
-    assert len(lines) >= 2, \
-        'expected at least 2 lines, got {}'.format(len(lines))
-    assert lines[0] == b'unpack ok\n', \
-        "expected line 1 b'unpack ok', got: {}".format(lines[0])
-    assert lines[1] == b'ok refs/heads/master\n', \
-        "expected line 2 b'ok refs/heads/master\n', got: {}".format(lines[1])
-    return (remote_sha1, missing)
+def parent_dirs(path):
+    """返回路径的所有父目录(从浅到深)，例如'a/b/c'返回['a', 'a/b']。"""
+    parts = path.split('/')[:-1]
+    return ['/'.join(parts[:i + 1]) for i in range(len(parts))]
+
+
+def commit_tree(sha1):
+    """返回提交(或标签剥离后的提交)的树的sha - 1，也接受树的sha - 1。"""
+    obj_type, sha1 = peel(sha1)
+    if obj_type == 'commit':
+        return read_commit(sha1).tree
+    if obj_type != 'tree':
+        raise ValueError('{} is a {}, not a commit or tree'.format(sha1, obj_type))
+    return sha1
+
+
+def get_head_tree():
+    """返回HEAD指向的提交的树，还没有提交时返回None。"""
+    head = get_head_hash()
+    return read_commit(head).tree if head is not None else None
+
+
+def checkout(revision, new_branch=None, jobs=1, force=False):
+    """切换到给定的分支(HEAD指向它)或其他提交(分离的HEAD)，new_branch不为None时
+    在该提交上创建新分支并切换过去。只写出和当前HEAD不同的文件。
+    """
+    obj_type, sha1 = peel(resolve_revision(revision))
+    if obj_type != 'commit':
+        raise ValueError('{!r} is not a commit'.format(revision))
+    if new_branch is not None:
+        check_ref_name('refs/heads/' + new_branch)
+        if read_ref('refs/heads/' + new_branch) is not None:
+            raise ValueError('branch {!r} already exists'.format(new_branch))
+    count = switch_tree(get_head_tree(), read_commit(sha1).tree, jobs=jobs, force=force)
+    if new_branch is not None:
+        branch_ref = 'refs/heads/' + new_branch
+        update_ref(branch_ref, sha1, old_sha1=ZERO_SHA1)
+    else:
+        name = expand_ref_name(revision)
+        branch_ref = name if name is not None and name.startswith('refs/heads/') else None
+    if branch_ref is not None:
+        write_symbolic_ref('HEAD', branch_ref)
+        print('switched to branch {!r} ({} file{} updated)'.format(
+            branch_ref[len('refs/heads/'):], count, '' if count == 1 else 's'))
+    else:
+        with LockFile(ref_path('HEAD')) as lock:
+            lock.commit((sha1 + '\n').encode())
+        print('HEAD is now at {:7} ({} file{} updated)'.format(
+            sha1, count, '' if count == 1 else 's'))
+    return sha1
 
 
+def clone(git_url, directory, username=None, password=None, progress=None, jobs=1):
+    """把给定的git repo URL克隆到新目录中：获取对象，设置主分支，
+    写出工作副本(jobs个线程并发写文件)和索引。
+    """
+    init(directory)
+    old_cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        sha1 = fetch(git_url, username, password, progress=progress)
+        if sha1 is None:
+            print('warning: cloned an empty repository')
+            return None
+        update_ref('refs/heads/master', sha1, old_sha1=ZERO_SHA1)
+        switch_tree(None, read_commit(sha1).tree, jobs=jobs)
+        return sha1
+    finally:
+        close_packs()
+        os.chdir(old_cwd)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     sub_parsers = parser.add_subparsers(dest='command', metavar='command')
@@ -474,19 +5164,72 @@ if __name__ == '__main__':
     sub_parser = sub_parsers.add_parser('add',
                                         help='add file(s) to index')
     sub_parser.add_argument('paths', nargs='+', metavar='path',
-                            help='path(s) of files to add')
+                            help='path(s) of files or directories to add')
+    sub_parser.add_argument('-f', '--force', action='store_true',
+                            help='also add ignored files')
+    sub_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='number of files to hash in parallel (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('branch',
+                                        help='list, create or delete branches')
+    sub_parser.add_argument('name', nargs='?',
+                            help='name of branch to create or delete (lists branches if '
+                                 'not given)')
+    sub_parser.add_argument('start_point', nargs='?',
+                            help='commit the new branch points to (default HEAD)')
+    sub_parser.add_argument('-d', '--delete', action='store_true',
+                            help='delete the branch')
 
     sub_parser = sub_parsers.add_parser('cat-file',
                                         help='display contents of object')
     valid_modes = ['commit', 'tree', 'blob', 'size', 'type', 'pretty']
-    sub_parser.add_argument('mode', choices=valid_modes,
+    sub_parser.add_argument('mode', nargs='?', choices=valid_modes,
                             help='object type (commit, tree, blob) or display mode (size, '
                                  'type, pretty)')
-    sub_parser.add_argument('hash_prefix',
+    sub_parser.add_argument('hash_prefix', nargs='?',
                             help='SHA-1 hash (or hash prefix) of object to display')
+    sub_parser.add_argument('--batch', action='store_true',
+                            help='read object names from stdin and print info and contents '
+                                 'of each')
+    sub_parser.add_argument('--batch-check', action='store_true',
+                            help='read object names from stdin and print info of each')
+    sub_parser.add_argument('--buffer', action='store_true',
+                            help='do not flush output after each object in batch mode')
+
+    sub_parser = sub_parsers.add_parser('check-ignore',
+                                        help='print the given paths that are ignored')
+    sub_parser.add_argument('paths', nargs='+', metavar='path',
+                            help='path(s) to check against .gitignore and info/exclude')
+
+    sub_parser = sub_parsers.add_parser('checkout',
+                                        help='switch working copy and index to a branch or commit')
+    sub_parser.add_argument('revision',
+                            help='branch, tag or SHA-1 hash (or hash prefix) of commit')
+    sub_parser.add_argument('-b', dest='new_branch',
+                            help='create a new branch at revision and switch to it')
+    sub_parser.add_argument('-f', '--force', action='store_true',
+                            help='overwrite local changes to files that differ')
+    sub_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='number of files to write in parallel (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('clone',
+                                        help='clone master branch of given git server URL into '
+                                             'new directory')
+    sub_parser.add_argument('git_url',
+                            help='URL of git repo, eg: https://github.com/benhoyt/pygit.git')
+    sub_parser.add_argument('directory',
+                            help='directory to create the repository in')
+    sub_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='number of files to write in parallel (default %(default)r)')
+    sub_parser.add_argument('-p', '--password',
+                            help='password to use for authentication (uses GIT_PASSWORD '
+                                 'environment variable if set)')
+    sub_parser.add_argument('-u', '--username',
+                            help='username to use for authentication (uses GIT_USERNAME '
+                                 'environment variable if set)')
 
     sub_parser = sub_parsers.add_parser('commit',
-                                        help='commit current state of index to master branch')
+                                        help='commit current state of index to current branch')
     sub_parser.add_argument('-a', '--author',
                             help='commit author in format "A U Thor <author@example.com>" '
                                  '(uses GIT_AUTHOR_NAME and GIT_AUTHOR_EMAIL environment '
@@ -494,15 +5237,65 @@ if __name__ == '__main__':
     sub_parser.add_argument('-m', '--message', required=True,
                             help='text of commit message')
 
+    sub_parser = sub_parsers.add_parser('commit-graph',
+                                        help='write commit-graph file for fast history walks')
+    sub_parser.add_argument('action', choices=['write'],
+                            help='action to perform (only "write" is supported)')
+
     sub_parser = sub_parsers.add_parser('diff',
                                         help='show diff of files changed (between index and working '
                                              'copy)')
+    sub_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='number of files to hash in parallel (default %(default)r)')
+    sub_parser.add_argument('-U', '--unified', type=int, default=3,
+                            help='number of context lines (default %(default)r)')
+    sub_parser.add_argument('--stat', action='store_true',
+                            help='show number of changed lines per file instead of diff')
+    sub_parser.add_argument('--name-only', action='store_true',
+                            help='show only names of changed files')
+
+    sub_parser = sub_parsers.add_parser('fetch',
+                                        help='fetch branches and tags of given git server URL '
+                                             'into refs/remotes/origin and refs/tags')
+    sub_parser.add_argument('git_url',
+                            help='URL of git repo, eg: https://github.com/benhoyt/pygit.git')
+    sub_parser.add_argument('-p', '--password',
+                            help='password to use for authentication (uses GIT_PASSWORD '
+                                 'environment variable if set)')
+    sub_parser.add_argument('-u', '--username',
+                            help='username to use for authentication (uses GIT_USERNAME '
+                                 'environment variable if set)')
+
+    sub_parser = sub_parsers.add_parser('fsck',
+                                        help='verify all objects and their connectivity')
+    sub_parser.add_argument('-j', '--jobs', type=int,
+                            help='number of processes to check objects in (default: one '
+                                 'per CPU)')
+
+    sub_parser = sub_parsers.add_parser('fsmonitor',
+                                        help='run filesystem monitor daemon used by status '
+                                             'when core.fsmonitor is set')
+    sub_parser.add_argument('action', choices=['run', 'start', 'stop'],
+                            help='run in foreground, start in background or stop daemon')
+    sub_parser.add_argument('--poll', action='store_true',
+                            help='poll working copy instead of using inotify')
+
+    sub_parser = sub_parsers.add_parser('gc',
+                                        help='pack loose objects into a single packfile (with .idx) '
+                                             'and refs into packed-refs')
+    sub_parser.add_argument('-b', '--write-bitmap-index', action='store_true', default=None,
+                            help='also write reachability bitmaps for the new pack')
 
     sub_parser = sub_parsers.add_parser('hash-object',
                                         help='hash contents of given path (and optionally write to '
                                              'object store)')
-    sub_parser.add_argument('path',
+    sub_parser.add_argument('path', nargs='?',
                             help='path of file to hash')
+    sub_parser.add_argument('--stdin-paths', action='store_true',
+                            help='read file paths from stdin (one per line) instead of '
+                                 'from the command line')
+    sub_parser.add_argument('--buffer', action='store_true',
+                            help='do not flush output after each path with --stdin-paths')
     sub_parser.add_argument('-t', choices=['commit', 'tree', 'blob'],
                             default='blob', dest='type',
                             help='type of object (default %(default)r)')
@@ -520,10 +5313,34 @@ if __name__ == '__main__':
                             help='show object details (mode, hash, and stage number) in '
                                  'addition to path')
 
+    sub_parser = sub_parsers.add_parser('log',
+                                        help='show commit history (uses commit-graph if present)')
+    sub_parser.add_argument('commit', nargs='?',
+                            help='commit or ref to start from (default HEAD)')
+    sub_parser.add_argument('-n', '--max-count', type=int,
+                            help='limit the number of commits to show')
+    sub_parser.add_argument('--oneline', action='store_true',
+                            help='show each commit as abbreviated hash and subject')
+
+    sub_parser = sub_parsers.add_parser('merge-base',
+                                        help='answer ancestry questions between commits')
+    sub_parser.add_argument('--is-ancestor', action='store_true', required=True,
+                            help='exit with status 0 if first commit is an ancestor of the '
+                                 'second, 1 otherwise')
+    sub_parser.add_argument('commits', nargs=2, metavar='commit',
+                            help='ref name or SHA-1 hash (or hash prefix) of commit')
+
+    sub_parser = sub_parsers.add_parser('pack-refs',
+                                        help='move all refs into the packed-refs file')
+
     sub_parser = sub_parsers.add_parser('push',
-                                        help='push master branch to given git server URL')
+                                        help='push refs (default current branch) to given git '
+                                             'server URL')
     sub_parser.add_argument('git_url',
                             help='URL of git repo, eg: https://github.com/benhoyt/pygit.git')
+    sub_parser.add_argument('refspecs', nargs='*', metavar='refspec',
+                            help='ref to push as "src", "src:dst" or ":dst" to delete '
+                                 '(default current branch)')
     sub_parser.add_argument('-p', '--password',
                             help='password to use for authentication (uses GIT_PASSWORD '
                                  'environment variable by default)')
@@ -531,32 +5348,197 @@ if __name__ == '__main__':
                             help='username to use for authentication (uses GIT_USERNAME '
                                  'environment variable by default)')
 
+    sub_parser = sub_parsers.add_parser('read-tree',
+                                        help='read tree into index, switching from the HEAD tree '
+                                             '(like git read-tree -m HEAD tree)')
+    sub_parser.add_argument('tree',
+                            help='tree or commit to read (ref name or SHA-1 hash prefix)')
+    sub_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='number of files to write in parallel (default %(default)r)')
+    sub_parser.add_argument('-u', action='store_true', dest='update',
+                            help='also update files in working copy')
+
+    sub_parser = sub_parsers.add_parser('show-ref',
+                                        help='list refs and the objects they point to')
+    sub_parser.add_argument('prefix', nargs='?', default='refs/',
+                            help='only show refs starting with prefix (default %(default)r)')
+
     sub_parser = sub_parsers.add_parser('status',
                                         help='show status of working copy')
+    sub_parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='number of files to hash in parallel (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('tag',
+                                        help='list, create or delete tags')
+    sub_parser.add_argument('name', nargs='?',
+                            help='name of tag to create or delete (lists tags if not given)')
+    sub_parser.add_argument('commit', nargs='?',
+                            help='object the tag points to (default HEAD)')
+    sub_parser.add_argument('-a', '--author',
+                            help='tagger of annotated tag in format "A U Thor '
+                                 '<author@example.com>" (uses GIT_AUTHOR_NAME and '
+                                 'GIT_AUTHOR_EMAIL environment variables by default)')
+    sub_parser.add_argument('-d', '--delete', action='store_true',
+                            help='delete the tag')
+    sub_parser.add_argument('-m', '--message',
+                            help='create an annotated tag object with the given message')
+
+    sub_parser = sub_parsers.add_parser('verify-pack',
+                                        help='verify packed objects against their index')
+    sub_parser.add_argument('paths', nargs='+', metavar='path',
+                            help='path(s) of pack index (.idx) files')
+    sub_parser.add_argument('-j', '--jobs', type=int,
+                            help='number of processes to check objects in (default: one '
+                                 'per CPU)')
+    sub_parser.add_argument('-v', '--verbose', action='store_true',
+                            help='print SHA-1 hash, type and size of each object')
 
     args = parser.parse_args()
     if args.command == 'add':
-        add(args.paths)
+        try:
+            add(args.paths, jobs=args.jobs, force=args.force)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'branch':
+        try:
+            branch(args.name, args.start_point, delete=args.delete)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
     elif args.command == 'cat-file':
+        if args.batch or args.batch_check:
+            if args.mode or args.batch and args.batch_check:
+                parser.error('--batch and --batch-check take no other arguments')
+            cat_file_batch(sys.stdin.buffer, sys.stdout.buffer, contents=args.batch,
+                           buffer=args.buffer)
+            sys.exit(0)
+        if args.hash_prefix is None:
+            parser.error('cat-file requires mode and hash_prefix')
         try:
             cat_file(args.mode, args.hash_prefix)
         except ValueError as error:
             print(error, file=sys.stderr)
             sys.exit(1)
+    elif args.command == 'check-ignore':
+        matcher = IgnoreMatcher()
+        ignored = [p for p in args.paths
+                   if matcher.is_ignored(os.path.normpath(p).replace('\\', '/'))]
+        for path in ignored:
+            print(path)
+        sys.exit(0 if ignored else 1)
+    elif args.command == 'checkout':
+        try:
+            checkout(args.revision, new_branch=args.new_branch, jobs=args.jobs,
+                     force=args.force)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'clone':
+        clone(args.git_url, args.directory,
+              username=args.username or os.environ.get('GIT_USERNAME'),
+              password=args.password or os.environ.get('GIT_PASSWORD'),
+              progress=sys.stderr, jobs=args.jobs)
     elif args.command == 'commit':
         commit(args.message, author=args.author)
+    elif args.command == 'commit-graph':
+        print('wrote commit-graph with {} commits'.format(write_commit_graph()))
     elif args.command == 'diff':
-        diff()
+        diff(jobs=args.jobs, context=args.unified, show_stat=args.stat,
+             name_only=args.name_only)
+    elif args.command == 'fetch':
+        sha1 = fetch(args.git_url,
+                     username=args.username or os.environ.get('GIT_USERNAME'),
+                     password=args.password or os.environ.get('GIT_PASSWORD'),
+                     progress=sys.stderr)
+        print('origin/master is {}'.format(sha1 or 'empty'))
+    elif args.command == 'fsck':
+        result = fsck(jobs=args.jobs)
+        for error in result.errors:
+            print('error:', error)
+        for sha1 in result.dangling:
+            print('dangling commit', sha1)
+        print(format_throughput(result), file=sys.stderr)
+        sys.exit(1 if result.errors else 0)
+    elif args.command == 'fsmonitor':
+        if args.action == 'run':
+            run_fsmonitor(poll=args.poll)
+        elif args.action == 'start':
+            print('started fsmonitor daemon (pid {})'.format(start_fsmonitor(poll=args.poll)))
+        elif not stop_fsmonitor():
+            print('fsmonitor daemon is not running')
+    elif args.command == 'gc':
+        pack_sha1 = repack(write_bitmaps=args.write_bitmap_index)
+        if pack_sha1 is None:
+            print('nothing to pack')
+        else:
+            print('packed objects into pack-{}'.format(pack_sha1))
+        print('packed {} refs'.format(pack_refs()))
     elif args.command == 'hash-object':
-        sha1 = hash_object(read_file(args.path), args.type, write=args.write)
-        print(sha1)
+        if args.stdin_paths == (args.path is not None):
+            parser.error('hash-object requires either path or --stdin-paths')
+        if args.stdin_paths:
+            hash_object_batch(sys.stdin.buffer, sys.stdout.buffer, args.type,
+                              write=args.write, buffer=args.buffer)
+        else:
+            sha1 = hash_object_file(args.path, args.type, write=args.write)
+            print(sha1)
     elif args.command == 'init':
         init(args.repo)
     elif args.command == 'ls-files':
         ls_files(details=args.stage)
+    elif args.command == 'log':
+        try:
+            start = peel(resolve_revision(args.commit))[1] if args.commit else None
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        log(start, max_count=args.max_count, oneline=args.oneline)
+    elif args.command == 'merge-base':
+        try:
+            ancestor, descendant = [peel(resolve_revision(c))[1] for c in args.commits]
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        sys.exit(0 if is_ancestor(ancestor, descendant) else 1)
+    elif args.command == 'pack-refs':
+        print('packed {} refs'.format(pack_refs()))
     elif args.command == 'push':
-        push(args.git_url, username=args.username, password=args.password)
+        try:
+            push(args.git_url, args.refspecs, username=args.username, password=args.password)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'read-tree':
+        try:
+            count = switch_tree(get_head_tree(), commit_tree(resolve_revision(args.tree)),
+                                update=args.update, jobs=args.jobs)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        if args.update:
+            print('{} file{} updated'.format(count, '' if count == 1 else 's'))
+    elif args.command == 'show-ref':
+        for name, sha1 in list_refs(args.prefix):
+            print(sha1, name)
     elif args.command == 'status':
-        status()
+        status(jobs=args.jobs)
+    elif args.command == 'tag':
+        try:
+            tag(args.name, args.commit, message=args.message, author=args.author,
+                delete=args.delete)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+    elif args.command == 'verify-pack':
+        failed = False
+        for path in args.paths:
+            result = verify_pack(path, jobs=args.jobs, verbose=args.verbose)
+            for error in result.errors:
+                print('error:', error)
+            print('{}: {}'.format(path, 'bad' if result.errors else 'ok'))
+            print(format_throughput(result), file=sys.stderr)
+            failed = failed or bool(result.errors)
+        sys.exit(1 if failed else 0)
     else:
         assert False, 'unexpected command {!r}'.format(args.command)
\ No newline at end of file
@@ -0,0 +1,482 @@
+# coding=utf-8
+"""pygit的性能测试。每个测试在临时目录中创建一个合成仓库，打印结果表格。
+
+用法: python pygit_bench.py index -n 200000
+      python pygit_bench.py diff -n 100000
+      python pygit_bench.py pktline -n 1000000
+      python pygit_bench.py compression -s 8000000
+      python pygit_bench.py suite -n 10000 --history 50 --json results.json
+      python pygit_bench.py suite --compare results.json --profile profiles
+"""
+import argparse, cProfile, contextlib, gzip, hashlib, io, json, os, platform, random, shutil
+import sys, tempfile, time, tracemalloc
+
+import pygit
+
+
+@contextlib.contextmanager
+def temp_repo():
+    """在临时目录中创建一个空仓库并切换进去，结束后删除。"""
+    old_cwd = os.getcwd()
+    tmp_dir = tempfile.mkdtemp(prefix='pygit_bench_')
+    try:
+        os.chdir(tmp_dir)
+        pygit.init('repo')
+        os.chdir('repo')
+        yield
+    finally:
+        pygit.close_packs()
+        os.chdir(old_cwd)
+        shutil.rmtree(tmp_dir)
+
+
+def best_time(func, repeat=3):
+    """运行func repeat次，返回最短的耗时(秒)。"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def make_synthetic_paths(num_paths, depth=6, fanout=10):
+    """生成num_paths个类似大型单仓库的深层路径(已排序)。"""
+    paths = []
+    for i in range(num_paths):
+        parts = ['src']
+        n = i // 10
+        for level in range(depth):
+            parts.append('module_{:02}_level{}'.format(n % fanout, level))
+            n //= fanout
+        parts.append('file_{:06}.py'.format(i))
+        paths.append('/'.join(parts))
+    return sorted(paths)
+
+
+def make_synthetic_entries(paths):
+    """为给定路径生成索引条目(伪造的stat数据和sha - 1)。"""
+    return [pygit.IndexEntry(
+        1500000000, 0, 1500000000, 0, 2049, i, 0o100644, 1000, 1000, 100,
+        hashlib.sha1(path.encode()).digest(), len(path.encode()), path)
+        for i, path in enumerate(paths)]
+
+
+def bench_index(num_paths, depth):
+    """比较v2和v4索引的文件大小以及读取时间。"""
+    entries = make_synthetic_entries(make_synthetic_paths(num_paths, depth))
+    index_path = os.path.join('.git', 'index')
+
+    def open_index():
+        with pygit.IndexFile() as index:
+            for i in range(len(index)):
+                index.path_bytes(i)
+
+    results = {}
+    print('{} paths, directory depth {}'.format(num_paths, depth))
+    print('{:>8} {:>12} {:>12} {:>12} {:>12}'.format(
+        'version', 'size (KB)', 'write (s)', 'paths (s)', 'entries (s)'))
+    for version in (2, 4):
+        write_time = best_time(
+            lambda: pygit.write_index(entries, version=version), repeat=1)
+        size = os.path.getsize(index_path)
+        paths_time = best_time(open_index)
+        entries_time = best_time(pygit.read_index)
+        results[version] = (size, write_time, paths_time, entries_time)
+        print('{:>8} {:>12.0f} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+            version, size / 1024, write_time, paths_time, entries_time))
+    size2, _, paths2, _ = results[2]
+    size4, _, paths4, _ = results[4]
+    print('v4 is {:.0%} of v2 size, path scan {:.2f}x of v2 time'.format(
+        size4 / size2, paths4 / paths2))
+    return results
+
+
+def make_lockfile(num_packages, seed):
+    """生成一个类似package-lock.json的锁文件(每个包5行)。不同的seed得到
+    部分版本号不同的“重新生成”的锁文件。
+    """
+    lines = ['{\n', '  "packages": {\n']
+    for i in range(num_packages):
+        version = '1.{}.{}'.format(i % 7, (i * 31 + seed * (i % 20 == 0)) % 10)
+        integrity = hashlib.sha1('{}@{}'.format(i, version).encode()).hexdigest()
+        lines.extend([
+            '    "node_modules/pkg-{}": {{\n'.format(i),
+            '      "version": "{}",\n'.format(version),
+            '      "resolved": "https://registry/pkg-{0}-{1}.tgz",\n'.format(i, version),
+            '      "integrity": "sha1-{}"\n'.format(integrity),
+            '    },\n',
+        ])
+    lines.extend(['  }\n', '}\n'])
+    return ''.join(lines).encode()
+
+
+def bench_diff(num_lines):
+    """比较一个锁文件和重新生成的版本(5%的包版本变化)的diff时间。"""
+    old = make_lockfile(num_lines // 5, seed=0)
+    new = make_lockfile(num_lines // 5, seed=1)
+    old_lines = pygit.split_lines(old)
+    new_lines = pygit.split_lines(new)
+    changes = pygit.diff_lines(old_lines, new_lines)
+    diff_time = best_time(lambda: pygit.diff_lines(old_lines, new_lines))
+    hunks_time = best_time(lambda: sum(1 for _ in pygit.iter_hunks(
+        old_lines, new_lines, pygit.diff_lines(old_lines, new_lines))))
+    print('{} lines, {} changes ({} lines removed, {} added)'.format(
+        len(old_lines), len(changes), sum(i2 - i1 for i1, i2, _, _ in changes),
+        sum(j2 - j1 for _, _, j1, j2 in changes)))
+    print('diff_lines: {:.3f} s, with unified diff output: {:.3f} s'.format(
+        diff_time, hunks_time))
+    return diff_time, hunks_time
+
+
+def bench_pktline(num_lines, chunk_size):
+    """测试pkt-line编码和增量解析的吞吐量(类似引用通告的行)。"""
+    lines = ['{} refs/tags/v{}.{}\n'.format(hashlib.sha1(str(i).encode()).hexdigest(),
+                                           i // 1000, i % 1000).encode()
+             for i in range(num_lines)]
+    data = pygit.build_lines_data(lines)
+
+    def parse():
+        reader = pygit.PktLineReader(io.BytesIO(data), chunk_size=chunk_size)
+        count = len(reader.read_lines())
+        assert count == num_lines, 'parsed {} of {} lines'.format(count, num_lines)
+
+    encode_time = best_time(lambda: pygit.build_lines_data(lines))
+    parse_time = best_time(parse)
+    megabytes = len(data) / (1024 * 1024)
+    print('{} lines, {:.1f} MB, {} byte chunks'.format(num_lines, megabytes, chunk_size))
+    print('encode: {:.3f} s ({:.0f} MB/s), parse: {:.3f} s ({:.0f} MB/s)'.format(
+        encode_time, megabytes / encode_time, parse_time, megabytes / parse_time))
+    return encode_time, parse_time
+
+
+COMPRESSION_LEVELS = [-1, 0, 1, 3, 6, 9]
+
+
+def bench_compression(size, levels=COMPRESSION_LEVELS):
+    """测试不同core.compression级别下写松散对象(hash_object_file)的吞吐量和
+    对象文件的大小，数据有文本、随机字节和gzip文件三种。每种数据的最后一行
+    “auto”是默认配置：gzip文件按扩展名和魔数识别出来，只存储不压缩。
+    """
+    rng = random.Random(0)
+    text = make_file_data(rng, 'bench/data.txt', size)
+    files = [('text', 'data.txt', text),
+             ('random', 'data.bin', rng.randbytes(size)),
+             ('gzip', 'data.gz', gzip.compress(text))]
+    config_path = os.path.join('.git', 'config')
+    results = []
+    print('{:<8} {:>6} {:>10} {:>12} {:>7}'.format('data', 'level', 'MB/s', 'object size',
+                                                   'ratio'))
+    for name, path, data in files:
+        pygit.write_file(path, data)
+        runs = [(str(level), '[core]\n\tcompression = {}\n\tstoreCompressed = false\n'.format(
+            level)) for level in levels]
+        runs.append(('auto', '[core]\n\tstoreCompressed = true\n'))
+        for label, config in runs:
+            pygit.write_file(config_path, config.encode())
+            sha1 = pygit.hash_object_file(path)
+            object_path = os.path.join('.git', 'objects', sha1[:2], sha1[2:])
+            object_size = os.path.getsize(object_path)
+            seconds = best_time(lambda: pygit.hash_object_file(path))
+            os.remove(object_path)
+            pygit.forget_object_dir(os.path.dirname(object_path))
+            megabytes_per_second = len(data) / (1024 * 1024) / seconds
+            print('{:<8} {:>6} {:>10.1f} {:>12} {:>7.3f}'.format(
+                name, label, megabytes_per_second, object_size, object_size / len(data)))
+            results.append((name, label, megabytes_per_second, object_size))
+    return results
+
+
+def make_file_data(rng, path, size):
+    """生成大约size字节的文本文件内容(每行包含路径和随机数)。"""
+    lines = []
+    total = 0
+    while total < size:
+        line = '{} {} {:08x}\n'.format(path, len(lines), rng.getrandbits(32))
+        lines.append(line)
+        total += len(line)
+    return ''.join(lines).encode()
+
+
+def make_synthetic_repo(num_files, file_size, depth, fanout, seed=0):
+    """在当前仓库的工作副本中写出num_files个文件，返回路径列表。"""
+    rng = random.Random(seed)
+    paths = make_synthetic_paths(num_files, depth, fanout)
+    for path in paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pygit.write_file(path, make_file_data(rng, path, file_size))
+    return paths
+
+
+def modify_files(paths, fraction, rng):
+    """在fraction比例的文件末尾追加一行，返回修改的路径列表。"""
+    changed = rng.sample(paths, max(1, int(len(paths) * fraction)))
+    for path in changed:
+        with open(path, 'ab') as f:
+            f.write('changed {:08x}\n'.format(rng.getrandbits(32)).encode())
+    return changed
+
+
+def make_ignored_tree(num_files, fanout):
+    """写出.gitignore和被它忽略的node_modules目录(num_files个小文件)，
+    模拟构建输出和依赖目录。
+    """
+    pygit.write_file('.gitignore', b'node_modules/\n*.pyc\n')
+    for i in range(num_files):
+        dir_path = os.path.join('node_modules', 'pkg{}'.format(i % fanout),
+                                'lib{}'.format(i // fanout % fanout))
+        os.makedirs(dir_path, exist_ok=True)
+        pygit.write_file(os.path.join(dir_path, 'm{}.js'.format(i)), b'module\n')
+
+
+def quiet_commit(message):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return pygit.commit(message, author='Bench <bench@example.com>')
+
+
+def quiet_checkout(revision):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return pygit.checkout(revision, jobs=4)
+
+
+def run_cold(func):
+    """清空对象缓存后运行func，每次运行的起点相同。"""
+    pygit.object_cache.clear()
+    func()
+
+
+def run_instrumented(func, profile_path=None, trace_memory=False):
+    """运行一次func，可选地保存cProfile数据和记录内存峰值，返回内存峰值(KB)或None。"""
+    profiler = cProfile.Profile() if profile_path is not None else None
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        if profiler is not None:
+            profiler.runcall(run_cold, func)
+        else:
+            run_cold(func)
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    if profiler is not None:
+        profiler.dump_stats(profile_path)
+    return peak
+
+
+def run_scenario(func, repeat, profile_path=None, trace_memory=False):
+    """运行一个场景，返回结果字典(最短耗时，可选的内存峰值)。可以重复的场景
+    (repeat大于1)为cProfile和内存峰值额外各运行一次；只运行一次的场景会改变仓库
+    状态，所以在计时的那次运行中同时记录，结果中instrumented为True(耗时包含开销)。
+    """
+    result = {'repeat': repeat}
+    if repeat == 1 and (trace_memory or profile_path is not None):
+        start = time.perf_counter()
+        peak = run_instrumented(func, profile_path, trace_memory)
+        result['seconds'] = time.perf_counter() - start
+        result['instrumented'] = True
+    else:
+        result['seconds'] = best_time(lambda: run_cold(func), repeat)
+        peak = run_instrumented(func, trace_memory=True) if trace_memory else None
+        if profile_path is not None:
+            run_instrumented(func, profile_path)
+    if peak is not None:
+        result['peak_memory_kb'] = peak
+    return result
+
+
+def bench_suite(num_files, file_size, depth, fanout, history, modify_fraction,
+                only=None, profile_dir=None, trace_memory=False, seed=0):
+    """在合成仓库上依次运行所有场景(后面的场景依赖前面的状态)，
+    返回场景名 -> 结果字典的有序字典。only是要运行的场景名子串列表。
+    """
+    rng = random.Random(seed)
+    results = {}
+    state = {}
+
+    def scenario(name, func, repeat=3):
+        if only and not any(pattern in name for pattern in only):
+            func()
+            return
+        profile_path = None
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, name + '.prof')
+        result = run_scenario(func, repeat, profile_path, trace_memory)
+        results[name] = result
+        print('{:<28} {:>10.4f} s{}'.format(
+            name, result['seconds'],
+            '  {:>10} KB peak'.format(result['peak_memory_kb'])
+            if 'peak_memory_kb' in result else ''))
+
+    def commit_history():
+        for i in range(history):
+            modify_files(paths, 0.001, rng)
+            pygit.add(paths)
+            state['head'] = quiet_commit('commit {}'.format(i))
+
+    def run_diff(**kwargs):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            pygit.diff(**kwargs)
+
+    start = time.perf_counter()
+    paths = make_synthetic_repo(num_files, file_size, depth, fanout, seed)
+    print('{} files of {} bytes, depth {}, fanout {} (generated in {:.1f} s)'.format(
+        num_files, file_size, depth, fanout, time.perf_counter() - start))
+    scenario('add', lambda: pygit.add(paths), repeat=1)
+    scenario('add-unchanged', lambda: pygit.add(paths))
+    scenario('read-index', pygit.read_index)
+    entries = pygit.read_index()
+    scenario('write-index', lambda: pygit.write_index(entries))
+    scenario('status-clean', pygit.get_status)
+    scenario('write-tree', pygit.write_tree, repeat=1)
+    scenario('write-tree-cached', pygit.write_tree)
+    scenario('commit', lambda: state.update(root=quiet_commit('root commit')), repeat=1)
+    changed = modify_files(paths, modify_fraction, rng)
+    scenario('status-dirty', pygit.get_status)
+    scenario('diff', run_diff)
+    scenario('diff-stat', lambda: run_diff(show_stat=True))
+    pygit.add(changed)
+    state['head'] = quiet_commit('modify files')
+    scenario('commit-history', commit_history, repeat=1)
+    head, root = state['head'], state['root']
+    parent = pygit.read_commit(head).parents[0]
+    scenario('find-missing-all', lambda: state.update(
+        objects=pygit.find_missing_objects(head, None)))
+    scenario('find-missing-incremental', lambda: pygit.find_missing_objects(head, parent))
+    scenario('create-pack', lambda: pygit.create_pack(state['objects']), repeat=1)
+    scenario('repack-bitmaps', lambda: pygit.repack(write_bitmaps=True), repeat=1)
+    scenario('find-missing-all-bitmap', lambda: pygit.find_missing_objects(head, None))
+    scenario('find-missing-incr-bitmap', lambda: pygit.find_missing_objects(head, parent))
+    scenario('log-walk', lambda: sum(1 for _ in pygit.iter_history(head)))
+    scenario('is-ancestor', lambda: pygit.is_ancestor(root, head))
+    scenario('commit-graph-write', pygit.write_commit_graph, repeat=1)
+    scenario('log-walk-graph', lambda: sum(1 for _ in pygit.iter_history(head)))
+    scenario('is-ancestor-graph', lambda: pygit.is_ancestor(root, head))
+    scenario('checkout-switch', lambda: quiet_checkout(root) and quiet_checkout('master'))
+    scenario('fsck', pygit.fsck, repeat=1)
+    make_ignored_tree(num_files, fanout)
+    scenario('status-ignored', pygit.get_status)
+    return results
+
+
+NOISE_SECONDS = 0.005
+
+
+def compare_results(results, baseline, threshold):
+    """和之前保存的结果比较，打印每个场景的耗时比例，返回变慢超过threshold倍
+    (并且慢了超过NOISE_SECONDS)的场景名列表。
+    """
+    regressions = []
+    print('{:<28} {:>10} {:>10} {:>8}'.format('scenario', 'baseline', 'current', 'ratio'))
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        flag = '  (instrumented)' if result.get('instrumented') or old.get('instrumented') else ''
+        if ratio > threshold and not flag and \
+                result['seconds'] - old['seconds'] > NOISE_SECONDS:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<28} {:>10.4f} {:>10.4f} {:>7.2f}x{}'.format(
+            name, old['seconds'], result['seconds'], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    sub_parsers = parser.add_subparsers(dest='benchmark', metavar='benchmark')
+    sub_parsers.required = True
+
+    sub_parser = sub_parsers.add_parser('index',
+                                        help='compare index v2 and v4 size and parse time')
+    sub_parser.add_argument('-n', '--num-paths', type=int, default=200000,
+                            help='number of paths in synthetic index (default %(default)r)')
+    sub_parser.add_argument('-d', '--depth', type=int, default=6,
+                            help='directory depth of synthetic paths (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('diff',
+                                        help='diff a synthetic lockfile against a regenerated one')
+    sub_parser.add_argument('-n', '--num-lines', type=int, default=100000,
+                            help='number of lines in synthetic lockfile (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('pktline',
+                                        help='measure pkt-line encode and parse throughput')
+    sub_parser.add_argument('-n', '--num-lines', type=int, default=1000000,
+                            help='number of ref advertisement lines (default %(default)r)')
+    sub_parser.add_argument('-c', '--chunk-size', type=int, default=65536,
+                            help='read size of the incremental parser (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('compression',
+                                        help='compare object write throughput and size at each '
+                                             'compression level')
+    sub_parser.add_argument('-s', '--size', type=int, default=8000000,
+                            help='size of each test file in bytes (default %(default)r)')
+
+    sub_parser = sub_parsers.add_parser('suite',
+                                        help='time plumbing operations on a synthetic repository')
+    sub_parser.add_argument('-n', '--num-files', type=int, default=10000,
+                            help='number of files in synthetic repo (default %(default)r)')
+    sub_parser.add_argument('-s', '--file-size', type=int, default=2000,
+                            help='approximate size of each file in bytes (default %(default)r)')
+    sub_parser.add_argument('-d', '--depth', type=int, default=4,
+                            help='directory depth of synthetic paths (default %(default)r)')
+    sub_parser.add_argument('-f', '--fanout', type=int, default=10,
+                            help='subdirectories per directory (default %(default)r)')
+    sub_parser.add_argument('--history', type=int, default=50,
+                            help='number of commits in synthetic history (default %(default)r)')
+    sub_parser.add_argument('--modify-fraction', type=float, default=0.01,
+                            help='fraction of files modified for status/diff (default %(default)r)')
+    sub_parser.add_argument('-k', '--only', action='append',
+                            help='only time scenarios whose name contains this string '
+                                 '(may be repeated; other scenarios still run untimed)')
+    sub_parser.add_argument('--json', metavar='PATH',
+                            help='save results as JSON for later comparison')
+    sub_parser.add_argument('--compare', metavar='PATH',
+                            help='compare with results previously saved with --json')
+    sub_parser.add_argument('--threshold', type=float, default=1.25,
+                            help='slowdown ratio reported as regression (default %(default)r)')
+    sub_parser.add_argument('--profile', metavar='DIR',
+                            help='save a cProfile capture of each scenario to DIR/<name>.prof')
+    sub_parser.add_argument('--tracemalloc', action='store_true',
+                            help='record peak Python memory allocation of each scenario')
+
+    args = parser.parse_args()
+    if args.benchmark == 'suite':
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        profile_dir = os.path.abspath(args.profile) if args.profile else None
+        params = {k: getattr(args, k) for k in ['num_files', 'file_size', 'depth', 'fanout',
+                                                'history', 'modify_fraction']}
+        with temp_repo():
+            results = bench_suite(only=args.only, profile_dir=profile_dir,
+                                  trace_memory=args.tracemalloc, **params)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'params': params, 'python': platform.python_version(),
+                           'platform': platform.platform(), 'results': results},
+                          f, indent=2)
+        if baseline is not None:
+            if baseline.get('params') != params:
+                print('warning: baseline was run with different parameters {}'.format(
+                    baseline.get('params')))
+            if compare_results(results, baseline, args.threshold):
+                sys.exit(1)
+        sys.exit(0)
+    with temp_repo():
+        if args.benchmark == 'index':
+            bench_index(args.num_paths, args.depth)
+        elif args.benchmark == 'diff':
+            bench_diff(args.num_lines)
+        elif args.benchmark == 'pktline':
+            bench_pktline(args.num_lines, args.chunk_size)
+        elif args.benchmark == 'compression':
+            bench_compression(args.size)
+        else:
+            assert False, 'unexpected benchmark {!r}'.format(args.benchmark)
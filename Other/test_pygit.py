@@ -0,0 +1,1323 @@
+# -*- coding:utf-8 -*-
+import contextlib
+import hashlib
+import http.server
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+import zlib
+
+import pygit
+
+
+class PygitTestCase(unittest.TestCase):
+    """在临时目录中创建一个空仓库，测试结束后删除。"""
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        pygit.init('repo')
+        os.chdir('repo')
+
+    def tearDown(self):
+        pygit.close_packs()
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.tmp_dir)
+
+
+class packtest(PygitTestCase):
+
+    def test_repack_and_read(self):
+        blobs = {pygit.hash_object(b'blob %d' % i, 'blob'): b'blob %d' % i
+                 for i in range(100)}
+        pack_sha1 = pygit.repack()
+        self.assertIsNotNone(pack_sha1)
+        self.assertEqual(pygit.find_loose_objects(), set())
+        for sha1, data in blobs.items():
+            self.assertEqual(pygit.read_object(sha1), ('blob', data))
+            self.assertEqual(pygit.read_object(sha1[:10]), ('blob', data))
+
+    def test_repack_merges_packs(self):
+        first = pygit.hash_object(b'first', 'blob')
+        pygit.repack()
+        second = pygit.hash_object(b'second', 'blob')
+        pygit.repack()
+        self.assertEqual(len(pygit.get_packs()), 1)
+        self.assertEqual(pygit.read_object(first), ('blob', b'first'))
+        self.assertEqual(pygit.read_object(second), ('blob', b'second'))
+
+    def test_missing_object(self):
+        pygit.hash_object(b'data', 'blob')
+        pygit.repack()
+        with self.assertRaises(ValueError):
+            pygit.read_object('0' * 40)
+
+
+class deltatest(PygitTestCase):
+
+    def test_create_and_apply_delta(self):
+        base = b''.join(b'line %d\n' % i for i in range(2000))
+        target = base[:5000] + b'inserted\n' + base[5000:9000] + base[9500:]
+        delta = pygit.create_delta(base, target)
+        self.assertLess(len(delta), 100)
+        self.assertEqual(pygit.apply_delta(base, delta), target)
+
+    def test_delta_too_large(self):
+        self.assertIsNone(pygit.create_delta(b'a' * 1000, b'b' * 1000,
+                                             max_size=100))
+
+    def test_pack_with_deltas(self):
+        base = b''.join(b'line %d\n' % i for i in range(5000))
+        blobs = [base, base + b'one more line\n', base.replace(b'line 7\n', b'')]
+        shas = [pygit.hash_object(data, 'blob') for data in blobs]
+        for ofs_delta in (True, False):
+            full, _ = pygit.build_pack(set(shas), deltas=False)
+            packed, _ = pygit.build_pack(set(shas), ofs_delta=ofs_delta)
+            self.assertLess(len(packed), len(full) // 2)
+        pygit.repack()
+        for sha1, data in zip(shas, blobs):
+            self.assertEqual(pygit.read_object(sha1), ('blob', data))
+
+
+class statustest(PygitTestCase):
+
+    def write(self, path, data):
+        pygit.write_file(path, data)
+
+    def test_status(self):
+        self.write('a.txt', b'aaa')
+        self.write('b.txt', b'bbb')
+        pygit.add(['a.txt', 'b.txt'])
+        self.write('a.txt', b'AAAA')
+        os.remove('b.txt')
+        self.write('c.txt', b'ccc')
+        self.assertEqual(pygit.get_status(), (['a.txt'], ['c.txt'], ['b.txt']))
+
+    def test_unchanged_files_are_not_hashed(self):
+        self.write('a.txt', b'aaa')
+        pygit.add(['a.txt'])
+        future = time.time() + 10
+        os.utime(os.path.join('.git', 'index'), (future, future))
+        hashed = []
+        original = pygit.hash_object
+
+        def counting_hash_object(*args, **kwargs):
+            hashed.append(args)
+            return original(*args, **kwargs)
+
+        pygit.hash_object = counting_hash_object
+        try:
+            self.assertEqual(pygit.get_status(), ([], [], []))
+        finally:
+            pygit.hash_object = original
+        self.assertEqual(hashed, [])
+
+    def test_same_size_rewrite_is_detected(self):
+        self.write('a.txt', b'aaa')
+        pygit.add(['a.txt'])
+        st = os.stat('a.txt')
+        self.write('a.txt', b'bbb')
+        os.utime('a.txt', ns=(st.st_atime_ns, st.st_mtime_ns))
+        index_path = os.path.join('.git', 'index')
+        os.utime(index_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(pygit.get_status(), (['a.txt'], [], []))
+
+
+class paralleltest(PygitTestCase):
+
+    def test_parallel_add_matches_serial(self):
+        paths = ['f{}.txt'.format(i) for i in range(50)]
+        for i, path in enumerate(paths):
+            pygit.write_file(path, b'content %d\n' % (i % 7) * 1000)
+        pygit.add(paths)
+        serial = pygit.read_file(os.path.join('.git', 'index'))
+        os.remove(os.path.join('.git', 'index'))
+        pygit.add(list(reversed(paths)), jobs=4)
+        entries = pygit.read_index()
+        self.assertEqual([e.path for e in entries], sorted(paths))
+        self.assertEqual(pygit.read_file(os.path.join('.git', 'index')), serial)
+        pygit.write_file('f3.txt', b'changed')
+        self.assertEqual(pygit.get_status(jobs=4), (['f3.txt'], [], []))
+
+
+class streamtest(PygitTestCase):
+
+    def test_hash_object_file_matches_hash_object(self):
+        data = os.urandom(300000) + b'x' * 300000
+        pygit.write_file('big.bin', data)
+        sha1 = pygit.hash_object_file('big.bin', chunk_size=4096)
+        self.assertEqual(sha1, pygit.hash_object(data, 'blob', write=False))
+        self.assertEqual(pygit.read_object(sha1), ('blob', data))
+        self.assertEqual(pygit.hash_object_file('big.bin'), sha1)
+        objects_dir = os.path.join('.git', 'objects')
+        self.assertEqual([n for n in os.listdir(objects_dir)
+                          if n.startswith('tmp_obj_')], [])
+
+    def test_stream_object(self):
+        data = b''.join(b'line %d\n' % i for i in range(100000))
+        sha1 = pygit.hash_object(data, 'blob')
+        for _ in range(2):
+            obj_type, size, chunks = pygit.stream_object(sha1, chunk_size=1000)
+            self.assertEqual((obj_type, size), ('blob', len(data)))
+            chunks = list(chunks)
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(b''.join(chunks), data)
+            pygit.repack()
+
+
+class cachetest(PygitTestCase):
+
+    def test_object_cache(self):
+        pygit.object_cache.clear()
+        sha1 = pygit.hash_object(b'cached', 'blob')
+        self.assertEqual(pygit.read_object(sha1), ('blob', b'cached'))
+        self.assertEqual(pygit.read_object(sha1), ('blob', b'cached'))
+        self.assertEqual(pygit.read_object(sha1[:8]), ('blob', b'cached'))
+        self.assertEqual(pygit.object_cache.hits, 2)
+        self.assertEqual(pygit.object_cache.misses, 1)
+
+    def test_object_cache_budget(self):
+        cache = pygit.ObjectCache(1000)
+        for i in range(10):
+            cache.put(i, ('blob', b'x' * 200))
+        self.assertLessEqual(cache.total_bytes, 1000)
+        self.assertIsNone(cache.get(0))
+        self.assertIsNotNone(cache.get(9))
+        cache.put('big', ('blob', b'x' * 500))
+        self.assertIsNone(cache.get('big'))
+        cache.resize(400)
+        self.assertEqual(len(cache.entries), 2)
+
+
+def make_commit(tree, parents, commit_time, message='message'):
+    """直接写入一个提交对象(不修改引用)，返回它的sha - 1。"""
+    lines = ['tree ' + tree]
+    lines.extend('parent ' + p for p in parents)
+    lines.append('author A <a@example.com> {} +0000'.format(commit_time))
+    lines.append('committer A <a@example.com> {} +0000'.format(commit_time))
+    lines.append('')
+    lines.append(message)
+    return pygit.hash_object('\n'.join(lines).encode(), 'commit')
+
+
+def make_tree(files):
+    """写入只包含给定文件(名字 -> 数据)的树对象，返回它的sha - 1。"""
+    entries = []
+    for name in sorted(files):
+        sha1 = pygit.hash_object(files[name], 'blob')
+        entries.append(b'100644 ' + name.encode() + b'\x00' + bytes.fromhex(sha1))
+    return pygit.hash_object(b''.join(entries), 'tree')
+
+
+class graphtest(PygitTestCase):
+
+    def test_long_history(self):
+        tree = make_tree({'a.txt': b'a'})
+        commits = []
+        parents = []
+        for i in range(1500):
+            commits.append(make_commit(tree, parents, 1000000 + i))
+            parents = [commits[-1]]
+        objects = pygit.find_commit_objects(commits[-1])
+        self.assertEqual(len(objects), 1500 + 2)
+        missing = pygit.find_missing_objects(commits[-1], commits[-2])
+        self.assertEqual(missing, {commits[-1]})
+
+    def test_diamond_history(self):
+        base = make_commit(make_tree({'a': b'1'}), [], 1000)
+        left = make_commit(make_tree({'a': b'1', 'b': b'2'}), [base], 1001)
+        right = make_commit(make_tree({'a': b'1', 'c': b'3'}), [base], 1002)
+        merge_tree = make_tree({'a': b'1', 'b': b'2', 'c': b'3'})
+        merge = make_commit(merge_tree, [left, right], 1003)
+        missing = pygit.find_missing_objects(merge, left)
+        expected = {merge, right, merge_tree,
+                    make_tree({'a': b'1', 'c': b'3'}),
+                    pygit.hash_object(b'3', 'blob', write=False)}
+        self.assertEqual(missing, expected)
+        self.assertEqual(pygit.find_missing_objects(merge, merge), set())
+        self.assertEqual(pygit.find_missing_objects(merge, None),
+                         pygit.find_commit_objects(merge))
+
+
+class commitgraphtest(PygitTestCase):
+
+    def test_commit_graph(self):
+        tree = make_tree({'a': b'1'})
+        root = make_commit(tree, [], 1000)
+        branches = [make_commit(tree, [root], 1001 + i, str(i)) for i in range(3)]
+        octopus = make_commit(tree, branches, 1010)
+        head = make_commit(tree, [octopus], 1011)
+        other = make_commit(tree, [root], 1012, 'other')
+        pygit.write_file(os.path.join('.git', 'refs', 'heads', 'master'),
+                         (head + '\n').encode())
+        self.assertEqual(pygit.write_commit_graph(), 6)
+        graph = pygit.get_commit_graph()
+        self.assertEqual(graph.num_commits, 6)
+        node = graph.get(octopus)
+        self.assertEqual(node.parents, tuple(branches))
+        self.assertEqual(node.commit_time, 1010)
+        self.assertEqual(node.generation, 3)
+        self.assertEqual(graph.get(root).generation, 1)
+        self.assertIsNone(graph.get(other))
+        self.assertTrue(pygit.is_ancestor(root, head))
+        self.assertTrue(pygit.is_ancestor(branches[1], head))
+        self.assertFalse(pygit.is_ancestor(head, root))
+        self.assertFalse(pygit.is_ancestor(other, head))
+        self.assertTrue(pygit.is_ancestor(root, other))
+        self.assertEqual(list(pygit.iter_history(head)),
+                         [head, octopus] + branches[::-1] + [root])
+
+
+class writetreetest(PygitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.paths = ['a/b/c/1', 'a/b/2', 'a/3', 'd/4', 'top', 'a.x/5', 'a-b']
+        for path in self.paths:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            pygit.write_file(path, path.encode())
+        pygit.add(self.paths)
+
+    def test_nested_tree(self):
+        sha1 = pygit.write_tree()
+        root = {path: (mode, child) for mode, path, child in pygit.read_tree(sha1)}
+        self.assertEqual(sorted(root), ['a', 'a-b', 'a.x', 'd', 'top'])
+        self.assertEqual(root['a'][0], 0o40000)
+        a_tree = {path for _, path, _ in pygit.read_tree(root['a'][1])}
+        self.assertEqual(a_tree, {'3', 'b'})
+        objects = pygit.find_tree_objects(sha1)
+        self.assertEqual(len(objects), 7 + 6)
+
+    def test_cache_tree_reuses_unchanged_directories(self):
+        first = pygit.write_tree()
+        cache_tree = pygit.parse_cache_tree(pygit.read_index_file()[1][b'TREE'])
+        self.assertEqual(cache_tree[''], (7, first))
+        self.assertEqual(cache_tree['a/b'][0], 2)
+        pygit.write_file('a/b/2', b'changed')
+        pygit.add(['a/b/2'])
+        cache_tree = pygit.parse_cache_tree(pygit.read_index_file()[1][b'TREE'])
+        self.assertEqual(cache_tree['a/b'], (-1, None))
+        self.assertEqual(cache_tree['a/b/c'][0], 1)
+        trees = []
+        original = pygit.hash_object
+
+        def recording_hash_object(data, obj_type, write=True):
+            if obj_type == 'tree':
+                trees.append(data)
+            return original(data, obj_type, write=write)
+
+        pygit.hash_object = recording_hash_object
+        try:
+            second = pygit.write_tree()
+        finally:
+            pygit.hash_object = original
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(trees), 3)
+        self.assertEqual(pygit.write_tree(), second)
+
+
+class indextest(PygitTestCase):
+
+    def test_index_file(self):
+        long_path = 'd/' + 'x' * 5000
+        paths = ['b.txt', 'a.txt', 'c/d.txt', long_path]
+        os.makedirs('c')
+        for path in paths[:3]:
+            pygit.write_file(path, path.encode())
+        pygit.add(paths[:3])
+        with pygit.IndexFile() as index:
+            self.assertEqual(len(index), 3)
+            self.assertEqual([index.path_at(i) for i in range(3)],
+                             ['a.txt', 'b.txt', 'c/d.txt'])
+            self.assertEqual(index.find('b.txt'), 1)
+            self.assertIsNone(index.find('bb.txt'))
+            self.assertEqual(index.bisect('bb.txt'), 2)
+            self.assertEqual(index[2].sha1.hex(),
+                             pygit.hash_object(b'c/d.txt', 'blob', write=False))
+        entry = pygit.IndexEntry(*(pygit.stat_fields(os.stat('a.txt')) +
+                                   (b'\x01' * 20, 0xfff, long_path)))
+        with pygit.IndexFile() as index:
+            pygit.update_index(index, [entry], index.extensions())
+        entries = pygit.read_index()
+        self.assertEqual([e.path for e in entries], sorted(paths))
+        with pygit.IndexFile() as index:
+            self.assertEqual(index.find(long_path), 3)
+
+    def test_update_index_replaces_entries(self):
+        for path in ['a', 'b', 'c']:
+            pygit.write_file(path, b'1')
+        pygit.add(['a', 'b', 'c'])
+        pygit.write_file('b', b'2')
+        pygit.add(['b'])
+        entries = pygit.read_index()
+        self.assertEqual([e.path for e in entries], ['a', 'b', 'c'])
+        self.assertEqual(entries[1].sha1.hex(),
+                         pygit.hash_object(b'2', 'blob', write=False))
+
+
+class journaltest(PygitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pygit.write_file(os.path.join('.git', 'config'),
+                         b'[core]\n\tsplitIndex = true\n')
+        self.paths = ['f{:03}'.format(i) for i in range(100)]
+        for path in self.paths:
+            pygit.write_file(path, path.encode())
+        pygit.add(self.paths)
+        self.index_path = os.path.join('.git', 'index')
+        self.journal_path = os.path.join('.git', 'index.journal')
+
+    def test_add_appends_to_journal(self):
+        base = pygit.read_file(self.index_path)
+        pygit.write_file('f050', b'changed')
+        pygit.write_file('g', b'new')
+        pygit.add(['f050', 'g'])
+        self.assertEqual(pygit.read_file(self.index_path), base)
+        self.assertTrue(os.path.exists(self.journal_path))
+        entries = {e.path: e for e in pygit.read_index()}
+        self.assertEqual(len(entries), 101)
+        self.assertEqual(entries['f050'].sha1.hex(),
+                         pygit.hash_object(b'changed', 'blob', write=False))
+        self.assertEqual(pygit.get_status(), ([], [], []))
+        sha1 = pygit.write_tree()
+        self.assertNotEqual(pygit.read_file(self.index_path), base)
+        self.assertEqual(len(pygit.read_index()), 101)
+        self.assertIn('g', {path for _, path, _ in pygit.read_tree(sha1)})
+
+    def test_journal_is_consolidated(self):
+        base = pygit.read_file(self.index_path)
+        for path in self.paths[:30]:
+            pygit.write_file(path, b'changed')
+        pygit.add(self.paths[:30])
+        with pygit.IndexFile() as index:
+            self.assertEqual(index.journal_size, 0)
+        self.assertNotEqual(pygit.read_file(self.index_path), base)
+        self.assertEqual(len(pygit.read_index()), 100)
+
+    def test_truncated_journal_record_is_ignored(self):
+        pygit.write_file('g', b'new')
+        pygit.add(['g'])
+        with open(self.journal_path, 'ab') as f:
+            f.write(b'\x00\x00\x01\x00partial')
+        pygit.write_file('h', b'new')
+        pygit.add(['h'])
+        paths = [e.path for e in pygit.read_index()]
+        self.assertIn('g', paths)
+        self.assertIn('h', paths)
+
+    def test_concurrent_adds(self):
+        names = ['t{}'.format(i) for i in range(8)]
+        for name in names:
+            pygit.write_file(name, name.encode())
+        threads = [threading.Thread(target=pygit.add, args=([name],))
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        paths = {e.path for e in pygit.read_index()}
+        self.assertTrue(set(names) <= paths)
+        self.assertFalse(os.path.exists(os.path.join('.git', 'index.lock')))
+
+
+class indexv4test(PygitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pygit.write_file(os.path.join('.git', 'config'),
+                         b'[index]\n\tversion = 4\n')
+        self.paths = ['a/b/c/file{}'.format(i) for i in range(20)] + ['a/x', 'z']
+        for path in self.paths:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            pygit.write_file(path, path.encode())
+        pygit.add(self.paths)
+
+    def test_round_trip(self):
+        data = pygit.read_file(os.path.join('.git', 'index'))
+        self.assertEqual(data[4:8], b'\x00\x00\x00\x04')
+        self.assertEqual([e.path for e in pygit.read_index()], sorted(self.paths))
+        with pygit.IndexFile() as index:
+            self.assertEqual(index.version, 4)
+            self.assertEqual(index.path_at(index.find('a/x')), 'a/x')
+        self.assertEqual(pygit.get_status(), ([], [], []))
+
+    def test_update_keeps_version(self):
+        pygit.write_file('a/b/c/file5', b'changed')
+        pygit.write_file('m', b'new')
+        pygit.add(['a/b/c/file5', 'm'])
+        entries = {e.path: e for e in pygit.read_index()}
+        self.assertEqual(len(entries), len(self.paths) + 1)
+        self.assertEqual(entries['a/b/c/file5'].sha1.hex(),
+                         pygit.hash_object(b'changed', 'blob', write=False))
+        with pygit.IndexFile() as index:
+            self.assertEqual(index.version, 4)
+        self.assertEqual(pygit.get_status(), ([], [], []))
+
+
+class difftest(PygitTestCase):
+
+    def test_diff_sequences(self):
+        a = list('abcabba')
+        b = list('cbabac')
+        blocks = pygit.diff_sequences(a, b)
+        self.assertEqual(blocks[-1], (len(a), len(b), 0))
+        for i, j, n in blocks:
+            self.assertEqual(a[i:i + n], b[j:j + n])
+        self.assertEqual(sum(n for _, _, n in blocks), 4)
+
+    def test_unified_hunks(self):
+        old = b''.join(b'line %d\n' % i for i in range(20))
+        new = old.replace(b'line 3\n', b'three\n') + b'tail'
+        old_lines = pygit.split_lines(old)
+        new_lines = pygit.split_lines(new)
+        changes = pygit.diff_lines(old_lines, new_lines)
+        self.assertEqual(changes, [(3, 4, 3, 4), (20, 20, 20, 21)])
+        hunks = list(pygit.iter_hunks(old_lines, new_lines, changes, context=1))
+        self.assertEqual(hunks[:4], [b'@@ -3,3 +3,3 @@\n', b' line 2\n',
+                                     b'-line 3\n', b'+three\n'])
+        self.assertEqual(hunks[-2:], [b' line 19\n', b'+tail'])
+
+    def test_binary_and_stat(self):
+        pygit.write_file('text', b'a\nb\n')
+        pygit.write_file('data', b'\x00\x01')
+        pygit.add(['text', 'data'])
+        pygit.write_file('text', b'a\nc\nd\n')
+        pygit.write_file('data', b'\x00\x02\x03')
+        self.assertTrue(pygit.is_binary(b'\x00\x02\x03'))
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            pygit.diff(show_stat=True)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], ' data | Bin 2 -> 3 bytes')
+        self.assertEqual(lines[1], ' text | 3 ++-')
+        self.assertEqual(lines[2], ' 2 files changed, 2 insertions(+), 1 deletions(-)')
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'fsmonitor needs unix sockets')
+class fsmonitortest(PygitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pygit.write_file(os.path.join('.git', 'config'), b'[core]\n\tfsmonitor = true\n')
+        os.makedirs(os.path.join('a', 'b'))
+        for path in ['a/b/x', 'a/y', 'z']:
+            pygit.write_file(path, path.encode())
+        pygit.add(['a/b/x', 'a/y', 'z'])
+
+    def run_monitor(self, poll):
+        pygit.start_fsmonitor(poll=poll)
+        try:
+            self.check_status_changes()
+        finally:
+            self.assertTrue(pygit.stop_fsmonitor())
+
+    def check_status_changes(self):
+        self.assertEqual(pygit.get_status(), ([], [], []))
+        token = pygit.read_fsmonitor_cache()[0]
+        pygit.write_file('z', b'changed')
+        os.makedirs(os.path.join('n', 'm'))
+        pygit.write_file('n/m/new', b'new')
+        self.assertEqual(pygit.get_status(), (['z'], ['n/m/new'], []))
+        self.assertNotEqual(pygit.read_fsmonitor_cache()[0], token)
+        shutil.rmtree('a')
+        self.assertEqual(pygit.get_status(), (['z'], ['n/m/new'], ['a/b/x', 'a/y']))
+        _, dirty = pygit.query_fsmonitor(pygit.read_fsmonitor_cache()[0])
+        self.assertEqual(dirty, [])
+        pygit.add(['z'])
+        self.assertEqual(pygit.get_status(), ([], ['n/m/new'], ['a/b/x', 'a/y']))
+
+    def test_inotify(self):
+        self.run_monitor(poll=False)
+
+    def test_poll(self):
+        self.run_monitor(poll=True)
+
+    def test_without_daemon(self):
+        pygit.write_file('z', b'changed')
+        self.assertEqual(pygit.get_status(), (['z'], [], []))
+        self.assertIsNone(pygit.read_fsmonitor_cache())
+
+
+class UploadPackHandler(http.server.BaseHTTPRequestHandler):
+    """智能HTTP upload-pack的替身服务器，只使用内存中的对象(server.objects)，
+    支持multi_ack_detailed协商、side-band-64k进度和OFS_DELTA。
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def send_data(self, data):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        master = self.server.refs['refs/heads/master']
+        self.send_data(b''.join([
+            pygit.pkt_line(b'# service=git-upload-pack\n'), b'0000',
+            pygit.pkt_line('{} refs/heads/master\x00multi_ack_detailed side-band-64k '
+                           'ofs-delta\n'.format(master).encode()), b'0000']))
+
+    def do_POST(self):
+        body = io.BytesIO(self.rfile.read(int(self.headers['Content-Length'])))
+        wants, haves, done = [], [], False
+        for line in pygit.PktLineReader(body):
+            if isinstance(line, pygit.Pkt):
+                continue
+            words = bytes(line).decode().split()
+            if words[0] == 'want':
+                wants.append(words[1])
+            elif words[0] == 'have':
+                haves.append(words[1])
+            elif words[0] == 'done':
+                done = True
+        self.server.rounds.append((wants, haves, done))
+        common = [h for h in haves if h in self.server.objects]
+        response = [pygit.pkt_line('ACK {} common\n'.format(c).encode()) for c in common]
+        if not done:
+            response.append(pygit.pkt_line(b'NAK\n'))
+            self.send_data(b''.join(response))
+            return
+        response.append(pygit.pkt_line(
+            'ACK {}\n'.format(common[-1]).encode() if common else b'NAK\n'))
+        objects = self.reachable(wants) - self.reachable(common)
+        self.server.sent.append(objects)
+        response.append(pygit.pkt_line(b'\x02Counting objects: ' +
+                                       str(len(objects)).encode() + b', done.\n'))
+        pack = self.build_pack(objects)
+        for i in range(0, len(pack), 1000):
+            response.append(pygit.pkt_line(b'\x01' + pack[i:i + 1000]))
+        response.append(b'0000')
+        self.send_data(b''.join(response))
+
+    def reachable(self, tips):
+        objects = self.server.objects
+        seen = set()
+        stack = list(tips)
+        while stack:
+            sha1 = stack.pop()
+            if sha1 in seen:
+                continue
+            seen.add(sha1)
+            obj_type, data = objects[sha1]
+            if obj_type == 'commit':
+                commit = pygit.parse_commit(data)
+                stack.append(commit.tree)
+                stack.extend(commit.parents)
+            elif obj_type == 'tree':
+                stack.extend(sha for _, _, sha in pygit.read_tree(data=data))
+        return seen
+
+    def build_pack(self, objects):
+        chunks = [struct.pack('!4sLL', b'PACK', 2, len(objects))]
+        offset = len(chunks[0])
+        base = None
+        for sha1 in sorted(objects, key=lambda s: (self.server.objects[s][0], s)):
+            obj_type, data = self.server.objects[sha1]
+            if obj_type == 'blob' and base is not None:
+                delta = pygit.create_delta(base[1], data)
+                encoded = (pygit.encode_pack_header(pygit.ObjectType.ofs_delta.value, len(delta)) +
+                           pygit.encode_ofs_offset(offset - base[0]) + zlib.compress(delta))
+            else:
+                encoded = (pygit.encode_pack_header(pygit.ObjectType[obj_type].value, len(data)) +
+                           zlib.compress(data))
+            if obj_type == 'blob':
+                base = (offset, data)
+            chunks.append(encoded)
+            offset += len(encoded)
+        pack = b''.join(chunks)
+        return pack + hashlib.sha1(pack).digest()
+
+
+class fetchtest(PygitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), UploadPackHandler)
+        self.server.objects = {}
+        self.server.rounds = []
+        self.server.sent = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/repo.git'.format(self.server.server_port)
+        os.mkdir('dir')
+        self.commit_files({'a': b'a\n' * 100, 'dir/b': b'b\n' * 100})
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def commit_files(self, files):
+        """在“远程”仓库(当前目录)中提交文件，并更新替身服务器的对象。"""
+        for path, data in files.items():
+            pygit.write_file(path, data)
+        pygit.add(list(files))
+        with contextlib.redirect_stdout(io.StringIO()):
+            sha1 = pygit.commit('commit', author='A <a@example.com>')
+        self.server.refs = {'refs/heads/master': sha1}
+        for obj in pygit.find_commit_objects(sha1):
+            self.server.objects[obj] = pygit.read_object(obj)
+        return sha1
+
+    def clone(self):
+        progress = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sha1 = pygit.clone(self.url, os.path.join('..', 'clone'), progress=progress)
+        return sha1, progress.getvalue()
+
+    def test_clone(self):
+        sha1, progress = self.clone()
+        self.assertEqual(sha1, self.server.refs['refs/heads/master'])
+        self.assertIn('Counting objects: 5, done.', progress)
+        self.assertEqual(self.server.rounds, [([sha1], [], True)])
+        os.chdir(os.path.join('..', 'clone'))
+        self.assertEqual(pygit.read_file('dir/b'), b'b\n' * 100)
+        self.assertEqual(pygit.get_local_master_hash(), sha1)
+        self.assertEqual(pygit.get_status(), ([], [], []))
+        self.assertEqual(len(pygit.get_packs()), 1)
+
+    def test_incremental_fetch(self):
+        old_sha1, _ = self.clone()
+        new_sha1 = self.commit_files({'a': b'a\n' * 100 + b'more\n'})
+        os.chdir(os.path.join('..', 'clone'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(pygit.fetch(self.url), new_sha1)
+        self.assertEqual(self.server.rounds[-1], ([new_sha1], [old_sha1], True))
+        self.assertEqual(len(self.server.sent[-1]), 3)
+        self.assertEqual(pygit.read_file(os.path.join('.git', 'refs', 'remotes', 'origin',
+                                                      'master')).decode().strip(), new_sha1)
+        self.assertEqual(pygit.read_commit(new_sha1).parents, (old_sha1,))
+        self.assertEqual(pygit.read_object(pygit.read_tree(pygit.read_commit(new_sha1).tree)[0][2]),
+                         ('blob', b'a\n' * 100 + b'more\n'))
+
+    def test_negotiation_skips_unknown_haves(self):
+        old_sha1, _ = self.clone()
+        new_sha1 = self.commit_files({'a': b'new'})
+        os.chdir(os.path.join('..', 'clone'))
+        tree = make_tree({'local': b'local'})
+        parent = old_sha1
+        for i in range(40):
+            parent = make_commit(tree, [parent], 2000000000 + i)
+        pygit.write_file(os.path.join('.git', 'refs', 'heads', 'master'), parent.encode())
+        with contextlib.redirect_stdout(io.StringIO()):
+            pygit.fetch(self.url)
+        # 克隆1轮，fetch: 32个have，剩下的9个(包括共同的提交)，最后发送done
+        self.assertEqual([len(r[1]) for r in self.server.rounds], [0, 32, 9, 1])
+        self.assertEqual(self.server.rounds[-1][2], True)
+        self.assertIn(old_sha1, self.server.rounds[-1][1])
+        self.assertEqual(len(self.server.sent[-1]), 3)
+        self.assertEqual(pygit.read_commit(new_sha1).parents, (old_sha1,))
+
+    def test_corrupt_pack_is_removed(self):
+        with self.assertRaises(ValueError):
+            pygit.index_pack_stream([b'PACK\x00\x00\x00\x02\x00\x00\x00\x01\x30'])
+        self.assertEqual(os.listdir(os.path.join('.git', 'objects', 'pack')), [])
+
+
+class pktlinetest(unittest.TestCase):
+
+    def parse(self, data, chunk_size):
+        reader = pygit.PktLineReader(io.BytesIO(data), chunk_size=chunk_size)
+        return [p if isinstance(p, pygit.Pkt) else bytes(p) for p in reader]
+
+    def test_chunk_boundaries(self):
+        lines = [b'line %d\n' % i for i in range(3000)] + [b'x' * pygit.MAX_PKT_DATA]
+        data = (pygit.build_lines_data(lines[:10]) + pygit.DELIM_PKT +
+                pygit.build_lines_data(lines[10:]))
+        expected = lines[:10] + [pygit.Pkt.flush, pygit.Pkt.delim] + lines[10:] + \
+            [pygit.Pkt.flush]
+        for chunk_size in (1, 3, 7, 4096, len(data)):
+            self.assertEqual(self.parse(data, chunk_size), expected)
+
+    def test_build_lines_data(self):
+        self.assertEqual(pygit.build_lines_data([b'a\n', b'b']), b'0006a\n0005b0000')
+        self.assertEqual(pygit.build_lines_data([], flush=False), b'')
+        with self.assertRaises(ValueError):
+            pygit.pkt_line(b'x' * (pygit.MAX_PKT_DATA + 1))
+
+    def test_remaining_data(self):
+        reader = pygit.PktLineReader(io.BytesIO(pygit.build_lines_data([b'a']) + b'PACK...'),
+                                     chunk_size=5)
+        self.assertEqual(reader.read_lines(), [b'a'])
+        self.assertEqual(b''.join(reader.iter_remaining()), b'PACK...')
+
+    def test_invalid_stream(self):
+        for data in (b'0009abc', b'00', b'zzzzabcd', b'0003'):
+            with self.assertRaises(ValueError):
+                self.parse(data, 2)
+        with self.assertRaises(ValueError):
+            pygit.PktLineReader(io.BytesIO(b'0005a')).read_lines()
+
+
+class refstest(PygitTestCase):
+
+    def commit_file(self, data):
+        pygit.write_file('a', data)
+        pygit.add(['a'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.commit('commit', author='A <a@example.com>')
+
+    def test_branches_and_tags(self):
+        first = self.commit_file(b'first\n')
+        pygit.branch('topic')
+        pygit.write_symbolic_ref('HEAD', 'refs/heads/topic')
+        second = self.commit_file(b'second\n')
+        self.assertEqual(pygit.read_ref('refs/heads/master'), first)
+        self.assertEqual(pygit.read_ref('HEAD'), second)
+        tag = pygit.tag('v1', 'master', message='release', author='A <a@example.com>')
+        self.assertEqual(pygit.peel(tag), ('commit', first))
+        self.assertEqual(pygit.resolve_revision('v1'), tag)
+        self.assertEqual(pygit.resolve_revision('topic'), second)
+        self.assertEqual(pygit.find_ref_commits(), {first, second})
+        with self.assertRaises(ValueError):
+            pygit.branch('topic')
+        with self.assertRaises(ValueError):
+            pygit.branch('bad..name')
+        with self.assertRaises(ValueError):
+            pygit.branch('topic', delete=True)
+        with self.assertRaises(ValueError):
+            pygit.update_ref('refs/heads/master', second, old_sha1=second)
+
+    def test_pack_refs(self):
+        sha1 = self.commit_file(b'first\n')
+        for i in range(2000):
+            pygit.tag('v{}'.format(i))
+        pygit.tag('annotated', message='m', author='A <a@example.com>')
+        refs = pygit.list_refs()
+        self.assertEqual(pygit.pack_refs(), 2002)
+        self.assertEqual(os.listdir(os.path.join('.git', 'refs', 'tags')), [])
+        self.assertEqual(pygit.list_refs(), refs)
+        table = pygit.read_packed_refs()
+        self.assertEqual(len(table), 2002)
+        self.assertEqual(table.peeled, {'refs/tags/annotated': sha1})
+        self.assertEqual(len(list(table.items('refs/tags/v199'))), 11)
+        self.assertEqual(table.get('refs/tags/v199'), sha1)
+        # 松散引用优先于packed-refs，删除引用同时删除两者
+        second = self.commit_file(b'second\n')
+        pygit.update_ref('refs/tags/v5', second)
+        self.assertEqual(pygit.read_ref('refs/tags/v5'), second)
+        self.assertIn(('refs/tags/v5', second), pygit.list_refs('refs/tags/'))
+        pygit.delete_ref('refs/tags/v5')
+        self.assertIsNone(pygit.read_ref('refs/tags/v5'))
+        self.assertEqual(len(pygit.list_refs('refs/tags/')), 2000)
+        self.assertEqual(pygit.read_ref('refs/heads/master'), second)
+
+
+class batchtest(PygitTestCase):
+
+    def test_cat_file_batch(self):
+        blob = pygit.hash_object(b'blob\n', 'blob')
+        big = b'line %d\n' * 20000 % tuple(range(20000))
+        big_sha1 = pygit.hash_object(big, 'blob')
+        pygit.write_file('a', big[:-1])
+        pygit.add(['a'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            commit = pygit.commit('commit', author='A <a@example.com>')
+        pygit.repack()
+        delta = pygit.hash_object(big[:-1], 'blob', write=False)
+        names = [blob[:7], 'master', 'nope', delta, big_sha1]
+        out = io.BytesIO()
+        pygit.cat_file_batch(io.BytesIO(''.join(n + '\n' for n in names).encode()), out,
+                             contents=False)
+        self.assertEqual(out.getvalue().decode().splitlines(), [
+            '{} blob 5'.format(blob), '{} commit {}'.format(
+                commit, len(pygit.read_object(commit)[1])),
+            'nope missing', '{} blob {}'.format(delta, len(big) - 1),
+            '{} blob {}'.format(big_sha1, len(big))])
+        out = io.BytesIO()
+        with unittest.mock.patch.object(pygit, 'BATCH_CACHE_SIZE', 1000):
+            pygit.cat_file_batch(io.BytesIO(b'%s\n%s\n' % (blob.encode(), big_sha1.encode())),
+                                 out)
+        self.assertEqual(out.getvalue(), b'%s blob 5\nblob\n\n%s blob %d\n%s\n' % (
+            blob.encode(), big_sha1.encode(), len(big), big))
+
+    def test_hash_object_batch(self):
+        pygit.write_file('a', b'a\n')
+        pygit.write_file('b', b'b\n')
+        out = io.BytesIO()
+        pygit.hash_object_batch(io.BytesIO(b'a\nb\n'), out, write=False)
+        self.assertEqual(out.getvalue().decode().split(),
+                         [pygit.hash_object(b'a\n', 'blob', write=False),
+                          pygit.hash_object(b'b\n', 'blob', write=False)])
+        with self.assertRaises(ValueError):
+            pygit.read_object(out.getvalue().decode().split()[0])
+
+
+class checkouttest(PygitTestCase):
+
+    def commit_files(self, files, message='commit'):
+        for path, data in files.items():
+            if data is None:
+                os.remove(path)
+                pygit.remove_empty_dirs([path])
+                continue
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            pygit.write_file(path, data)
+        with pygit.IndexFile() as index:
+            entries = [e for e in index if os.path.exists(e.path)]
+        pygit.write_index(entries)
+        pygit.add([p for p, data in files.items() if data is not None])
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.commit(message, author='A <a@example.com>')
+
+    def tree_files(self, commit):
+        changes = pygit.diff_trees(None, pygit.read_commit(commit).tree)
+        return {path: new for path, (_, new) in changes.items()}
+
+    def index_files(self):
+        return {e.path: (e.mode, e.sha1.hex()) for e in pygit.read_index()}
+
+    def checkout(self, revision, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.checkout(revision, **kwargs)
+
+    def test_read_tree_large(self):
+        files = {'dir/file {:04}'.format(i): b'%d\n' % i for i in range(1500)}
+        tree = pygit.read_commit(self.commit_files(files)).tree
+        entries = pygit.read_tree(pygit.read_tree(tree)[0][2])
+        self.assertEqual(len(entries), 1500)
+        self.assertEqual(entries[-1][1], 'file 1499')
+
+    def test_checkout_switches_only_changed_files(self):
+        files = {'a/{}'.format(i): b'%d\n' % i for i in range(50)}
+        files.update({'b/c/d': b'd\n', 'run': b'#!/bin/sh\n'})
+        first = self.commit_files(files)
+        os.chmod('run', 0o755)
+        pygit.add(['run'])
+        pygit.branch('release')
+        second = self.commit_files({'a/1': b'changed\n', 'b/c/d': None, 'b/c': b'file\n',
+                                    'new/file': b'new\n'})
+        self.assertEqual(sorted(pygit.diff_trees(pygit.read_commit(first).tree,
+                                                 pygit.read_commit(second).tree)),
+                         ['a/1', 'b/c', 'b/c/d', 'new/file', 'run'])
+        inode = os.stat('a/2').st_ino
+        self.checkout('release', jobs=4)
+        self.assertEqual(pygit.read_symbolic_ref('HEAD'), 'refs/heads/release')
+        self.assertEqual(pygit.read_file('a/1'), b'1\n')
+        self.assertEqual(pygit.read_file('b/c/d'), b'd\n')
+        self.assertFalse(os.path.exists('new'))
+        self.assertFalse(os.stat('run').st_mode & 0o111)
+        self.assertEqual(os.stat('a/2').st_ino, inode)
+        self.assertEqual(pygit.get_status(), ([], [], []))
+        self.assertEqual(self.index_files(), self.tree_files(first))
+        self.checkout(second)
+        self.assertIsNone(pygit.read_symbolic_ref('HEAD'))
+        self.assertEqual(pygit.get_head_hash(), second)
+        self.assertEqual(pygit.read_file('b/c'), b'file\n')
+        self.assertTrue(os.stat('run').st_mode & 0o100)
+        self.assertEqual(pygit.get_status(), ([], [], []))
+        self.assertEqual(self.index_files(), self.tree_files(second))
+
+    def test_local_changes_are_kept_safe(self):
+        self.commit_files({'a': b'a\n', 'b': b'b\n'})
+        pygit.branch('old')
+        self.commit_files({'a': b'new a\n'})
+        pygit.write_file('a', b'local\n')
+        with self.assertRaisesRegex(ValueError, 'would be overwritten:\n\ta'):
+            self.checkout('old')
+        self.assertEqual(pygit.read_file('a'), b'local\n')
+        # 没有变化的文件中的本地修改被保留
+        pygit.write_file('a', b'new a\n')
+        pygit.write_file('b', b'local b\n')
+        self.checkout('old')
+        self.assertEqual(pygit.read_file('a'), b'a\n')
+        self.assertEqual(pygit.get_status(), (['b'], [], []))
+        self.checkout('master', force=True)
+        self.assertEqual(pygit.read_file('a'), b'new a\n')
+
+    def test_read_tree_without_update(self):
+        first = self.commit_files({'a': b'a\n'})
+        self.commit_files({'a': b'b\n', 'c': b'c\n'})
+        pygit.switch_tree(pygit.get_head_tree(), pygit.read_commit(first).tree, update=False)
+        self.assertEqual([e.path for e in pygit.read_index()], ['a'])
+        self.assertEqual(pygit.read_file('a'), b'b\n')
+        self.assertEqual(pygit.get_status(), (['a'], ['c'], []))
+
+
+class ignoretest(PygitTestCase):
+
+    def write(self, path, data=b'x'):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        pygit.write_file(path, data)
+
+    def test_patterns(self):
+        self.write('.gitignore', b'# build outputs\n*.o\n!keep.o\nbuild/\n/top.txt\n'
+                                 b'docs/**/*.html\nlogs/**\ncls[0-9].c\n\\#hash\n')
+        self.write('sub/.gitignore', b'local.txt\n!top.o\n')
+        self.write(os.path.join('.git', 'info', 'exclude'), b'secret\n')
+        self.write('build', b'a file, not a directory')
+        matcher = pygit.IgnoreMatcher()
+        expected = {
+            'a.o': True, 'dir/a.o': True, 'keep.o': False, 'dir/keep.o': False,
+            'build': False, 'x/build/y': True, 'top.txt': True, 'sub/top.txt': False,
+            'docs/a.html': True, 'docs/a/b/c.html': True, 'other/docs/a.html': False,
+            'logs/a/b': True, 'logs': False, 'cls1.c': True, 'clsx.c': False,
+            '#hash': True, 'sub/local.txt': True, 'local.txt': False, 'sub/top.o': False,
+            'sub/deeper/top.o': False, 'secret': True, 'a/secret': True,
+        }
+        for path, ignored in expected.items():
+            self.assertEqual(matcher.is_ignored(path, False), ignored, path)
+        self.assertTrue(matcher.is_ignored('build', True))
+
+    def test_status_prunes_ignored_directories(self):
+        self.write('.gitignore', b'node_modules/\n*.pyc\n')
+        self.write('main.py')
+        self.write('main.pyc')
+        for i in range(10):
+            self.write('node_modules/pkg{}/index.js'.format(i))
+        pygit.add(['.'])
+        self.assertEqual([e.path for e in pygit.read_index()], ['.gitignore', 'main.py'])
+        self.write('new.py')
+        self.assertEqual(pygit.get_status(), ([], ['new.py'], []))
+        matcher = pygit.IgnoreMatcher()
+        paths = list(pygit.walk_working_copy(matcher=matcher))
+        self.assertEqual(sorted(paths), ['.gitignore', 'main.py', 'new.py'])
+        self.assertNotIn('node_modules', matcher.dir_rules)
+
+    def test_tracked_files_in_ignored_directories(self):
+        self.write('vendor/lib.py', b'v1')
+        pygit.add(['vendor/lib.py'])
+        self.write('.gitignore', b'vendor/\n')
+        self.write('vendor/lib.py', b'v2')
+        self.write('vendor/other.py')
+        self.assertEqual(pygit.get_status(), (['vendor/lib.py'], ['.gitignore'], []))
+        pygit.add(['.'])
+        self.assertEqual([e.path for e in pygit.read_index()], ['.gitignore', 'vendor/lib.py'])
+        self.assertEqual(pygit.get_status(), ([], [], []))
+
+    def test_add_ignored_paths(self):
+        self.write('.gitignore', b'*.log\nout/\n')
+        self.write('debug.log')
+        self.write('out/result')
+        for paths in (['debug.log'], ['out'], ['out/result']):
+            with self.assertRaises(ValueError):
+                pygit.add(paths)
+        self.assertEqual(pygit.read_index(), [])
+        pygit.add(['debug.log', 'out'], force=True)
+        self.assertEqual([e.path for e in pygit.read_index()], ['debug.log', 'out/result'])
+
+    def test_fsmonitor_sees_gitignore_changes(self):
+        pygit.write_file(os.path.join('.git', 'config'), b'[core]\n\tfsmonitor = true\n')
+        self.write('a.tmp')
+        pygit.start_fsmonitor(poll=True)
+        try:
+            self.assertEqual(pygit.get_status(), ([], ['a.tmp'], []))
+            self.write('.gitignore', b'*.tmp\n')
+            self.assertEqual(pygit.get_status(), ([], ['.gitignore'], []))
+            self.write(os.path.join('.git', 'info', 'exclude'), b'.gitignore\n')
+            self.assertEqual(pygit.get_status(), ([], [], []))
+        finally:
+            self.assertTrue(pygit.stop_fsmonitor())
+
+
+class bitmaptest(PygitTestCase):
+
+    def commit(self, i):
+        path = 'd{}/f{}'.format(i % 3, i % 5)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pygit.write_file(path, b'version %d\n' % i)
+        pygit.write_file('top', b'%d\n' % i)
+        pygit.add([path, 'top'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.commit('commit {}'.format(i), author='A <a@example.com>')
+
+    def assert_same_as_walk(self, local, remote):
+        found = pygit.find_missing_objects(local, remote)
+        with unittest.mock.patch.object(pygit, 'get_bitmap_index', return_value=None):
+            self.assertEqual(found, pygit.find_missing_objects(local, remote))
+        return found
+
+    def test_ewah_roundtrip(self):
+        full = (1 << 64) - 1
+        for bits in [0, 1, 1 << 200, (1 << 640) - 1, full << 640 | 0x5a5a,
+                     int.from_bytes(os.urandom(300), 'little') | (full << 3000)]:
+            data = pygit.ewah_encode(bits)
+            self.assertEqual(pygit.ewah_decode(data + b'tail', 0), (bits, len(data)))
+            self.assertEqual(pygit.ewah_skip(data, 0), len(data))
+        # 一段全1的字只需要一个RLW字
+        self.assertEqual(len(pygit.ewah_encode((1 << 6400) - 1)), 8 + 8 + 4)
+
+    def test_bitmaps_match_graph_walk(self):
+        commits = [self.commit(i) for i in range(30)]
+        pygit.update_ref('refs/heads/side', commits[20])
+        self.assertIsNotNone(pygit.repack(write_bitmaps=True))
+        bitmap = pygit.get_bitmap_index()
+        self.assertIsNotNone(bitmap)
+        self.assertIn(commits[-1], bitmap.entries)
+        self.assertIn(commits[20], bitmap.entries)
+        for local, remote in [(commits[-1], None), (commits[-1], commits[20]),
+                              (commits[20], commits[-1]), (commits[-1], commits[3]),
+                              ([commits[-1], commits[20]], [commits[10]])]:
+            self.assert_same_as_walk(local, remote)
+        new = [self.commit(i) for i in range(30, 33)]
+        found = self.assert_same_as_walk(new[-1], commits[-1])
+        self.assertEqual(len(found), 3 * 5)
+        self.assertTrue(set(new) <= found)
+
+    def test_repack_replaces_bitmap(self):
+        self.commit(0)
+        pygit.repack(write_bitmaps=True)
+        old_bitmap = pygit.get_packs()[0].bitmap_path
+        head = self.commit(1)
+        pygit.write_file(os.path.join('.git', 'config'), b'[repack]\n\twriteBitmaps = true\n')
+        pygit.repack()
+        self.assertFalse(os.path.exists(old_bitmap))
+        self.assertIn(head, pygit.get_bitmap_index().entries)
+
+
+class fscktest(PygitTestCase):
+
+    def commit(self, files):
+        for path, data in files.items():
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            pygit.write_file(path, data)
+        pygit.add(list(files))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.commit('commit', author='A <a@example.com>')
+
+    def object_path(self, sha1):
+        return os.path.join('.git', 'objects', sha1[:2], sha1[2:])
+
+    def test_clean_repository(self):
+        first = self.commit({'a': b'a\n', 'd/b': b'b\n'})
+        second = self.commit({'a': b'changed\n'})
+        result = pygit.fsck(jobs=2)
+        self.assertEqual((result.objects, result.errors, result.dangling), (8, [], []))
+        pygit.update_ref('refs/heads/master', first)
+        self.assertEqual(pygit.fsck(jobs=1).dangling, [second])
+        pygit.update_ref('refs/heads/master', second)
+        pygit.repack()
+        result = pygit.fsck(jobs=2)
+        self.assertEqual((result.objects, result.errors), (8, []))
+        self.assertGreater(result.bytes, 0)
+        result = pygit.verify_pack(pygit.get_packs()[0].idx_path, jobs=2)
+        self.assertEqual((result.objects, result.errors), (8, []))
+
+    def test_corrupt_loose_objects(self):
+        self.commit({'a': b'a\n', 'b': b'b\n'})
+        blob_a = pygit.hash_object(b'a\n', 'blob', write=False)
+        blob_b = pygit.hash_object(b'b\n', 'blob', write=False)
+        os.chmod(self.object_path(blob_a), 0o644)
+        pygit.write_file(self.object_path(blob_a), zlib.compress(b'blob 2\x00x\n'))
+        os.remove(self.object_path(blob_b))
+        errors = pygit.fsck(jobs=2).errors
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(errors[0].startswith(blob_a + ': sha1 mismatch'))
+        self.assertRegex(errors[1], r'^broken link from tree \w{40} to blob ' + blob_a)
+        self.assertRegex(errors[2], r'^broken link from tree \w{40} to blob ' + blob_b)
+
+    def test_corrupt_pack(self):
+        self.commit({'a': b'a' * 1000})
+        pygit.repack()
+        pack = pygit.get_packs()[0]
+        idx_path, pack_path = pack.idx_path, pack.pack_path
+        offset = pack.offset_at(pack.index_of(pygit.hash_object(b'a' * 1000, 'blob',
+                                                                write=False)))
+        pygit.close_packs()
+        os.chmod(pack_path, 0o644)
+        with open(pack_path, 'r+b') as f:
+            f.seek(offset + 4)
+            byte = f.read(1)
+            f.seek(offset + 4)
+            f.write(bytes([byte[0] ^ 0xff]))
+        errors = pygit.verify_pack(idx_path, jobs=2).errors
+        self.assertEqual(len(errors), 2)
+        self.assertIn('pack checksum mismatch', errors[0])
+        self.assertIn('crc32 mismatch', errors[1])
+
+
+class compressiontest(PygitTestCase):
+
+    def set_config(self, data):
+        pygit.write_file(os.path.join('.git', 'config'), data)
+
+    def loose_size(self, sha1):
+        return os.path.getsize(os.path.join('.git', 'objects', sha1[:2], sha1[2:]))
+
+    def test_levels_from_config(self):
+        self.assertEqual(pygit.get_compression_level(), zlib.Z_DEFAULT_COMPRESSION)
+        self.set_config(b'[core]\n\tcompression = 1\n')
+        self.assertEqual(pygit.get_compression_level('loose'), 1)
+        self.assertEqual(pygit.get_compression_level('pack'), 1)
+        self.set_config(b'[core]\n\tcompression = 1\n\tlooseCompression = 0\n'
+                        b'[pack]\n\tcompression = 9\n')
+        self.assertEqual(pygit.get_compression_level('loose'), 0)
+        self.assertEqual(pygit.get_compression_level('pack'), 9)
+        self.set_config(b'[core]\n\tcompression = 12\n')
+        with self.assertRaises(ValueError):
+            pygit.get_compression_level()
+
+    def test_compressed_data_is_stored(self):
+        text = b''.join(b'line %d\n' % i for i in range(5000))
+        compressed = zlib.compress(text)
+        pygit.write_file('a.txt', text)
+        pygit.write_file('b.gz', b'\x1f\x8b' + compressed)
+        pygit.write_file('c.png', compressed)
+        sha1s = pygit.hash_files(['a.txt', 'b.gz', 'c.png'])
+        self.assertLess(self.loose_size(sha1s[0]), len(text) // 2)
+        for sha1, size in zip(sha1s[1:], [len(compressed) + 2, len(compressed)]):
+            self.assertGreater(self.loose_size(sha1), size)
+        self.assertEqual(pygit.read_object(sha1s[1]), ('blob', b'\x1f\x8b' + compressed))
+        self.set_config(b'[core]\n\tstoreCompressed = false\n')
+        self.assertEqual(pygit.object_compression_level(b'\x1f\x8b', 'b.gz'),
+                         zlib.Z_DEFAULT_COMPRESSION)
+
+    def test_pack_compression_level(self):
+        data = b''.join(b'row %d\n' % i for i in range(5000))
+        sha1 = pygit.hash_object(data, 'blob')
+        sizes = {}
+        for level in (0, 9):
+            self.set_config('[pack]\n\tcompression = {}\n'.format(level).encode())
+            pack = pygit.create_pack([sha1])
+            sizes[level] = len(pack)
+            index_entries = []
+            b''.join(pygit.iter_pack([sha1], index_entries=index_entries))
+            self.assertEqual(len(index_entries), 1)
+        self.assertGreater(sizes[0], len(data))
+        self.assertLess(sizes[9], len(data) // 2)
+
+
+class ReceivePackHandler(http.server.BaseHTTPRequestHandler):
+    """智能HTTP receive-pack的替身服务器(HTTP/1.1，支持keep-alive)，
+    记录每个请求的客户端地址、收到的命令和包文件。
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_data(self, data):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.clients.append(self.client_address)
+        refs = ['{} {}'.format(sha1, name) for name, sha1 in sorted(self.server.refs.items())]
+        refs = refs or ['{} capabilities^{{}}'.format('0' * 40)]
+        refs[0] += '\x00report-status delete-refs ofs-delta'
+        self.send_data(pygit.pkt_line(b'# service=git-receive-pack\n') + b'0000' +
+                       pygit.build_lines_data([(r + '\n').encode() for r in refs]))
+
+    def do_POST(self):
+        self.server.clients.append(self.client_address)
+        self.server.chunked.append(self.headers['Transfer-Encoding'] == 'chunked')
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+        reader = pygit.PktLineReader(io.BytesIO(b''.join(chunks)))
+        commands = [line.split(b'\x00')[0].decode().split() for line in reader.read_lines()]
+        pack = b''.join(reader.iter_remaining())
+        self.server.pushes.append((commands, pack))
+        report = [b'unpack ok\n']
+        for old, new, name in commands:
+            if self.server.refs.get(name, '0' * 40) != old:
+                report.append('ng {} stale info\n'.format(name).encode())
+                continue
+            if name in self.server.protected:
+                report.append('ng {} protected branch\n'.format(name).encode())
+                continue
+            if new == '0' * 40:
+                del self.server.refs[name]
+            else:
+                self.server.refs[name] = new
+            report.append('ok {}\n'.format(name).encode())
+        self.send_data(pygit.build_lines_data(report))
+
+
+class pushtest(PygitTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ReceivePackHandler)
+        self.server.refs = {}
+        self.server.protected = set()
+        self.server.clients = []
+        self.server.chunked = []
+        self.server.pushes = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/repo.git'.format(self.server.server_port)
+
+    def tearDown(self):
+        pygit.get_connection(self.url).close()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def commit_file(self, data):
+        pygit.write_file('a', data)
+        pygit.add(['a'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.commit('commit', author='A <a@example.com>')
+
+    def push(self, refspecs=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pygit.push(self.url, refspecs, username='user', password='secret')
+
+    def test_iter_pack_matches_build_pack(self):
+        objects = {pygit.hash_object(b'line %d\n' % i * 50, 'blob') for i in range(20)}
+        entries = []
+        chunks = list(pygit.iter_pack(objects, index_entries=entries))
+        data, build_entries = pygit.build_pack(objects)
+        self.assertEqual(b''.join(chunks), data)
+        self.assertEqual(entries, build_entries)
+        self.assertEqual(len(chunks), len(objects) + 2)
+
+    def test_streaming_push(self):
+        first = self.commit_file(b'first\n' * 1000)
+        _, missing = self.push()
+        self.assertEqual(len(missing), 3)
+        second = self.commit_file(b'first\n' * 1000 + b'second\n')
+        updates, missing = self.push()
+        self.assertEqual(updates, [pygit.RefUpdate('refs/heads/master', first, second)])
+        self.assertEqual(len(missing), 3)
+        self.assertEqual(self.server.chunked, [True, True])
+        commands, pack = self.server.pushes[-1]
+        self.assertEqual(commands, [[first, second, 'refs/heads/master']])
+        self.assertEqual(pack[:12], struct.pack('!4sLL', b'PACK', 2, 3))
+        self.assertEqual(hashlib.sha1(pack[:-20]).digest(), pack[-20:])
+        # 获取远程信息和推送复用了同一个keep-alive连接
+        self.assertEqual(len(set(self.server.clients)), 1)
+
+    def test_push_multiple_refs(self):
+        first = self.commit_file(b'first\n')
+        self.push()
+        with contextlib.redirect_stdout(io.StringIO()):
+            pygit.branch('topic')
+            pygit.tag('v1', message='release 1', author='A <a@example.com>')
+        second = self.commit_file(b'second\n')
+        tag = pygit.read_ref('refs/tags/v1')
+        updates, missing = self.push(['master', 'topic', 'v1', 'master:refs/heads/copy'])
+        self.assertEqual(len(self.server.pushes), 2)
+        self.assertEqual(self.server.refs, {'refs/heads/master': second, 'refs/heads/topic': first,
+                                            'refs/tags/v1': tag, 'refs/heads/copy': second})
+        # 新提交的提交、树和blob，加上标签对象
+        self.assertEqual(missing, {second, pygit.read_commit(second).tree,
+                                   pygit.hash_object(b'second\n', 'blob', write=False), tag})
+        updates, missing = self.push([':refs/heads/copy'])
+        self.assertEqual(updates, [pygit.RefUpdate('refs/heads/copy', second, None)])
+        self.assertEqual(missing, set())
+        self.assertNotIn('refs/heads/copy', self.server.refs)
+        self.server.protected.add('refs/heads/topic')
+        with self.assertRaisesRegex(ValueError, 'refs/heads/topic \\(protected branch\\)'):
+            self.push(['{}:refs/heads/topic'.format(second)])
+
+
+if __name__ == '__main__':
+    unittest.main()